@@ -0,0 +1 @@
+"""Shared building blocks for the AI Health & Fitness Coach pages."""
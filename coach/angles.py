@@ -0,0 +1,39 @@
+"""Batched joint-angle kernel shared by every exercise check."""
+import numpy as np
+
+
+def joint_table(*triples):
+    """Build an (N, 3) index table of (a, b, c) joint triples; b is the vertex"""
+    return np.array([[int(a), int(b), int(c)] for a, b, c in triples], dtype=np.intp).reshape(-1, 3)
+
+
+def joint_angles(points, table, method="arctan2"):
+    """Angles in degrees at the middle joint of each triple, in one vectorised pass
+
+    ``points`` is any (K, >=2) landmark array (only x, y are used) and
+    ``table`` an (N, 3) index table from ``joint_table``. ``method`` picks the
+    convention: "arctan2" (difference of bearings, folded into 0-180) or
+    "arccos" (angle between the two limb vectors). Degenerate triples with a
+    zero-length limb give 0 under "arccos". That is a change: the old
+    per-call helper divided by zero there and returned NaN.
+    """
+    if len(table) == 0:
+        return np.empty(0, dtype=np.float64)
+    xy = np.asarray(points, dtype=np.float64)[:, :2]
+    a, b, c = xy[table[:, 0]], xy[table[:, 1]], xy[table[:, 2]]
+    ba = a - b
+    bc = c - b
+
+    if method == "arctan2":
+        radians = np.arctan2(bc[:, 1], bc[:, 0]) - np.arctan2(ba[:, 1], ba[:, 0])
+        angles = np.abs(np.degrees(radians))
+        return np.where(angles > 180.0, 360.0 - angles, angles)
+
+    if method == "arccos":
+        norms = np.hypot(ba[:, 0], ba[:, 1]) * np.hypot(bc[:, 0], bc[:, 1])
+        dots = ba[:, 0] * bc[:, 0] + ba[:, 1] * bc[:, 1]
+        valid = norms > 0
+        cosine = np.clip(np.divide(dots, norms, out=np.zeros_like(dots), where=valid), -1.0, 1.0)
+        return np.where(valid, np.degrees(np.arccos(cosine)), 0.0)
+
+    raise ValueError(f"Unknown angle method: {method}")
@@ -0,0 +1,217 @@
+"""Coaching audio sent to the member's browser on the session's WebRTC connection.
+
+The server has no one listening at its sound card, so each session gets a
+VoiceMixer. The speech worker (coach.speech) hands it pre-rendered clips for
+that session only. The session's audio track then pulls 20 ms frames from it:
+
+* CoachAudioProcessor, for webrtc_streamer's ``audio_processor_factory``,
+  answers every microphone frame with a coaching-audio frame. The member's
+  own audio is never sent back.
+* VoiceTrack is a plain aiortc track that paces itself, for
+  ``source_audio_track`` or any RTCPeerConnection.
+
+Neither ever waits on the speech worker; the mixer only takes a short lock.
+A phrase waits behind at most MAX_QUEUED_CLIPS others. A safety alert waits
+for none, because it cuts off coaching that is playing or queued. To check
+delivery end to end over a local aiortc peer connection:
+
+    python -m coach.audio_out --loopback
+"""
+import argparse
+import asyncio
+import fractions
+import sys
+import threading
+import time
+from collections import deque
+from types import SimpleNamespace
+
+import av
+import numpy as np
+from streamlit_webrtc import AudioProcessorBase
+
+from coach.speech import ALERT, STALE_AFTER
+
+SAMPLE_RATE = 48000  # WebRTC's Opus rate
+FRAME_SECONDS = 0.02
+MAX_QUEUED_CLIPS = 3  # clips waiting behind the one playing; the oldest coaching clip goes first
+
+
+def resample(samples, rate, target):
+    """Linear resampling of an int16 clip"""
+    if rate == target:
+        return samples
+    count = int(round(len(samples) * target / rate))
+    positions = np.linspace(0, len(samples) - 1, count)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.int16)
+
+
+class VoiceMixer:
+    """One session's outgoing speech: clips in, fixed-size PCM frames out"""
+
+    def __init__(self, max_queued=MAX_QUEUED_CLIPS):
+        self.max_queued = max_queued
+        # Clips wait at their own rate; read() resamples them to whatever rate the track asks for
+        self._queue = deque()  # [priority, samples, rate, enqueued at]
+        self._current = None  # [priority, samples at the read rate, position, that rate]
+        self._lock = threading.Lock()
+        self.stats = {"clips": 0, "dropped": 0, "cut": 0, "frames": 0, "voiced_frames": 0}
+
+    def play(self, clip, priority):
+        """Queue a clip (any rate); called from the speech worker"""
+        with self._lock:
+            if priority == ALERT:
+                coaching = [item for item in self._queue if item[0] > ALERT]
+                self._queue = deque(item for item in self._queue if item[0] == ALERT)
+                self.stats["dropped"] += len(coaching)
+                if self._current is not None and self._current[0] > ALERT:
+                    self._current = None
+                    self.stats["cut"] += 1
+            self._queue.append([priority, clip.samples, clip.rate, time.monotonic()])
+            if len(self._queue) > self.max_queued:
+                victim = max(self._queue, key=lambda item: item[0])
+                self._queue.remove(victim)
+                self.stats["dropped"] += 1
+            self.stats["clips"] += 1
+
+    def _next_clip(self, now, sample_rate):
+        while self._queue:
+            priority, samples, rate, enqueued = self._queue.popleft()
+            if now - enqueued <= STALE_AFTER[priority]:
+                return [priority, resample(samples, rate, sample_rate), 0, sample_rate]
+            self.stats["dropped"] += 1
+        return None
+
+    def read(self, count, sample_rate=SAMPLE_RATE):
+        """The next ``count`` mono int16 samples; silence when there is nothing to say"""
+        out = np.zeros(count, dtype=np.int16)
+        filled = 0
+        with self._lock:
+            current = self._current
+            if current is not None and current[3] != sample_rate:
+                # The track changed rate mid-clip: carry on from the same point at the new rate
+                current[1:] = [resample(current[1][current[2]:], current[3], sample_rate), 0, sample_rate]
+            while filled < count:
+                if self._current is None:
+                    self._current = self._next_clip(time.monotonic(), sample_rate)
+                    if self._current is None:
+                        break
+                _, samples, position, _ = self._current
+                take = min(count - filled, len(samples) - position)
+                out[filled:filled + take] = samples[position:position + take]
+                filled += take
+                self._current[2] += take
+                if self._current[2] >= len(samples):
+                    self._current = None
+            self.stats["frames"] += 1
+            if filled:
+                self.stats["voiced_frames"] += 1
+        return out
+
+
+def audio_frame(pcm, channels, sample_rate, pts):
+    """Wrap mono PCM as a packed s16 frame with ``channels`` identical channels"""
+    layout = "mono" if channels == 1 else "stereo"
+    data = np.repeat(pcm, channels)[None, :] if channels > 1 else pcm[None, :]
+    frame = av.AudioFrame.from_ndarray(np.ascontiguousarray(data), format="s16", layout=layout)
+    frame.sample_rate = sample_rate
+    frame.pts = pts
+    frame.time_base = fractions.Fraction(1, sample_rate)
+    return frame
+
+
+class CoachAudioProcessor(AudioProcessorBase):
+    """Answers each microphone frame with the same length of coaching audio"""
+
+    def __init__(self):
+        self.mixer = VoiceMixer()
+
+    def recv(self, frame):
+        pcm = self.mixer.read(frame.samples, frame.sample_rate)
+        return audio_frame(pcm, min(len(frame.layout.channels), 2), frame.sample_rate, frame.pts)
+
+
+def voice_track(mixer):
+    """An aiortc audio track that plays ``mixer`` in real time"""
+    from aiortc import MediaStreamTrack
+
+    class VoiceTrack(MediaStreamTrack):
+        kind = "audio"
+
+        def __init__(self):
+            super().__init__()
+            self.mixer = mixer
+            self._samples = int(SAMPLE_RATE * FRAME_SECONDS)
+            self._pts = 0
+            self._start = None
+
+        async def recv(self):
+            if self._start is None:
+                self._start = time.monotonic()
+            # Pace frames against the wall clock so latency stays at one frame
+            wait = self._start + self._pts / SAMPLE_RATE - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            frame = audio_frame(self.mixer.read(self._samples), 1, SAMPLE_RATE, self._pts)
+            self._pts += self._samples
+            return frame
+
+    return VoiceTrack()
+
+
+async def _loopback(seconds):
+    """Send one clip through a local peer connection; returns (clip sent at, first voiced frame at)"""
+    from aiortc import RTCPeerConnection
+
+    from coach.voice_clips import SILENCE
+
+    mixer = VoiceMixer()
+    sender, receiver = RTCPeerConnection(), RTCPeerConnection()
+    sender.addTrack(voice_track(mixer))
+    heard = asyncio.get_running_loop().create_future()
+
+    @receiver.on("track")
+    def on_track(track):
+        async def listen():
+            while not heard.done():
+                frame = await track.recv()
+                if np.abs(frame.to_ndarray()).max() > SILENCE:
+                    heard.set_result(time.monotonic())
+        asyncio.ensure_future(listen())
+
+    await sender.setLocalDescription(await sender.createOffer())
+    await receiver.setRemoteDescription(sender.localDescription)
+    await receiver.setLocalDescription(await receiver.createAnswer())
+    await sender.setRemoteDescription(receiver.localDescription)
+
+    await asyncio.sleep(0.5)  # let the connection settle on silence
+    tone = (np.sin(np.arange(SAMPLE_RATE // 2) * 2 * np.pi * 440 / SAMPLE_RATE) * 8000).astype(np.int16)
+    sent = time.monotonic()
+    mixer.play(SimpleNamespace(samples=tone, rate=SAMPLE_RATE), ALERT)
+    try:
+        received = await asyncio.wait_for(heard, seconds)
+    finally:
+        await sender.close()
+        await receiver.close()
+    return sent, received
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m coach.audio_out", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--loopback", action="store_true", help="send a tone over a local aiortc connection")
+    parser.add_argument("--timeout", type=float, default=5.0)
+    args = parser.parse_args(argv)
+    if not args.loopback:
+        parser.print_help()
+        return 0
+    try:
+        sent, received = asyncio.run(_loopback(args.timeout))
+    except asyncio.TimeoutError:
+        print(f"No audio received within {args.timeout:g}s")
+        return 1
+    print(f"Audio received {(received - sent) * 1000:.0f} ms after it was queued")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
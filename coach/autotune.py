@@ -0,0 +1,122 @@
+"""Per-session model complexity and inference rate tuning.
+
+On a busy host, inference that takes longer than the camera's frame interval
+makes frames queue up, and the video falls further and further behind. An
+AutoTuner tracks how much inference time each displayed frame costs, averaged
+over a rolling window of frames. It trades quality for speed to hold a
+latency budget: first a lighter model (2 -> 1 -> 0), then fewer inferences
+per second. With plenty of headroom it climbs back up the same ladder, but
+never above the model the page configured.
+"""
+from collections import deque
+
+# ------------------- Tuner Settings -------------------
+FRAME_BUDGET_MS = 50.0  # inference time allowed per displayed frame
+WINDOW_FRAMES = 30  # frames averaged for each decision
+HEADROOM = 0.5  # step up only while the window used less than this share of the budget
+CALM_WINDOWS = 5  # consecutive windows with headroom before stepping up
+MAX_FPS = 30.0  # inference rate cap when not degraded (the camera rate)
+MIN_FPS = 5.0  # lowest inference rate; frames in between are predicted
+
+MODEL_NAMES = {0: "lite", 1: "full", 2: "heavy"}
+
+
+class AutoTuner:
+    """Steps model complexity and target inference fps to hold ``budget_ms`` per frame"""
+
+    def __init__(self, max_complexity, budget_ms=FRAME_BUDGET_MS, window=WINDOW_FRAMES,
+                 max_fps=MAX_FPS, min_fps=MIN_FPS):
+        self.max_complexity = max_complexity
+        self.budget_ms = budget_ms
+        self.max_fps = max_fps
+        self.min_fps = min_fps
+        self.complexity = max_complexity
+        self.target_fps = max_fps
+        self.latency_ms = 0.0
+        self.changes = 0
+        self.throttled = 0
+        self.last_change = None
+        self._costs = deque(maxlen=window)
+        self._last_inference = None
+        self._calm = 0
+
+    @property
+    def degraded(self):
+        return self.complexity < self.max_complexity or self.target_fps < self.max_fps
+
+    def due(self, timestamp):
+        """Whether the target rate allows running the model at ``timestamp``"""
+        if self.target_fps >= self.max_fps or self._last_inference is None:
+            return True
+        # A little slack so camera jitter doesn't skip a whole extra frame
+        if timestamp - self._last_inference >= 0.9 / self.target_fps:
+            return True
+        self.throttled += 1
+        return False
+
+    def record(self, latency_ms, timestamp=None):
+        """Account one frame's inference time (0 if it was predicted) and retune
+
+        ``timestamp`` is the frame time when the model ran on it.
+        """
+        if timestamp is not None:
+            self._last_inference = timestamp
+        self._costs.append(latency_ms)
+        if len(self._costs) < self._costs.maxlen:
+            return
+        self.latency_ms = sum(self._costs) / len(self._costs)
+        if self.latency_ms > self.budget_ms:
+            self._calm = 0
+            self._step_down()
+        elif self.latency_ms < self.budget_ms * HEADROOM:
+            self._calm += 1
+            if self._calm >= CALM_WINDOWS:
+                self._calm = 0
+                self._step_up()
+        else:
+            self._calm = 0
+        # Judge the next setting on its own frames only
+        self._costs.clear()
+
+    def _step_down(self):
+        if self.complexity > 0:
+            self.complexity -= 1
+            self.last_change = f"model -> {MODEL_NAMES[self.complexity]}"
+        elif self.target_fps > self.min_fps:
+            self.target_fps = max(self.min_fps, self.target_fps / 2)
+            self.last_change = f"fps -> {self.target_fps:g}"
+        else:
+            return
+        self.changes += 1
+
+    def _step_up(self):
+        if self.target_fps < self.max_fps:
+            self.target_fps = min(self.max_fps, self.target_fps * 2)
+            self.last_change = f"fps -> {self.target_fps:g}"
+        elif self.complexity < self.max_complexity:
+            self.complexity += 1
+            self.last_change = f"model -> {MODEL_NAMES[self.complexity]}"
+        else:
+            return
+        self.changes += 1
+
+    def stats(self):
+        return {
+            "model": MODEL_NAMES[self.complexity],
+            "target_fps": self.target_fps,
+            "frame_latency_ms": round(self.latency_ms, 1),
+            "budget_ms": self.budget_ms,
+            "degraded": self.degraded,
+            "tuning_changes": self.changes,
+            "last_change": self.last_change,
+            "throttled": self.throttled
+        }
+
+
+def tuning_summary(stats):
+    """One line for a page: the session's current model, rate and latency"""
+    if "model" not in stats:
+        return "Pose model: waiting for the stream"
+    status = "degraded to hold latency" if stats["degraded"] else "full quality"
+    return (f"Pose model: {stats['model']} · up to {stats['target_fps']:g} fps · "
+            f"{stats['frame_latency_ms']:g} ms/frame of {stats['budget_ms']:g} ms budget ({status})")
@@ -0,0 +1,219 @@
+"""Offline re-scoring of recorded workout videos.
+
+Runs the same pose session and exercise rules as the camera pages over a
+directory of videos, spread across a process pool with one estimator per
+worker:
+
+    python -m coach.batch recordings/ --catalog gym --exercise Squat --out scores.csv
+
+Without ``--exercise`` each video is scored as the exercise named by its
+parent folder (recordings/Squat/member42.mp4). Writes one summary row per
+video (reps, mean accuracy, frames/sec on its worker core) to ``--out`` and
+the per-frame stage/reps/accuracy timeline next to it; a ``.parquet`` path
+writes Parquet instead of CSV.
+
+``--compare 1`` also scores every video with the given heavier model and
+writes its rep counts and speed beside the ``--model-complexity`` run's
+(the lite model unless given), in a ``_compare`` file next to ``--out``. The exit status is non-zero if any
+video's reps differ by more than the tolerance: REP_TOLERANCE reps or
+REP_TOLERANCE_RATIO of the heavy count, whichever is larger.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+import pandas as pd
+
+from coach.pose_engine import PoseSession, pose_key, pose_pool
+from coach.rules import RuleSession, load_catalog
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".avi", ".mkv", ".webm")
+DEFAULT_FPS = 30.0  # used when a file doesn't report its frame rate
+REP_TOLERANCE = 1  # reps the lite model may miss or add per video...
+REP_TOLERANCE_RATIO = 0.05  # ...or this share of the heavy model's count, if larger
+
+_worker_config = {}
+
+
+def find_videos(root):
+    """Every video file under ``root``, sorted"""
+    if os.path.isfile(root):
+        return [root]
+    videos = []
+    for folder, _, files in os.walk(root):
+        videos.extend(os.path.join(folder, name) for name in files
+                      if name.lower().endswith(VIDEO_EXTENSIONS))
+    return sorted(videos)
+
+
+def _init_worker(config):
+    # One estimator per worker process, built before the first video arrives
+    _worker_config.update(config)
+    pose_pool.prewarm(pose_key(**config), count=1)
+
+
+def analyse_video(path, catalog, exercise, keyframes=False):
+    """Score one video; returns (summary dict, timeline rows)"""
+    summary = {"video": path, "catalog": catalog, "exercise": exercise, "frames": 0,
+               "pose_frames": 0, "reps": 0, "mean_accuracy": None, "seconds": 0.0,
+               "fps": 0.0, "cpu_seconds": 0.0, "error": None}
+    rules = RuleSession(catalog)
+    if not rules.select(exercise):
+        summary["error"] = f"unknown exercise for {catalog}"
+        return summary, []
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        summary["error"] = "could not open video"
+        return summary, []
+
+    fps = capture.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS
+    session = PoseSession(**_worker_config, keyframes=keyframes, service=False, autotune=False)
+    timeline = []
+    accuracy_total = 0.0
+    frame = None
+    start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        while True:
+            ok, frame = capture.read(frame)
+            if not ok:
+                break
+            index = summary["frames"]
+            summary["frames"] += 1
+            landmarks = session.process(frame, timestamp=index / fps).landmarks
+            if landmarks is None:
+                timeline.append((path, index, index / fps, rules.stage, rules.reps, None))
+                continue
+            result = rules.step(landmarks, timestamp=index / fps)
+            summary["pose_frames"] += 1
+            accuracy_total += result.accuracy
+            timeline.append((path, index, index / fps, result.stage, result.reps, result.accuracy))
+    finally:
+        session.close()
+        capture.release()
+
+    summary["seconds"] = time.perf_counter() - start
+    summary["cpu_seconds"] = time.process_time() - cpu_start
+    summary["fps"] = summary["frames"] / summary["seconds"] if summary["seconds"] else 0.0
+    summary["reps"] = rules.reps
+    if summary["pose_frames"]:
+        summary["mean_accuracy"] = accuracy_total / summary["pose_frames"]
+    return summary, timeline
+
+
+def run_batch(videos, catalog, exercise=None, workers=None, keyframes=False, **pose_config):
+    """Score ``videos`` across a process pool; returns (summary, timeline) DataFrames"""
+    workers = workers or os.cpu_count() or 1
+    config = dict(zip(("model_complexity", "min_detection_confidence", "min_tracking_confidence"),
+                      pose_key(**pose_config)))
+    summaries, timeline = [], []
+    # MediaPipe graphs don't survive fork, so workers are started fresh
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                             initargs=(config,)) as pool:
+        jobs = {pool.submit(analyse_video, path, catalog,
+                            exercise or os.path.basename(os.path.dirname(path)), keyframes): path
+                for path in videos}
+        for job in as_completed(jobs):
+            summary, rows = job.result()
+            summaries.append(summary)
+            timeline.extend(rows)
+            status = summary["error"] or f"{summary['reps']:g} reps, {summary['fps']:.1f} fps"
+            print(f"{jobs[job]}: {status}", flush=True)
+
+    summary_df = pd.DataFrame(summaries).sort_values("video", ignore_index=True)
+    timeline_df = pd.DataFrame(timeline, columns=["video", "frame", "time", "stage", "reps", "accuracy"])
+    return summary_df, timeline_df.sort_values(["video", "frame"], ignore_index=True)
+
+
+def compare_models(lite, heavy):
+    """Per-video reps and speed of two runs side by side, with the rep tolerance applied"""
+    columns = ["video", "exercise", "reps", "fps"]
+    merged = lite[columns].merge(heavy[columns], on=["video", "exercise"], suffixes=("_lite", "_heavy"))
+    merged["rep_diff"] = merged["reps_lite"] - merged["reps_heavy"]
+    tolerance = (merged["reps_heavy"].abs() * REP_TOLERANCE_RATIO).clip(lower=REP_TOLERANCE)
+    merged["within_tolerance"] = merged["rep_diff"].abs() <= tolerance
+    merged["speedup"] = merged["fps_lite"] / merged["fps_heavy"].where(merged["fps_heavy"] > 0)
+    return merged
+
+
+def write_table(df, path):
+    """CSV, or Parquet for a .parquet path (needs pyarrow or fastparquet)"""
+    if path.lower().endswith(".parquet"):
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+
+def output_path(out, name):
+    """``out`` with ``_name`` added before its extension"""
+    stem, ext = os.path.splitext(out)
+    return f"{stem}_{name}{ext or '.csv'}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m coach.batch", description=__doc__.split("\n\n")[0])
+    parser.add_argument("videos", help="video file or directory of recordings")
+    parser.add_argument("--catalog", default="gym", help="rule catalog in coach/exercises.json")
+    parser.add_argument("--exercise", help="exercise for every video (default: parent folder name)")
+    parser.add_argument("--out", default="batch_scores.csv", help="summary CSV/Parquet path")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per core)")
+    parser.add_argument("--keyframes", action="store_true",
+                        help="infer on keyframes only, as the live pages do")
+    parser.add_argument("--model-complexity", type=int,
+                        help="pose model to score with (default: 1, or the lite 0 with --compare)")
+    parser.add_argument("--min-detection-confidence", type=float, default=0.5)
+    parser.add_argument("--min-tracking-confidence", type=float, default=0.5)
+    parser.add_argument("--compare", type=int, metavar="HEAVY_COMPLEXITY",
+                        help="also score with this model complexity and compare rep counts")
+    args = parser.parse_args(argv)
+    if args.model_complexity is None:
+        args.model_complexity = 1 if args.compare is None else 0
+
+    catalogs = load_catalog()
+    if args.catalog not in catalogs:
+        parser.error(f"unknown catalog {args.catalog!r} (have: {', '.join(catalogs)})")
+    if args.exercise and args.exercise not in catalogs[args.catalog]:
+        parser.error(f"unknown exercise {args.exercise!r} in {args.catalog}")
+    videos = find_videos(args.videos)
+    if not videos:
+        parser.error(f"no videos found under {args.videos}")
+
+    pose_config = dict(min_detection_confidence=args.min_detection_confidence,
+                       min_tracking_confidence=args.min_tracking_confidence)
+    start = time.perf_counter()
+    summary, timeline = run_batch(videos, args.catalog, args.exercise, args.workers, args.keyframes,
+                                  model_complexity=args.model_complexity, **pose_config)
+    elapsed = time.perf_counter() - start
+
+    written = [args.out, output_path(args.out, "timeline")]
+    write_table(summary, written[0])
+    write_table(timeline, written[1])
+    frames = int(summary["frames"].sum())
+    workers = min(args.workers or os.cpu_count() or 1, len(videos))
+    print(f"{len(videos)} videos, {frames} frames in {elapsed:.1f}s: "
+          f"{frames / elapsed:.1f} fps total, {frames / elapsed / workers:.1f} fps per worker")
+    failed = summary["error"].notna().any()
+
+    if args.compare is not None:
+        heavy, _ = run_batch(videos, args.catalog, args.exercise, args.workers, args.keyframes,
+                             model_complexity=args.compare, **pose_config)
+        comparison = compare_models(summary, heavy)
+        written.append(output_path(args.out, "compare"))
+        write_table(comparison, written[-1])
+        outside = comparison[~comparison["within_tolerance"]]
+        print(f"{len(comparison) - len(outside)}/{len(comparison)} videos within rep tolerance, "
+              f"median speedup {comparison['speedup'].median():.2f}x")
+        for row in outside.itertuples():
+            print(f"  {row.video}: {row.reps_lite:g} vs {row.reps_heavy:g} reps")
+        failed = failed or not outside.empty or heavy["error"].notna().any()
+
+    print(f"Wrote {', '.join(written)}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
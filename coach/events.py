@@ -0,0 +1,233 @@
+"""Rep events from the video threads, written to SQLite with group commit.
+
+Processors never touch the database. They publish rep and session-end events,
+which only puts a tuple on a queue. One background writer drains the queue
+into ``user_progress``: each batch is a single ``executemany`` in one
+transaction, committed every BATCH_EVENTS events or BATCH_MS milliseconds,
+whichever comes first. Under load one fsync covers many sessions' events.
+
+Each exercise segment of a stream (one user, one exercise) is one
+``user_progress`` row keyed by ``session_id``. It is inserted at the first
+rep and its count is updated in place after that. A batch that fails to
+commit is kept and retried with the next one, every RETRY_MS at the latest.
+``flush()`` reports whether everything published has been committed.
+"""
+import atexit
+import logging
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+from coach.ranking import shared_ranks
+from coach.rules import whole_reps
+from coach.storage import WINDOW_DAYS, day_key, shared_storage
+
+BATCH_EVENTS = 64  # commit once this many events are waiting...
+BATCH_MS = 250  # ...or once the oldest waiting event is this old
+RETRY_MS = 1000  # how soon a failed batch is retried when nothing else arrives
+FLUSH_MS = 5000  # how long flush() waits for a failed batch to commit on retry
+
+_STOP = object()
+
+log = logging.getLogger(__name__)
+
+
+def _latest(events):
+    """One event per segment: its latest count, as an "end" if any event closed it"""
+    latest = {}
+    for event in events:
+        kind, session_id = event[:2]
+        if session_id in latest and latest[session_id][0] == "end":
+            kind = "end"
+        latest[session_id] = (kind,) + event[1:]
+    return list(latest.values())
+
+
+class ProgressWriter:
+    """Single background thread that group-commits published events"""
+
+    def __init__(self, storage=None, batch_events=BATCH_EVENTS, batch_ms=BATCH_MS, ranks=None):
+        self.storage = storage
+        self.ranks = ranks  # a coach.ranking.RankIndex kept in step with what is committed
+        self.batch_events = batch_events
+        self.batch_ms = batch_ms
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._rolled_off = None  # day key of the last window counter roll-off
+        self._failed = []  # events of batches that did not commit, retried with the next
+        self._settled = threading.Condition()  # notified whenever a commit succeeds or fails
+        self.stats = {"events": 0, "batches": 0, "rows": 0, "errors": 0}
+
+    def publish(self, kind, session_id, username, exercise, reps):
+        """Queue a "rep" or "end" event; never blocks the caller on the database"""
+        if self._thread is None:
+            self._start()
+        self._queue.put((kind, session_id, username, exercise, reps, time.time()))
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="progress-writer", daemon=True)
+                self._thread.start()
+
+    def _take_batch(self):
+        """Block for one event, then gather more until the batch is full or due
+
+        With a failed batch waiting, gives up after RETRY_MS and returns [].
+        """
+        try:
+            batch = [self._queue.get(timeout=RETRY_MS / 1000 if self._failed else None)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.batch_ms / 1000
+        while batch[-1] is not _STOP and len(batch) < self.batch_events:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, events):
+        # Only the latest count per segment matters; events arrive in order
+        rows = {}
+        ended = set()
+        for kind, session_id, username, exercise, reps, at in _latest(events):
+            rows[session_id] = (session_id, username or "", exercise or "", reps, int(at), day_key(at))
+            if kind == "end":
+                ended.add(session_id)
+        self.storage.write([
+            ("add_user", {(row[1],) for row in rows.values()}),
+            ("add_exercise", {(row[2],) for row in rows.values()}),
+            ("upsert_progress", rows.values()),
+        ])
+        if self.ranks is not None:
+            for session_id, username, _, reps, _, _ in rows.values():
+                self.ranks.record(session_id, username, reps, ended=session_id in ended)
+        self.stats["batches"] += 1
+        self.stats["rows"] += len(rows)
+
+    def _roll_off(self):
+        # Once a day: drop window counters too old for any leaderboard window
+        today = day_key(time.time())
+        if today != self._rolled_off:
+            self.storage.execute_many("roll_off_windows", [(today - WINDOW_DAYS,)])
+            self._rolled_off = today
+
+    def _run(self):
+        if self.storage is None:
+            self.storage = shared_storage()
+        while True:
+            batch = self._take_batch()
+            events = [event for event in batch if event is not _STOP]
+            self.stats["events"] += len(events)
+            stopping = len(events) < len(batch)
+            events = self._failed + events
+            if events:
+                self._commit(events, stopping)
+            for _ in batch:
+                self._queue.task_done()
+            if stopping:
+                return
+
+    def _commit(self, events, stopping=False):
+        try:
+            self._write(events)
+        except sqlite3.Error as exc:
+            self.stats["errors"] += 1
+            self._settle(_latest(events))
+            if stopping:
+                log.error("Dropping %d unsaved rep segments at shutdown: %s", len(self._failed), exc)
+            else:
+                log.warning("Rep batch of %d segments failed, retrying: %s", len(self._failed), exc)
+            return
+        self._settle([])
+        try:
+            self._roll_off()
+        except sqlite3.Error as exc:
+            self.stats["errors"] += 1
+            log.warning("Window counter roll-off failed, retrying with the next batch: %s", exc)
+
+    def _settle(self, failed):
+        with self._settled:
+            self._failed = failed
+            self._settled.notify_all()
+
+    def flush(self, timeout_ms=FLUSH_MS):
+        """Wait until every published event is committed
+
+        Returns False if a failed batch is still unsaved after ``timeout_ms``.
+        """
+        if self._thread is not None:
+            self._queue.join()  # every event has been through one commit attempt
+        with self._settled:
+            return self._settled.wait_for(lambda: not self._failed, timeout_ms / 1000)
+
+    def close(self):
+        """Commit what is queued and stop the writer"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def shared_writer():
+    """The process-wide ProgressWriter, flushed at exit"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = ProgressWriter(ranks=shared_ranks())
+            atexit.register(_writer.close)
+        return _writer
+
+
+class RepTracker:
+    """A stream's rep count, published per exercise segment
+
+    RuleSession carries reps over when the exercise changes, so each segment
+    counts from where the total stood when it began.
+    """
+
+    def __init__(self, writer=None):
+        self.writer = writer or shared_writer()
+        self.session_id = None
+        self.username = None
+        self.exercise = None
+        self._base = 0
+        self.reps = 0
+
+    def update(self, username, exercise, total_reps):
+        """Record the rule session's running total; publishes when the whole-rep count moves
+
+        Nothing is published until ``username`` is known, so early frames
+        don't open a segment under a placeholder name.
+        """
+        if username is None:
+            return
+        if (username, exercise) != (self.username, self.exercise):
+            self.end()
+            self.session_id = uuid.uuid4().hex
+            self.username, self.exercise = username, exercise
+            self._base = total_reps
+        reps = whole_reps(total_reps - self._base)
+        if reps != self.reps:
+            self.reps = reps
+            self.writer.publish("rep", self.session_id, username, exercise, reps)
+
+    def end(self):
+        """Close the current segment (on exercise change or stream end)"""
+        if self.session_id is not None and self.reps > 0:
+            self.writer.publish("end", self.session_id, self.username, self.exercise, self.reps)
+        self.session_id = None
+        self.username = self.exercise = None
+        self.reps = 0
@@ -0,0 +1,127 @@
+"""Allocation-light frame path for the WebRTC video processors.
+
+Each session decodes incoming frames once into a BGR buffer it keeps across
+frames, draws its overlay in place and hands that same buffer to
+``av.VideoFrame.from_ndarray``. The colour conversion the model needs is done
+on the small letterbox buffer (see coach.letterbox), not on the full frame.
+"""
+import os
+import tracemalloc
+
+import av
+import cv2
+import numpy as np
+
+# Set COACH_TRACE_ALLOC=1 to measure per-frame allocations (slows every frame down)
+TRACE_ALLOCATIONS = os.environ.get("COACH_TRACE_ALLOC") == "1"
+
+
+class AllocationCounter:
+    """Bytes allocated per frame
+
+    Frame buffers allocated inside PyAV are invisible to tracemalloc, so the
+    pipeline reports those explicitly through ``note``. With tracing enabled,
+    the peak extra Python/NumPy heap held during the frame is added on top;
+    tracemalloc is process wide, so that part is only meaningful while a
+    single session is streaming.
+    """
+
+    def __init__(self, enabled=TRACE_ALLOCATIONS):
+        self.enabled = enabled
+        self.frames = 0
+        self.total_bytes = 0
+        self.last_bytes = 0
+        self._base = 0
+        self._noted = 0
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def start_frame(self):
+        self._noted = 0
+        if self.enabled:
+            tracemalloc.reset_peak()
+            self._base = tracemalloc.get_traced_memory()[0]
+
+    def note(self, nbytes):
+        """Record an allocation made outside the Python heap"""
+        self._noted += nbytes
+
+    def end_frame(self):
+        traced = 0
+        if self.enabled:
+            _, peak = tracemalloc.get_traced_memory()
+            traced = max(0, peak - self._base)
+        self.last_bytes = self._noted + traced
+        self.total_bytes += self.last_bytes
+        self.frames += 1
+
+    def per_frame(self):
+        return self.total_bytes / self.frames if self.frames else 0.0
+
+
+class FramePipeline:
+    """Decodes into one reused BGR buffer per session and encodes it back out"""
+
+    def __init__(self, copy_free=True, counter=None):
+        # copy_free=False keeps the old to_ndarray() decode for before/after comparisons
+        self.copy_free = copy_free
+        self.counter = counter or AllocationCounter()
+        self.buffer = None
+        self._yuv = None
+
+    @staticmethod
+    def _plane(plane, rows, width):
+        """View a (possibly padded) frame plane as a rows x width array"""
+        return np.frombuffer(plane, dtype=np.uint8).reshape(rows, plane.line_size)[:, :width]
+
+    def _decode_i420(self, frame, height, width):
+        # Pack the three planes into one reused I420 buffer and convert from there
+        if self._yuv is None or self._yuv.shape != (height * 3 // 2, width):
+            self._yuv = np.empty((height * 3 // 2, width), dtype=np.uint8)
+            self.counter.note(self._yuv.nbytes)
+        chroma = height * width // 4
+        flat = self._yuv.reshape(-1)
+        self._yuv[:height] = self._plane(frame.planes[0], height, width)
+        flat[height * width:height * width + chroma].reshape(height // 2, width // 2)[:] = \
+            self._plane(frame.planes[1], height // 2, width // 2)
+        flat[height * width + chroma:].reshape(height // 2, width // 2)[:] = \
+            self._plane(frame.planes[2], height // 2, width // 2)
+        cv2.cvtColor(self._yuv, cv2.COLOR_YUV2BGR_I420, dst=self.buffer)
+
+    def decode(self, frame):
+        """Return the frame as a (H, W, 3) BGR array owned by this pipeline"""
+        self.counter.start_frame()
+        height, width = frame.height, frame.width
+        if not self.copy_free:
+            self.counter.note(height * width * 3)
+            return frame.to_ndarray(format="bgr24")
+        if self.buffer is None or self.buffer.shape[:2] != (height, width):
+            self.buffer = np.empty((height, width, 3), dtype=np.uint8)
+            self.counter.note(self.buffer.nbytes)
+        if frame.format.name == "yuv420p" and height % 2 == 0 and width % 2 == 0:
+            self._decode_i420(frame, height, width)
+            return self.buffer
+        if frame.format.name != "bgr24":
+            frame = frame.reformat(format="bgr24")
+            self.counter.note(height * width * 3)
+        np.copyto(self.buffer, self._plane(frame.planes[0], height, width * 3).reshape(height, width, 3))
+        return self.buffer
+
+    def finish(self, image):
+        """Close the frame's allocation window and return the image unchanged"""
+        self.counter.end_frame()
+        return image
+
+    def encode(self, image):
+        """Wrap the drawn buffer as an outgoing VideoFrame"""
+        # from_ndarray copies into a fresh AVFrame, so the buffer is free to reuse
+        self.counter.note(image.nbytes)
+        self.counter.end_frame()
+        return av.VideoFrame.from_ndarray(image, format="bgr24")
+
+    def stats(self):
+        return {
+            "frames": self.counter.frames,
+            "bytes_per_frame": round(self.counter.per_frame()),
+            "last_frame_bytes": self.counter.last_bytes
+        }
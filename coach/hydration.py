@@ -0,0 +1,272 @@
+"""Hydration history, one append-only log per member.
+
+Each member's history lives in its own JSON-lines file under HYDRATION_DIR.
+Every change is one appended line:
+
+* ``{"op": "log", "id", "day", "time", "amount_l"}``: a drink,
+* ``{"op": "delete", "id"}``: a tombstone for a drink logged by mistake,
+* ``{"op": "goal", "id", "day"}``: the day's goal was reached, which feeds
+  streaks (one id per day, so a repeated line is recognised as such).
+
+Logging a glass writes a single line through an O_APPEND descriptor. That
+costs the same whatever the history, and concurrent sessions can't
+interleave partial lines. The log is replayed once when first opened. After
+that only lines appended by other processes are read. Once tombstoned
+lines make up more than COMPACT_RATIO of the file, it is rewritten without
+them and swapped in atomically.
+
+The old shared water_data.json is imported into LEGACY_USER's log on first
+use, then renamed to water_data.json.migrated. The import holds the log's
+exclusive lock throughout, so processes starting together import it once.
+"""
+import datetime
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows: one process per log, no cross-process locking
+    fcntl = None
+
+HYDRATION_DIR = os.path.join("data", "hydration")
+LEGACY_FILE = "water_data.json"
+LEGACY_USER = "Guest"  # the old file had no users; its history becomes the default name's
+COMPACT_RATIO = 0.5  # rewrite once dead lines outnumber this share of the file
+COMPACT_MIN_LINES = 64  # ...and the file has at least this many lines
+
+
+def _goal(day):
+    return {"op": "goal", "id": f"goal-{day}", "day": day}
+
+
+def _encode(events):
+    return "".join(json.dumps(event, separators=(",", ":")) + "\n" for event in events).encode("utf-8")
+
+
+def log_path(user, directory=HYDRATION_DIR):
+    """The log file for ``user``: a readable slug plus a hash, so names never collide"""
+    slug = re.sub(r"[^A-Za-z0-9_-]+", "_", user)[:40] or "user"
+    digest = hashlib.sha1(user.encode("utf-8")).hexdigest()[:8]
+    return os.path.join(directory, f"{slug}-{digest}.jsonl")
+
+
+class HydrationLog:
+    """One member's hydration history, replayed from and appended to their log"""
+
+    def __init__(self, user, directory=HYDRATION_DIR):
+        self.user = user
+        self.path = log_path(user, directory)
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._entries = {}  # day -> {id: entry}, in logging order
+        self._day_of = {}  # entry id -> day
+        self._totals = {}  # day -> litres
+        self._goal_days = set()
+        self._lines = 0
+        self._dead = 0  # lines a compaction would drop
+        self._offset = 0
+        self._inode = None
+
+    # ------------------- Replay -------------------
+    def _apply(self, event):
+        self._lines += 1
+        op = event.get("op")
+        if op == "log":
+            if event["id"] in self._day_of:
+                self._dead += 1
+                return
+            day = event["day"]
+            self._entries.setdefault(day, {})[event["id"]] = event
+            self._day_of[event["id"]] = day
+            self._totals[day] = self._totals.get(day, 0.0) + event["amount_l"]
+        elif op == "delete":
+            self._dead += 1
+            day = self._day_of.pop(event["id"], None)
+            if day is not None:
+                entry = self._entries[day].pop(event["id"])
+                self._dead += 1  # the drink it cancels
+                self._totals[day] -= entry["amount_l"]
+                if not self._entries[day]:
+                    del self._entries[day], self._totals[day]
+        elif op == "goal":
+            if event["day"] in self._goal_days:
+                self._dead += 1
+            self._goal_days.add(event["day"])
+
+    def _catch_up(self):
+        """Apply lines appended since the last read, by this or another process"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            if self._lines:
+                self._reset()
+            return
+        if stat.st_ino != self._inode or stat.st_size < self._offset:
+            self._reset()  # compacted elsewhere: replay the new file
+            self._inode = stat.st_ino
+        if stat.st_size == self._offset:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            chunk = f.read()
+        complete = chunk.rfind(b"\n") + 1  # a line still being written is read next time
+        for line in chunk[:complete].splitlines():
+            if line.strip():
+                self._apply(json.loads(line))
+        self._offset += complete
+
+    # ------------------- Appends -------------------
+    def _locked_fd(self, exclusive=False):
+        """An O_APPEND descriptor on the current log file, flocked shared or exclusive
+
+        Appends share the lock; compaction and the legacy import exclude them.
+        """
+        while True:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            if fcntl is None:
+                return fd
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            if os.fstat(fd).st_ino == os.stat(self.path).st_ino:
+                return fd
+            os.close(fd)  # compacted while we waited: lock the new file
+
+    def _append(self, *events):
+        fd = self._locked_fd()
+        try:
+            os.write(fd, _encode(events))
+        finally:
+            os.close(fd)
+        self._catch_up()
+
+    def log(self, amount_l, goal_l=None, now=None):
+        """Record a drink; returns today's total in litres"""
+        now = now or datetime.datetime.now()
+        day = str(now.date())
+        with self._lock:
+            self._catch_up()
+            events = [{"op": "log", "id": uuid.uuid4().hex, "day": day,
+                       "time": now.strftime("%H:%M:%S"), "amount_l": amount_l}]
+            total = self._totals.get(day, 0.0) + amount_l
+            if goal_l and total >= goal_l and day not in self._goal_days:
+                events.append(_goal(day))
+            self._append(*events)
+            return self._totals.get(day, 0.0)
+
+    def delete(self, entry_id):
+        """Tombstone a drink; compacts the log once enough lines are dead"""
+        with self._lock:
+            self._catch_up()
+            if entry_id not in self._day_of:
+                return
+            self._append({"op": "delete", "id": entry_id})
+            if self._lines >= COMPACT_MIN_LINES and self._dead > COMPACT_RATIO * self._lines:
+                self._compact()
+
+    def _compact(self):
+        """Rewrite the log with live events only, swapped in atomically"""
+        lock_fd = self._locked_fd(exclusive=True)
+        try:
+            self._catch_up()
+            events = [entry for entries in self._entries.values() for entry in entries.values()]
+            events += [_goal(day) for day in sorted(self._goal_days)]
+            fd, scratch = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=".jsonl")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(event, separators=(",", ":")) + "\n" for event in events)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(scratch, self.path)
+        finally:
+            os.close(lock_fd)
+        self._reset()
+        self._catch_up()
+
+    # ------------------- Reads -------------------
+    def entries(self, day):
+        """The day's drinks in logging order, each with its ``id``"""
+        with self._lock:
+            self._catch_up()
+            return list(self._entries.get(day, {}).values())
+
+    def daily_totals(self):
+        """Litres per day, oldest first"""
+        with self._lock:
+            self._catch_up()
+            return dict(sorted(self._totals.items()))
+
+    def streak(self):
+        """Consecutive days, ending at the latest one, on which the goal was reached"""
+        with self._lock:
+            self._catch_up()
+            if not self._goal_days:
+                return 0
+            day = datetime.date.fromisoformat(max(self._goal_days))
+            count = 0
+            while str(day) in self._goal_days:
+                count += 1
+                day -= datetime.timedelta(days=1)
+            return count
+
+
+def migrate_legacy(legacy_file=LEGACY_FILE, directory=HYDRATION_DIR):
+    """Import the old shared water_data.json into LEGACY_USER's log, once
+
+    Returns False when there is nothing to import, including when another
+    process finished the import while this one waited for the lock.
+    """
+    if not os.path.exists(legacy_file):
+        return False
+    target = HydrationLog(LEGACY_USER, directory)
+    fd = target._locked_fd(exclusive=True)
+    try:
+        try:
+            with open(legacy_file, "r") as f:
+                legacy = json.load(f)
+        except FileNotFoundError:
+            return False  # imported and renamed by another process
+        target._catch_up()
+        events = []
+        for day, drinks in sorted(legacy.get("history", {}).items()):
+            for i, drink in enumerate(drinks):
+                entry_id = f"legacy-{day}-{i}"  # stable, so an interrupted import is not doubled
+                if entry_id not in target._day_of:
+                    events.append({"op": "log", "id": entry_id, "day": day,
+                                   "time": drink.get("time", "00:00:00"), "amount_l": drink.get("amount_l", 0)})
+        last = legacy.get("last_completed")
+        if last:
+            end = datetime.date.fromisoformat(last)
+            for back in range(max(legacy.get("streak", 0), 1)):
+                day = str(end - datetime.timedelta(days=back))
+                if day not in target._goal_days:
+                    events.append(_goal(day))
+        if events:
+            os.write(fd, _encode(events))
+        os.replace(legacy_file, legacy_file + ".migrated")
+    finally:
+        os.close(fd)
+    return True
+
+
+_logs = {}
+_logs_lock = threading.Lock()
+_migrated = False
+
+
+def shared_log(user):
+    """The process-wide HydrationLog for ``user``; imports the legacy file on first use"""
+    global _migrated
+    with _logs_lock:
+        if not _migrated:
+            migrate_legacy()
+            _migrated = True
+        log = _logs.get(user)
+        if log is None:
+            log = _logs[user] = HydrationLog(user)
+        return log
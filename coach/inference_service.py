@@ -0,0 +1,226 @@
+"""Pose inference in worker processes, fed through shared memory.
+
+With ``COACH_INFERENCE_WORKERS=N`` set, PoseSession stops running MediaPipe
+on the WebRTC thread. Instead it hands frames to N worker processes, so
+sessions on different cores no longer fight over the Streamlit process's GIL.
+
+Each worker owns one shared-memory block cut into slots. A slot holds a
+letterboxed RGB frame (written in place by the session's Letterbox) and the
+(33, 4) landmark array the worker writes back. A session keeps its slot, and
+so its worker and its estimator's tracking state, for the whole stream. Only
+a short message per frame travels over the slot's pipe.
+"""
+import atexit
+import multiprocessing
+import os
+import threading
+from multiprocessing.connection import wait
+from multiprocessing.shared_memory import SharedMemory
+from types import SimpleNamespace
+
+import numpy as np
+
+from coach.landmarks import NUM_LANDMARKS, landmarks_to_array
+from coach.letterbox import INFERENCE_SIZE
+
+WORKERS = int(os.environ.get("COACH_INFERENCE_WORKERS", "0"))  # 0 keeps inference in-process
+SLOTS_PER_WORKER = 8  # concurrent sessions one worker serves
+
+
+def _slot_views(buf, slots, size):
+    """Frame and landmark arrays laid over a worker's shared-memory block"""
+    frame_bytes = slots * size * size * 3
+    frames = np.ndarray((slots, size, size, 3), dtype=np.uint8, buffer=buf)
+    landmarks = np.ndarray((slots, NUM_LANDMARKS, 4), dtype=np.float32, buffer=buf, offset=frame_bytes)
+    return frames, landmarks
+
+
+def _block_size(slots, size):
+    return slots * (size * size * 3 + NUM_LANDMARKS * 4 * 4)
+
+
+def _worker_main(shm_name, slots, size, conns, control):
+    """Serve open/infer/close requests for every slot of one worker"""
+    from coach.pose_engine import pose_pool
+
+    # Every slot must be able to hold an estimator, whatever configurations they ask for
+    pose_pool.max_per_key = slots
+    shm = SharedMemory(name=shm_name)
+    frames, landmarks = _slot_views(shm.buf, slots, size)
+    slot_of = {id(conn): slot for slot, conn in enumerate(conns)}
+    estimators = {}
+    listening = list(conns) + [control]
+    try:
+        while listening:
+            for conn in wait(listening):
+                try:
+                    op, arg = conn.recv()
+                except EOFError:
+                    listening.remove(conn)
+                    continue
+                if conn is control:
+                    if op == "stop":
+                        return
+                    pose_pool.prewarm(arg, count=1)
+                    continue
+
+                slot = slot_of[id(conn)]
+                if op == "infer":
+                    if slot not in estimators:
+                        conn.send(False)  # not opened (or its open failed): no pose
+                        continue
+                    _, pose = estimators[slot]
+                    results = pose.process(frames[slot])
+                    found = bool(results.pose_landmarks)
+                    if found:
+                        landmarks_to_array(results.pose_landmarks, out=landmarks[slot])
+                    conn.send(found)
+                elif op == "open":
+                    if slot in estimators:
+                        pose_pool.release(*estimators.pop(slot))
+                    pose = pose_pool.checkout(arg, timeout=0)
+                    if pose is not None:
+                        estimators[slot] = (arg, pose)
+                    conn.send(pose is not None)
+                elif op == "close":
+                    if slot in estimators:
+                        pose_pool.release(*estimators.pop(slot))
+                    conn.send(True)
+    finally:
+        del frames, landmarks
+        shm.close()
+
+
+class ServiceSlot:
+    """A session's reserved slot: write ``frame``, call ``infer``, read ``landmarks``"""
+
+    def __init__(self, service, worker, index):
+        self.service = service
+        self.worker = worker
+        self.index = index
+        self.frame = worker.frames[index]
+        self.landmarks = worker.landmarks[index]
+        self._conn = worker.conns[index]
+        self.closed = False
+
+    def _call(self, op, arg=None):
+        try:
+            self._conn.send((op, arg))
+            return self._conn.recv()
+        except (EOFError, OSError):
+            self._free()  # the worker went away; hand the slot back before raising
+            raise
+
+    def _free(self):
+        if not self.closed:
+            self.closed = True
+            self.service._free(self.worker, self.index)
+
+    def infer(self):
+        """Run the worker's estimator on ``frame``; a copy of the landmarks, or None"""
+        if not self._call("infer"):
+            return None
+        return self.landmarks.copy()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self._call("close")
+        finally:
+            self._free()
+
+
+class InferenceService:
+    """N worker processes, each serving up to ``slots`` sessions from shared memory"""
+
+    def __init__(self, workers=None, slots=SLOTS_PER_WORKER, size=INFERENCE_SIZE):
+        self.size = size
+        self.slots = slots
+        self._lock = threading.Lock()
+        self._workers = []
+        # MediaPipe graphs don't survive fork, so workers are started fresh
+        context = multiprocessing.get_context("spawn")
+        for _ in range(workers or os.cpu_count() or 1):
+            shm = SharedMemory(create=True, size=_block_size(slots, size))
+            pipes = [context.Pipe() for _ in range(slots)]
+            control, worker_control = context.Pipe()
+            process = context.Process(
+                target=_worker_main, daemon=True,
+                args=(shm.name, slots, size, [child for _, child in pipes], worker_control)
+            )
+            process.start()
+            frames, landmarks = _slot_views(shm.buf, slots, size)
+            self._workers.append(SimpleNamespace(
+                process=process, shm=shm, frames=frames, landmarks=landmarks, control=control,
+                conns=[parent for parent, _ in pipes], free=list(range(slots))[::-1]
+            ))
+
+    def open(self, key):
+        """Reserve a slot with an estimator for ``key`` on the least busy worker, or None if full"""
+        with self._lock:
+            workers = [worker for worker in self._workers if worker.process.is_alive()]
+            if not workers:
+                return None
+            worker = max(workers, key=lambda w: len(w.free))
+            if not worker.free:
+                return None
+            index = worker.free.pop()
+        slot = ServiceSlot(self, worker, index)
+        try:
+            opened = slot._call("open", key)
+        except (EOFError, OSError):
+            return None
+        if not opened:
+            slot._free()
+            return None
+        return slot
+
+    def _free(self, worker, index):
+        with self._lock:
+            worker.free.append(index)
+
+    def prewarm(self, key):
+        """Have every worker build one estimator for ``key`` ahead of the first session"""
+        with self._lock:
+            for worker in self._workers:
+                worker.control.send(("prewarm", key))
+
+    def snapshot(self):
+        """Busy slots per worker"""
+        with self._lock:
+            return {"workers": len(self._workers),
+                    "busy": [self.slots - len(worker.free) for worker in self._workers]}
+
+    def shutdown(self):
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            try:
+                worker.control.send(("stop", None))
+            except OSError:
+                pass
+        for worker in workers:
+            worker.process.join(timeout=5)
+            worker.frames = worker.landmarks = None
+            try:
+                worker.shm.close()
+            except BufferError:
+                pass  # a session still holds a slot view; the mapping goes at exit
+            worker.shm.unlink()
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def shared_service():
+    """The process-wide InferenceService, started on first use; None unless enabled"""
+    global _service
+    if WORKERS <= 0:
+        return None
+    with _service_lock:
+        if _service is None:
+            _service = InferenceService(WORKERS)
+            atexit.register(_service.shutdown)
+        return _service
@@ -0,0 +1,143 @@
+"""Keyframe scheduling and landmark prediction between pose inferences.
+
+The model only runs on keyframes. How often is decided from how fast the body
+is moving and how long inference is taking against a per-frame latency
+budget; the frames in between get landmarks from a constant-velocity Kalman
+filter, so rep counting and overlays still update at the camera frame rate.
+"""
+import math
+
+import numpy as np
+
+from coach.landmarks import NUM_LANDMARKS, VISIBILITY
+
+# ------------------- Scheduler Settings -------------------
+MAX_KEYFRAME_INTERVAL = 4  # never predict more than this many frames in a row
+FAST_MOTION = 0.6  # normalised units/sec at which every frame is a keyframe
+SLOW_MOTION = 0.1  # normalised units/sec at which the longest interval is used
+LATENCY_BUDGET_MS = 15.0  # average inference time we allow per displayed frame
+
+
+class LandmarkPredictor:
+    """Constant-velocity Kalman filter over every landmark coordinate at once
+
+    All coordinates share the same noise model and update times, so a single
+    2x2 covariance (and gain) serves the whole (33, 3) state.
+    """
+
+    def __init__(self, process_noise=5.0, measurement_noise=1e-4):
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.position = np.zeros((NUM_LANDMARKS, 3), dtype=np.float32)
+        self.velocity = np.zeros((NUM_LANDMARKS, 3), dtype=np.float32)
+        self.visibility = np.zeros(NUM_LANDMARKS, dtype=np.float32)
+        self.cov = np.eye(2)
+        self.last_time = None
+        self.initialized = False
+
+    def reset(self):
+        self.velocity[:] = 0
+        self.cov = np.eye(2)
+        self.last_time = None
+        self.initialized = False
+
+    def _predict_to(self, timestamp):
+        dt = 0.0 if self.last_time is None else max(timestamp - self.last_time, 0.0)
+        self.last_time = timestamp
+        if dt == 0.0:
+            return
+        self.position += self.velocity * dt
+        transition = np.array([[1.0, dt], [0.0, 1.0]])
+        # Discrete white-noise acceleration model
+        q = self.process_noise
+        noise = q * np.array([[dt ** 4 / 4, dt ** 3 / 2], [dt ** 3 / 2, dt ** 2]])
+        self.cov = transition @ self.cov @ transition.T + noise
+
+    def update(self, landmarks, timestamp):
+        """Fold in a measured (33, 4) landmark array from a keyframe"""
+        measured = landmarks[:, :3]
+        if not self.initialized:
+            self.position[:] = measured
+            self.velocity[:] = 0
+            self.visibility[:] = landmarks[:, VISIBILITY]
+            self.cov = np.eye(2) * self.measurement_noise
+            self.last_time = timestamp
+            self.initialized = True
+            return
+        self._predict_to(timestamp)
+        innovation = measured - self.position
+        s = self.cov[0, 0] + self.measurement_noise
+        gain_pos, gain_vel = self.cov[0, 0] / s, self.cov[1, 0] / s
+        self.position += gain_pos * innovation
+        self.velocity += gain_vel * innovation
+        self.cov = np.array([
+            [(1 - gain_pos) * self.cov[0, 0], (1 - gain_pos) * self.cov[0, 1]],
+            [self.cov[1, 0] - gain_vel * self.cov[0, 0], self.cov[1, 1] - gain_vel * self.cov[0, 1]]
+        ])
+        self.visibility[:] = landmarks[:, VISIBILITY]
+
+    def predict(self, timestamp, out=None):
+        """Extrapolate landmarks to ``timestamp`` as a (33, 4) array"""
+        self._predict_to(timestamp)
+        if out is None:
+            out = np.empty((NUM_LANDMARKS, 4), dtype=np.float32)
+        out[:, :3] = self.position
+        out[:, VISIBILITY] = self.visibility
+        return out
+
+    def speed(self):
+        """Visibility-weighted mean image-plane speed in normalised units/sec"""
+        planar = np.hypot(self.velocity[:, 0], self.velocity[:, 1])
+        weight = self.visibility.sum()
+        if weight <= 0:
+            return 0.0
+        return float((planar * self.visibility).sum() / weight)
+
+
+class KeyframeScheduler:
+    """Chooses which frames run the model from motion and measured latency"""
+
+    def __init__(self, max_interval=MAX_KEYFRAME_INTERVAL, fast_motion=FAST_MOTION,
+                 slow_motion=SLOW_MOTION, latency_budget_ms=LATENCY_BUDGET_MS):
+        self.max_interval = max_interval
+        self.fast_motion = fast_motion
+        self.slow_motion = slow_motion
+        self.latency_budget_ms = latency_budget_ms
+        self.latency_ms = 0.0
+        self.interval = 1
+        self.since_keyframe = 0
+        self.keyframes = 0
+        self.predicted = 0
+
+    def record_latency(self, latency_ms):
+        """Track inference time with an exponential moving average"""
+        if self.latency_ms == 0.0:
+            self.latency_ms = latency_ms
+        else:
+            self.latency_ms = 0.8 * self.latency_ms + 0.2 * latency_ms
+
+    def _interval_for(self, speed):
+        if speed >= self.fast_motion:
+            motion_interval = 1
+        elif speed <= self.slow_motion:
+            motion_interval = self.max_interval
+        else:
+            span = (self.fast_motion - speed) / (self.fast_motion - self.slow_motion)
+            motion_interval = 1 + int(span * (self.max_interval - 1))
+        latency_interval = max(1, math.ceil(self.latency_ms / self.latency_budget_ms))
+        return min(self.max_interval, max(motion_interval, latency_interval))
+
+    def is_keyframe(self, speed, tracking):
+        """Decide whether the next frame should run the model"""
+        if not tracking:
+            self.since_keyframe = 0
+            self.keyframes += 1
+            return True
+        self.interval = self._interval_for(speed)
+        self.since_keyframe += 1
+        if self.since_keyframe >= self.interval:
+            self.since_keyframe = 0
+            self.keyframes += 1
+            return True
+        self.predicted += 1
+        return False
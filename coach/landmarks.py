@@ -0,0 +1,42 @@
+"""The (33, 4) float32 landmark array shared by checks, overlays and logging.
+
+Each pose result is converted once into rows of x, y, z, visibility indexed
+by the named constants below (same numbering as mp_pose.PoseLandmark), so
+per-frame code reads plain array cells instead of protobuf attributes.
+"""
+import numpy as np
+
+NUM_LANDMARKS = 33
+
+# Column order of a landmark array
+X, Y, Z, VISIBILITY = range(4)
+
+# Row order of a landmark array
+(NOSE, LEFT_EYE_INNER, LEFT_EYE, LEFT_EYE_OUTER, RIGHT_EYE_INNER, RIGHT_EYE,
+ RIGHT_EYE_OUTER, LEFT_EAR, RIGHT_EAR, MOUTH_LEFT, MOUTH_RIGHT,
+ LEFT_SHOULDER, RIGHT_SHOULDER, LEFT_ELBOW, RIGHT_ELBOW, LEFT_WRIST, RIGHT_WRIST,
+ LEFT_PINKY, RIGHT_PINKY, LEFT_INDEX, RIGHT_INDEX, LEFT_THUMB, RIGHT_THUMB,
+ LEFT_HIP, RIGHT_HIP, LEFT_KNEE, RIGHT_KNEE, LEFT_ANKLE, RIGHT_ANKLE,
+ LEFT_HEEL, RIGHT_HEEL, LEFT_FOOT_INDEX, RIGHT_FOOT_INDEX) = range(NUM_LANDMARKS)
+
+# Bones of the skeleton, as in mp_pose.POSE_CONNECTIONS
+POSE_CONNECTIONS = np.array([
+    (0, 1), (1, 2), (2, 3), (3, 7), (0, 4), (4, 5), (5, 6), (6, 8), (9, 10),
+    (11, 12), (11, 13), (13, 15), (15, 17), (15, 19), (15, 21), (17, 19),
+    (12, 14), (14, 16), (16, 18), (16, 20), (16, 22), (18, 20),
+    (11, 23), (12, 24), (23, 24), (23, 25), (24, 26), (25, 27), (26, 28),
+    (27, 29), (28, 30), (29, 31), (30, 32), (27, 31), (28, 32)
+], dtype=np.intp)
+
+
+def landmarks_to_array(landmark_list, out=None):
+    """Copy a NormalizedLandmarkList into a (33, 4) float32 array of x, y, z, visibility"""
+    if out is None:
+        out = np.empty((NUM_LANDMARKS, 4), dtype=np.float32)
+    out[:] = [(lmk.x, lmk.y, lmk.z, lmk.visibility) for lmk in landmark_list.landmark]
+    return out
+
+
+def mean_visibility(landmarks):
+    """Average landmark visibility as a 0-100 confidence score"""
+    return float(landmarks[:, VISIBILITY].mean()) * 100
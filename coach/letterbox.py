@@ -0,0 +1,67 @@
+"""Fixed-size letterboxing for pose inference.
+
+Camera frames arrive at whatever resolution the browser picks. Before
+inference each frame is scaled, aspect preserved, into a small square buffer
+that is reused from frame to frame; landmarks the model returns in buffer
+coordinates are then mapped back onto the original frame.
+"""
+import cv2
+import numpy as np
+
+from coach.landmarks import X, Y, Z
+
+INFERENCE_SIZE = 384  # side of the square buffer fed to the model
+
+
+class Letterbox:
+    """Reusable square inference buffer plus the mapping back to the source frame"""
+
+    def __init__(self, size=INFERENCE_SIZE, buffer=None):
+        # ``buffer`` lets frames be scaled straight into memory owned elsewhere,
+        # e.g. an inference service slot (see coach.inference_service)
+        self.size = size
+        self.buffer = np.zeros((size, size, 3), dtype=np.uint8) if buffer is None else buffer
+        self._shape = None
+        self._region = None
+        # Normalised buffer coords -> normalised frame coords: frame = buffer * gain - offset
+        self._gain = (1.0, 1.0)
+        self._offset = (0.0, 0.0)
+
+    def _layout(self, height, width):
+        scale = self.size / max(height, width)
+        new_w = max(1, round(width * scale))
+        new_h = max(1, round(height * scale))
+        x0 = (self.size - new_w) // 2
+        y0 = (self.size - new_h) // 2
+        # Padding only needs clearing when the frame geometry changes
+        self.buffer[:] = 0
+        self._shape = (height, width)
+        self._region = (slice(y0, y0 + new_h), slice(x0, x0 + new_w))
+        self._gain = (self.size / new_w, self.size / new_h)
+        self._offset = (x0 / new_w, y0 / new_h)
+
+    def fit(self, image, color_code=None):
+        """Scale ``image`` into the shared buffer and return the buffer
+
+        ``color_code`` (e.g. cv2.COLOR_BGR2RGB) is applied in place on the
+        small buffer rather than on the full-size frame.
+        """
+        height, width = image.shape[:2]
+        if self._shape != (height, width):
+            self._layout(height, width)
+        target = self.buffer[self._region]
+        cv2.resize(image, (target.shape[1], target.shape[0]), dst=target,
+                   interpolation=cv2.INTER_AREA)
+        if color_code is not None:
+            cv2.cvtColor(target, color_code, dst=target)
+        return self.buffer
+
+    def unproject(self, landmarks):
+        """Map a (33, 4) landmark array from buffer to frame coordinates, in place"""
+        gain_x, gain_y = self._gain
+        offset_x, offset_y = self._offset
+        landmarks[:, X] = landmarks[:, X] * gain_x - offset_x
+        landmarks[:, Y] = landmarks[:, Y] * gain_y - offset_y
+        # MediaPipe scales depth like x
+        landmarks[:, Z] *= gain_x
+        return landmarks
@@ -0,0 +1,355 @@
+"""Pooled MediaPipe pose estimators shared by all camera pages.
+
+A ``mp_pose.Pose`` graph is expensive to build and must not be used by two
+threads at once, so each WebRTC session checks an estimator out of a bounded,
+pre-warmed pool when its stream starts and hands it back when it stops. A
+session that finds the pool full streams on without coaching (``busy`` is set
+on its results) and asks again shortly. When the inference service is enabled (see coach.inference_service) the pool
+lives in its worker processes instead and sessions reserve a slot there.
+"""
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+import cv2
+import mediapipe as mp
+import numpy as np
+
+from coach.autotune import FRAME_BUDGET_MS, AutoTuner
+from coach.inference_service import shared_service
+from coach.keyframes import KeyframeScheduler, LandmarkPredictor
+from coach.landmarks import landmarks_to_array
+from coach.letterbox import INFERENCE_SIZE, Letterbox
+
+mp_pose = mp.solutions.pose
+
+# ------------------- Pool Settings -------------------
+# Hard cap on live estimators for one configuration in this process, so at most
+# this many members per configuration get coaching at once; inference workers
+# size their own pools by their slot count instead
+MAX_ESTIMATORS_PER_KEY = int(os.environ.get("COACH_MAX_ESTIMATORS", "16"))
+WARM_ESTIMATORS_PER_KEY = 2  # idle estimators kept ready for new sessions
+CHECKOUT_RETRY = 1.0  # seconds a session waits before asking a full pool again
+
+# Returned while a session has no pose, or no estimator (busy), so callers can keep streaming
+NO_RESULTS = SimpleNamespace(landmarks=None, keyframe=False, busy=False)
+BUSY = SimpleNamespace(landmarks=None, keyframe=False, busy=True)
+BUSY_MESSAGE = "Coach busy - waiting for a free slot"
+
+log = logging.getLogger(__name__)
+
+
+def pose_key(model_complexity=1, min_detection_confidence=0.5, min_tracking_confidence=0.5):
+    """Normalise estimator settings into a hashable pool key"""
+    return (int(model_complexity),
+            round(float(min_detection_confidence), 2),
+            round(float(min_tracking_confidence), 2))
+
+
+class PosePool:
+    """Bounded pool of warmed-up estimators keyed by (complexity, thresholds)"""
+
+    def __init__(self, max_per_key=MAX_ESTIMATORS_PER_KEY, warm_per_key=WARM_ESTIMATORS_PER_KEY):
+        self.max_per_key = max_per_key
+        self.warm_per_key = warm_per_key
+        self._idle = defaultdict(list)
+        self._live = defaultdict(int)
+        self._cond = threading.Condition()
+        self.stats = {"created": 0, "reused": 0, "waits": 0, "timeouts": 0}
+
+    def _build(self, key):
+        complexity, detection, tracking = key
+        pose = mp_pose.Pose(
+            model_complexity=complexity,
+            min_detection_confidence=detection,
+            min_tracking_confidence=tracking
+        )
+        # Run one blank frame so the graph and model are loaded before use
+        pose.process(np.zeros((64, 64, 3), dtype=np.uint8))
+        return pose
+
+    def _reserve(self, key, timeout):
+        """Reserve a slot under the lock; returns an idle estimator, True to build, or None"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if self._idle[key]:
+                    self.stats["reused"] += 1
+                    return self._idle[key].pop()
+                if self._live[key] < self.max_per_key:
+                    self._live[key] += 1
+                    return True
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self.stats["timeouts"] += 1
+                    return None
+                self.stats["waits"] += 1
+                self._cond.wait(remaining)
+
+    def _build_reserved(self, key):
+        try:
+            pose = self._build(key)
+        except Exception:
+            with self._cond:
+                self._live[key] -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self.stats["created"] += 1
+        return pose
+
+    def checkout(self, key, timeout=None):
+        """Take an estimator for exclusive use, or None if none frees up in time"""
+        reserved = self._reserve(key, timeout)
+        if reserved is True:
+            return self._build_reserved(key)
+        return reserved
+
+    def release(self, key, pose):
+        """Return an estimator so the next session can reuse it"""
+        # Drop tracking state so the next member doesn't start from our landmarks
+        reset = getattr(pose, "reset", None)
+        if reset is not None:
+            reset()
+        with self._cond:
+            self._idle[key].append(pose)
+            self._cond.notify()
+
+    def prewarm(self, key, count=None):
+        """Build estimators ahead of time until ``count`` are idle for this key"""
+        count = self.warm_per_key if count is None else count
+        while True:
+            with self._cond:
+                if len(self._idle[key]) >= count or self._live[key] >= self.max_per_key:
+                    return
+                self._live[key] += 1
+            pose = self._build_reserved(key)
+            with self._cond:
+                self._idle[key].append(pose)
+                self._cond.notify()
+
+    def snapshot(self):
+        """Live/idle counts per key plus reuse statistics"""
+        with self._cond:
+            return {
+                "live": dict(self._live),
+                "idle": {key: len(poses) for key, poses in self._idle.items()},
+                **self.stats
+            }
+
+
+pose_pool = PosePool()
+
+
+def prewarm(**config):
+    """Build estimators for a page's pose settings wherever inference runs"""
+    service = shared_service()
+    if service is not None:
+        service.prewarm(pose_key(**config))
+    else:
+        pose_pool.prewarm(pose_key(**config))
+
+
+class PoseSession:
+    """A single camera session's handle on a pooled estimator
+
+    With ``keyframes`` enabled the model only runs on frames picked by a
+    KeyframeScheduler; other frames get Kalman-predicted landmarks. With an
+    ``inference_size`` the model sees a letterboxed copy of that size instead
+    of the full camera frame. Frames are passed in BGR, as decoded. With an
+    inference ``service`` (by default the shared one when enabled; False keeps
+    inference in-process) the model runs in a worker process and the
+    letterbox is drawn straight into the session's slot. With ``autotune``
+    an AutoTuner may move the session to a lighter model or a lower inference
+    rate to keep within ``latency_budget_ms`` per frame (see coach.autotune).
+    In-process, the new model is built on a background thread and the session
+    keeps its current estimator until that one is ready.
+    """
+
+    def __init__(self, model_complexity=1, min_detection_confidence=0.5,
+                 min_tracking_confidence=0.5, pool=None, keyframes=True,
+                 inference_size=INFERENCE_SIZE, service=None, autotune=True,
+                 latency_budget_ms=FRAME_BUDGET_MS):
+        self.key = pose_key(model_complexity, min_detection_confidence, min_tracking_confidence)
+        self.pool = pool or pose_pool
+        self.service = (shared_service() if service is None else service) or None
+        self.scheduler = KeyframeScheduler() if keyframes else None
+        self.tuner = AutoTuner(self.key[0], latency_budget_ms) if autotune else None
+        self.letterbox = Letterbox(inference_size) if inference_size else None
+        self._rgb = None
+        self.predictor = LandmarkPredictor()
+        self._pose = None
+        self._slot = None
+        self._retry_at = 0.0
+        self._busy = False  # the last checkout found the pool or service full
+        self._warming = None  # checks out an estimator for _next_key when the tuner moves
+        self._next_key = None
+        self._next_pose = None
+        self._lock = threading.Lock()
+
+    def _to_model_input(self, image_bgr):
+        if self.letterbox is not None:
+            return self.letterbox.fit(image_bgr, color_code=cv2.COLOR_BGR2RGB)
+        if self._rgb is None or self._rgb.shape != image_bgr.shape:
+            self._rgb = np.empty_like(image_bgr)
+        return cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB, dst=self._rgb)
+
+    def _acquire(self):
+        """Make sure this session has an estimator (or service slot); False if none is free
+
+        Never blocks the video thread: when the pool or service is full the
+        session streams without landmarks and asks again after CHECKOUT_RETRY.
+        """
+        if self._pose is not None or self._slot is not None:
+            return True
+        now = time.monotonic()
+        if now < self._retry_at:
+            return False
+        if self.service is not None:
+            self._slot = self.service.open(self.key)
+            if self._slot is not None:
+                self.letterbox = Letterbox(self.service.size, buffer=self._slot.frame)
+        else:
+            self._pose = self.pool.checkout(self.key, timeout=0)
+        if self._pose is None and self._slot is None:
+            if not self._busy:
+                log.warning("No free pose estimator for %s; streaming without coaching until one frees up",
+                            self.key)
+                self._busy = True
+            self._retry_at = now + CHECKOUT_RETRY
+            return False
+        if self._busy:
+            log.info("A pose estimator for %s freed up; coaching resumes", self.key)
+            self._busy = False
+        return True
+
+    def _infer(self, image_rgb):
+        """A fresh (33, 4) landmark array in model-input coordinates, or None"""
+        if self._slot is not None:
+            try:
+                return self._slot.infer()
+            except (EOFError, OSError):
+                # The worker went away and the slot was handed back; the next keyframe opens a new one
+                self._slot = None
+                return None
+        results = self._pose.process(image_rgb)
+        if not results.pose_landmarks:
+            return None
+        return landmarks_to_array(results.pose_landmarks)
+
+    def _release(self):
+        """Give back the estimator or slot; the next keyframe acquires a new one"""
+        pose, self._pose = self._pose, None
+        slot, self._slot = self._slot, None
+        if pose is not None:
+            self.pool.release(self.key, pose)
+        if slot is not None:
+            slot.close()
+
+    def _warm(self, key):
+        # Off the video thread: _retune swaps the estimator in once this has finished
+        try:
+            self._next_pose = self.pool.checkout(key, timeout=CHECKOUT_RETRY)
+        except Exception:
+            log.exception("Building a pose estimator for %s failed", key)
+
+    def _collect_warmed(self):
+        """The background checkout's (key, estimator) once it has finished, else None"""
+        if self._warming is None or self._warming.is_alive():
+            return None
+        self._warming = None
+        pose, self._next_pose = self._next_pose, None
+        return None if pose is None else (self._next_key, pose)
+
+    def _retune(self, latency_ms, timestamp=None):
+        self.tuner.record(latency_ms, timestamp)
+        key = (self.tuner.complexity, *self.key[1:])
+        warmed = self._collect_warmed()
+        if warmed is not None:
+            if warmed[0] == key and self._pose is not None:
+                self._release()
+                self.key, self._pose = warmed
+            else:
+                self.pool.release(*warmed)  # the tuner moved on meanwhile
+        if key == self.key:
+            return
+        if self._pose is None:
+            # Nothing held in-process (a worker builds its own): ask for the new key next time
+            self._release()
+            self.key = key
+        elif self._warming is None:
+            # Keep running the current model while the new one is built
+            self._next_key = key
+            self._warming = threading.Thread(target=self._warm, args=(key,), name="pose-prewarm", daemon=True)
+            self._warming.start()
+
+    def process(self, image_bgr, timestamp=None):
+        """Return this frame's landmarks, running the model only on keyframes
+
+        The result has ``landmarks`` (a (33, 4) array, see coach.landmarks,
+        or None when no pose is found), ``keyframe`` and ``busy`` (no
+        estimator was free, so the model didn't run).
+        """
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        with self._lock:
+            tracking = self.predictor.initialized
+            throttled = tracking and self.tuner is not None and not self.tuner.due(timestamp)
+            if throttled or (self.scheduler is not None
+                             and not self.scheduler.is_keyframe(self.predictor.speed(), tracking)):
+                if self.tuner is not None:
+                    self._retune(0.0)
+                return SimpleNamespace(landmarks=self.predictor.predict(timestamp), keyframe=False, busy=False)
+
+            if not self._acquire():
+                self.predictor.reset()
+                return BUSY
+            image_rgb = self._to_model_input(image_bgr)
+            start = time.perf_counter()
+            landmarks = self._infer(image_rgb)
+            latency_ms = (time.perf_counter() - start) * 1000
+            if self.scheduler is not None:
+                self.scheduler.record_latency(latency_ms)
+            if self.tuner is not None:
+                self._retune(latency_ms, timestamp)
+            if landmarks is None:
+                self.predictor.reset()
+                return NO_RESULTS
+
+            if self.letterbox is not None:
+                self.letterbox.unproject(landmarks)
+            self.predictor.update(landmarks, timestamp)
+            return SimpleNamespace(landmarks=landmarks, keyframe=True, busy=False)
+
+    def stats(self):
+        """Keyframe/prediction counts, the current inference interval and tuner decisions"""
+        stats = {}
+        if self.scheduler is not None:
+            stats.update({
+                "keyframes": self.scheduler.keyframes,
+                "predicted": self.scheduler.predicted,
+                "interval": self.scheduler.interval,
+                "latency_ms": round(self.scheduler.latency_ms, 1)
+            })
+        if self.tuner is not None:
+            stats.update(self.tuner.stats())
+        return stats
+
+    def close(self):
+        """Hand the estimator back to the pool; safe to call more than once"""
+        with self._lock:
+            self.predictor.reset()
+            self._release()
+            if self._warming is not None:
+                self._warming.join()
+                warmed = self._collect_warmed()
+                if warmed is not None:
+                    self.pool.release(*warmed)
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
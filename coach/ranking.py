@@ -0,0 +1,203 @@
+"""Live leaderboard positions from memory, without a query per rerun.
+
+RankIndex keeps every member's total reps in a skip list whose links
+record how many members they jump over. Finding a member's rank, the
+member at a given rank, the top K or the members around someone takes
+O(log n) steps, plus the length of what is returned.
+
+The index is warmed from the user rollup when the process starts. The rep
+writer (coach.events) applies each committed batch to it, so pages read
+live ranks without touching SQLite. Ties are ordered the way the SQL
+leaderboard orders them: whoever has the lower user id, i.e. logged their
+first rep earlier, ranks first.
+"""
+import random
+import threading
+
+from coach.storage import shared_storage
+
+MAX_LEVEL = 24  # enough for 4**24 members at P = 0.25
+P = 0.25  # chance a node also appears one level up
+
+
+class _Node:
+    __slots__ = ("key", "name", "next", "span")
+
+    def __init__(self, key, name, level):
+        self.key = key
+        self.name = name
+        self.next = [None] * level
+        self.span = [0] * level  # members passed over by each link
+
+
+class RankIndex:
+    """Members ordered by total reps, highest first"""
+
+    def __init__(self):
+        self._head = _Node(None, None, MAX_LEVEL)
+        self._level = 1
+        self._size = 0
+        self._keys = {}  # name -> (-total, order)
+        self._order = {}  # name -> tie-break, the user id when known
+        self._next_order = 0
+        self._sessions = {}  # session_id -> reps already counted
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    # ------------------- Skip list -------------------
+    def _random_level(self):
+        level = 1
+        while level < MAX_LEVEL and random.random() < P:
+            level += 1
+        return level
+
+    def _insert(self, key, name):
+        update = [self._head] * MAX_LEVEL
+        passed = [0] * MAX_LEVEL
+        node = self._head
+        for i in range(self._level - 1, -1, -1):
+            passed[i] = passed[i + 1] if i + 1 < self._level else 0
+            while node.next[i] is not None and node.next[i].key < key:
+                passed[i] += node.span[i]
+                node = node.next[i]
+            update[i] = node
+        level = self._random_level()
+        if level > self._level:
+            for i in range(self._level, level):
+                update[i] = self._head
+                passed[i] = 0
+                self._head.span[i] = self._size
+            self._level = level
+        new = _Node(key, name, level)
+        for i in range(level):
+            new.next[i] = update[i].next[i]
+            update[i].next[i] = new
+            new.span[i] = update[i].span[i] - (passed[0] - passed[i])
+            update[i].span[i] = passed[0] - passed[i] + 1
+        for i in range(level, self._level):
+            update[i].span[i] += 1
+        self._size += 1
+
+    def _delete(self, key):
+        update = [self._head] * MAX_LEVEL
+        node = self._head
+        for i in range(self._level - 1, -1, -1):
+            while node.next[i] is not None and node.next[i].key < key:
+                node = node.next[i]
+            update[i] = node
+        target = node.next[0]
+        for i in range(self._level):
+            if update[i].next[i] is target:
+                update[i].span[i] += target.span[i] - 1
+                update[i].next[i] = target.next[i]
+            else:
+                update[i].span[i] -= 1
+        while self._level > 1 and self._head.next[self._level - 1] is None:
+            self._level -= 1
+        self._size -= 1
+
+    def _rank_of(self, key):
+        rank = 0
+        node = self._head
+        for i in range(self._level - 1, -1, -1):
+            while node.next[i] is not None and node.next[i].key <= key:
+                rank += node.span[i]
+                node = node.next[i]
+        return rank
+
+    def _node_at(self, rank):
+        passed = 0
+        node = self._head
+        for i in range(self._level - 1, -1, -1):
+            while node.next[i] is not None and passed + node.span[i] <= rank:
+                passed += node.span[i]
+                node = node.next[i]
+        return node
+
+    def _entries_from(self, rank, count):
+        """(rank, name, total) for ``count`` members starting at ``rank``"""
+        node = self._node_at(rank) if rank > 0 else None
+        entries = []
+        while node is not None and len(entries) < count:
+            entries.append((rank + len(entries), node.name, -node.key[0]))
+            node = node.next[0]
+        return entries
+
+    # ------------------- Totals -------------------
+    def set_total(self, name, total, order=None):
+        """Place ``name`` at ``total`` reps; ``order`` is the user id when known"""
+        with self._lock:
+            self._set(name, total, order)
+
+    def _set(self, name, total, order=None):
+        if order is not None:
+            self._order[name] = order
+            self._next_order = max(self._next_order, order + 1)
+        elif name not in self._order:
+            self._order[name] = self._next_order
+            self._next_order += 1
+        old = self._keys.get(name)
+        key = (-total, self._order[name])
+        if old == key:
+            return
+        if old is not None:
+            self._delete(old)
+        self._insert(key, name)
+        self._keys[name] = key
+
+    def record(self, session_id, name, reps, ended=False):
+        """Apply a session's latest rep count; the member's total moves by the change"""
+        with self._lock:
+            delta = reps - self._sessions.get(session_id, 0)
+            if ended:
+                self._sessions.pop(session_id, None)
+            else:
+                self._sessions[session_id] = reps
+            if delta or name not in self._keys:
+                total = -self._keys[name][0] if name in self._keys else 0
+                self._set(name, total + delta)
+
+    def warm(self, storage):
+        """Load every member's total from the user rollup"""
+        totals = storage.query("rank_totals")
+        with self._lock:
+            for user_id, name, total in totals.itertuples(index=False):
+                self._set(name, int(total), int(user_id))
+
+    # ------------------- Lookups -------------------
+    def rank(self, name):
+        """1-based position of ``name``, or None if they have no reps logged"""
+        with self._lock:
+            key = self._keys.get(name)
+            return self._rank_of(key) if key is not None else None
+
+    def top(self, k):
+        """(rank, name, total) for the first ``k`` members"""
+        with self._lock:
+            return self._entries_from(1, k)
+
+    def around(self, name, radius=2):
+        """(rank, name, total) for ``name`` and up to ``radius`` members either side"""
+        with self._lock:
+            key = self._keys.get(name)
+            if key is None:
+                return []
+            rank = self._rank_of(key)
+            first = max(1, rank - radius)
+            return self._entries_from(first, rank + radius - first + 1)
+
+
+_ranks = None
+_ranks_lock = threading.Lock()
+
+
+def shared_ranks():
+    """The process-wide RankIndex, warmed from the database on first use"""
+    global _ranks
+    with _ranks_lock:
+        if _ranks is None:
+            _ranks = RankIndex()
+            _ranks.warm(shared_storage())
+        return _ranks
@@ -0,0 +1,87 @@
+"""Skeleton and HUD drawing straight from the landmark array.
+
+The skeleton is projected to pixels in one NumPy operation and drawn with one
+``cv2.polylines`` call for the bones (plus one for the joints). HUD text
+lines are rendered once into cached alpha overlays and blended onto each
+frame, so a line is only re-rasterised when its text, size or colour changes.
+"""
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from coach.landmarks import POSE_CONNECTIONS, VISIBILITY, X, Y
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+HUD_CACHE_SIZE = 64  # distinct text lines kept rendered per overlay
+
+
+def draw_skeleton(image, landmarks, line_color=(0, 255, 0), point_color=None,
+                  thickness=2, radius=2, min_visibility=0.5):
+    """Draw bones (and optionally joints) for landmarks at least ``min_visibility`` visible"""
+    height, width = image.shape[:2]
+    pixels = (landmarks[:, [X, Y]] * (width, height)).astype(np.int32)
+    visible = landmarks[:, VISIBILITY] >= min_visibility
+
+    bones = POSE_CONNECTIONS[visible[POSE_CONNECTIONS].all(axis=1)]
+    if len(bones):
+        cv2.polylines(image, pixels[bones], False, line_color, thickness, cv2.LINE_AA)
+
+    if point_color is not None and visible.any():
+        # A zero-length segment with a thick pen is a filled dot
+        joints = np.repeat(pixels[visible][:, None, :], 2, axis=1)
+        cv2.polylines(image, joints, False, point_color, 2 * radius + thickness, cv2.LINE_AA)
+    return image
+
+
+class HudText:
+    """Cached text overlay: ``draw`` takes the cv2.putText arguments for each line
+
+    Each distinct (text, scale, color, thickness) is rasterised once into an
+    alpha overlay; drawing a frame then only blends each overlay in with two
+    in-place uint8 operations over the text's bounding box.
+    """
+
+    def __init__(self, cache_size=HUD_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._lines = OrderedDict()
+        self.rendered = 0
+
+    def _line(self, text, scale, color, thickness):
+        key = (text, scale, color, thickness)
+        line = self._lines.get(key)
+        if line is not None:
+            self._lines.move_to_end(key)
+            return line
+        (width, height), baseline = cv2.getTextSize(text, FONT, scale, thickness)
+        # Rasterise with a generous margin, then crop to the ink
+        pad = height + thickness
+        canvas = np.zeros((height + baseline + 2 * pad, width + 2 * pad), dtype=np.uint8)
+        cv2.putText(canvas, text, (pad, pad + height), FONT, scale, 255, thickness)
+        left, top, w, h = cv2.boundingRect(canvas)
+        alpha = canvas[top:top + h, left:left + w, None].astype(np.float32) / 255
+        # frame = frame * (1 - alpha) + color * alpha, as two saturating uint8 ops
+        keep = np.rint(255 * (1 - alpha)).astype(np.uint8).repeat(3, axis=2)
+        ink = np.rint(alpha * np.array(color, dtype=np.float32)).astype(np.uint8)
+        # Offset of the putText origin from the overlay's top-left corner
+        line = (keep, ink, (pad - left, pad + height - top))
+        self._lines[key] = line
+        self.rendered += 1
+        if len(self._lines) > self.cache_size:
+            self._lines.popitem(last=False)
+        return line
+
+    def draw(self, image, lines):
+        """Stamp ``(text, (x, y), scale, color, thickness)`` lines onto ``image``"""
+        height, width = image.shape[:2]
+        for text, (x, y), scale, color, thickness in lines:
+            keep, ink, (ax, ay) = self._line(text, scale, tuple(color), thickness)
+            top, left = y - ay, x - ax
+            y0, x0 = max(top, 0), max(left, 0)
+            y1, x1 = min(top + ink.shape[0], height), min(left + ink.shape[1], width)
+            if y0 < y1 and x0 < x1:
+                crop = (slice(y0 - top, y1 - top), slice(x0 - left, x1 - left))
+                region = image[y0:y1, x0:x1]
+                cv2.multiply(region, keep[crop], dst=region, scale=1 / 255)
+                cv2.add(region, ink[crop], dst=region)
+        return image
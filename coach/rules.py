@@ -0,0 +1,368 @@
+"""Declarative exercise rules compiled into small array programs.
+
+Exercises are data (coach/exercises.json), grouped into one catalog per page.
+Each exercise names its measures, the zones those measures can be in, stage
+transitions, form checks, coaching cues and safety alerts:
+
+    measures     name -> ["angle", A, B, C]  angle at B
+                 name -> ["dx" | "dy" | "absdx" | "absdy", P, Q]  Q minus P
+    zones        name -> {measure: [lo, hi], ..., "band": b}
+                 open ranges, null for unbounded; a zone that held on the
+                 previous frame is widened by ``band`` on both sides
+    transitions  [{"from": [stage, ...], "to": stage, "when": refs,
+                   "reps": n, "say": text}]  first match wins, "from" omitted = any
+    checks       [{"if": refs, "pass": refs, "points": n, "text": text}]
+    cues         [{"when": refs, "text": text}]  first match, else "default_cue"
+    alerts       [{"when": refs, "text": text, "penalty": n}]
+
+``refs`` is a zone name or a list of them that must all hold; a leading "!"
+negates a zone. Points are landmark names from coach.landmarks or virtual
+points declared under the top-level "points" key as weighted sums of
+landmarks. Texts may use {reps} and {<measure>} format fields. Sections set
+on the catalog itself are shared by all of its exercises.
+
+Landmarks are smoothed before measuring (coach.smoothing); "smoothing" sets
+the filter's min_cutoff, beta and d_cutoff for a catalog or exercise.
+
+Every exercise is compiled once into index and threshold arrays. A session
+evaluates only the selected exercise, in a handful of NumPy operations per
+frame, so adding exercises to the catalog costs nothing at run time.
+"""
+import json
+import os
+import time
+from functools import lru_cache
+from types import SimpleNamespace
+
+import numpy as np
+
+from coach import landmarks as lm
+from coach.angles import joint_angles
+from coach.smoothing import OneEuroFilter
+
+CATALOG_PATH = os.path.join(os.path.dirname(__file__), "exercises.json")
+
+# Landmark name -> row of the landmark array
+LANDMARK_INDEX = {name: value for name, value in vars(lm).items()
+                  if name.isupper() and isinstance(value, int)
+                  and name not in ("NUM_LANDMARKS", "X", "Y", "Z", "VISIBILITY")}
+
+# Measure kind -> (axis, absolute)
+DIFF_KINDS = {"dx": (lm.X, False), "dy": (lm.Y, False), "absdx": (lm.X, True), "absdy": (lm.Y, True)}
+
+SHARED_SECTIONS = ("measures", "zones", "transitions", "checks", "cues", "alerts", "smoothing")
+
+
+def whole_reps(reps):
+    """Completed reps in a running total built from fractional steps
+
+    Ten steps of 0.1 sum to 0.9999999999999999, so round off float noise
+    before truncating.
+    """
+    return int(round(reps, 6))
+
+
+def _refs(value):
+    """Normalise a zone reference (name, list of names or None) to a tuple"""
+    if value is None:
+        return ()
+    if isinstance(value, str):
+        return (value,)
+    return tuple(value)
+
+
+class _Text:
+    """Feedback or speech text, formatted only when it has fields"""
+
+    def __init__(self, text):
+        self.text = text
+        self.dynamic = "{" in text
+
+    def render(self, reps, measures):
+        if not self.dynamic:
+            return self.text
+        return self.text.format(reps=whole_reps(reps), **measures())
+
+
+class ExerciseProgram:
+    """One exercise compiled into index and threshold arrays"""
+
+    def __init__(self, name, spec, virtual_points):
+        self.name = name
+        self.angle_method = spec.get("angle_method", "arctan2")
+        self.smoothing = dict(spec.get("smoothing", {}))
+        self._virtual_specs = virtual_points
+        self._virtual = []
+        self._compile_measures(spec.get("measures", {}))
+        self._compile_zones(spec.get("zones", {}))
+
+        self._conditions = {}
+        self._literals = []
+        self.stages = [spec.get("start")]
+        self._compile_transitions(spec.get("transitions", []))
+        self._compile_checks(spec.get("checks", []))
+        self._compile_cues(spec.get("cues", []), spec.get("default_cue"))
+        self._compile_alerts(spec.get("alerts", []))
+        self._compile_conditions()
+
+    # ------------------- Compilation -------------------
+    def _error(self, message):
+        return ValueError(f"{self.name}: {message}")
+
+    def _point(self, name):
+        if name in LANDMARK_INDEX:
+            return LANDMARK_INDEX[name]
+        if name not in self._virtual_specs:
+            raise self._error(f"unknown point {name!r}")
+        if name not in self._virtual:
+            self._virtual.append(name)
+        return lm.NUM_LANDMARKS + self._virtual.index(name)
+
+    def _compile_measures(self, measures):
+        angles, diffs = [], []
+        for name, (kind, *points) in measures.items():
+            if kind == "angle" and len(points) == 3:
+                angles.append((name, [self._point(p) for p in points]))
+            elif kind in DIFF_KINDS and len(points) == 2:
+                diffs.append((name, [self._point(p) for p in points], *DIFF_KINDS[kind]))
+            else:
+                raise self._error(f"bad measure {name!r}: {[kind, *points]}")
+
+        self.measure_names = [name for name, _ in angles] + [name for name, *_ in diffs]
+        self.angle_table = np.array([points for _, points in angles], dtype=np.intp).reshape(-1, 3)
+        self.diff_points = np.array([points for _, points, *_ in diffs], dtype=np.intp).reshape(-1, 2)
+        self.diff_axis = np.array([axis for *_, axis, _ in diffs], dtype=np.intp)
+        self.diff_abs = np.array([absolute for *_, absolute in diffs], dtype=bool)
+
+        weights = np.zeros((len(self._virtual), lm.NUM_LANDMARKS))
+        offsets = np.zeros((len(self._virtual), 2))
+        for row, name in enumerate(self._virtual):
+            spec = self._virtual_specs[name]
+            for landmark, weight in spec["weights"].items():
+                weights[row, LANDMARK_INDEX[landmark]] = weight
+            offsets[row] = spec.get("offset", (0.0, 0.0))
+        self.virtual_weights = weights
+        self.virtual_offsets = offsets
+        self.num_points = lm.NUM_LANDMARKS + len(self._virtual)
+
+    def _compile_zones(self, zones):
+        measure_index = {name: i for i, name in enumerate(self.measure_names)}
+        self.zone_names = list(zones)
+        measure, lo, hi, band, starts = [], [], [], [], []
+        for name, spec in zones.items():
+            ranges = {key: value for key, value in spec.items() if key != "band"}
+            if not ranges:
+                raise self._error(f"zone {name!r} has no ranges")
+            starts.append(len(measure))
+            for measure_name, (low, high) in ranges.items():
+                if measure_name not in measure_index:
+                    raise self._error(f"zone {name!r} uses unknown measure {measure_name!r}")
+                measure.append(measure_index[measure_name])
+                lo.append(-np.inf if low is None else low)
+                hi.append(np.inf if high is None else high)
+                band.append(spec.get("band", 0.0))
+
+        self.pred_measure = np.array(measure, dtype=np.intp)
+        self.pred_lo = np.array(lo, dtype=np.float64)
+        self.pred_hi = np.array(hi, dtype=np.float64)
+        self.pred_band = np.array(band, dtype=np.float64)
+        self.zone_starts = np.array(starts, dtype=np.intp)
+        self.pred_zone = np.repeat(np.arange(len(starts)), np.diff(starts + [len(measure)]))
+
+    def _condition(self, refs):
+        """Intern a conjunction of zone references, returning its index"""
+        refs = _refs(refs)
+        if refs not in self._conditions:
+            literals = []
+            for ref in refs:
+                zone = ref.lstrip("!")
+                if zone not in self.zone_names:
+                    raise self._error(f"unknown zone {zone!r}")
+                literals.append((self.zone_names.index(zone), ref.startswith("!")))
+            self._conditions[refs] = len(self._conditions)
+            self._literals.append(literals)
+        return self._conditions[refs]
+
+    def _stage(self, name):
+        if name not in self.stages:
+            self.stages.append(name)
+        return self.stages.index(name)
+
+    def _compile_transitions(self, transitions):
+        rules = []
+        for rule in transitions:
+            sources = [self._stage(stage) for stage in rule["from"]] if "from" in rule else None
+            rules.append((sources, self._stage(rule["to"]), self._condition(rule.get("when")),
+                          rule.get("reps", 0), _Text(rule["say"]) if rule.get("say") else None))
+
+        self.trans_from = np.zeros((len(rules), len(self.stages)), dtype=bool)
+        for row, (sources, *_) in enumerate(rules):
+            self.trans_from[row, slice(None) if sources is None else sources] = True
+        self.trans_to = np.array([to for _, to, *_ in rules], dtype=np.intp)
+        self.trans_cond = np.array([cond for _, _, cond, *_ in rules], dtype=np.intp)
+        self.trans_reps = [reps for *_, reps, _ in rules]
+        self.trans_say = [say for *_, say in rules]
+
+    def _compile_checks(self, checks):
+        self.check_gate = np.array([self._condition(check.get("if")) for check in checks], dtype=np.intp)
+        self.check_pass = np.array([self._condition(check["pass"]) for check in checks], dtype=np.intp)
+        self.check_points = np.array([check.get("points", 1) for check in checks], dtype=np.float64)
+        self.check_text = [_Text(check["text"]) for check in checks]
+
+    def _compile_cues(self, cues, default):
+        self.cue_cond = np.array([self._condition(cue["when"]) for cue in cues], dtype=np.intp)
+        self.cue_text = [_Text(cue["text"]) for cue in cues]
+        self.default_cue = _Text(default) if default else None
+
+    def _compile_alerts(self, alerts):
+        self.alert_cond = np.array([self._condition(alert["when"]) for alert in alerts], dtype=np.intp)
+        self.alert_penalty = np.array([alert.get("penalty", 0) for alert in alerts], dtype=np.float64)
+        self.alert_text = [_Text(alert["text"]) for alert in alerts]
+
+    def _compile_conditions(self):
+        # Condition c holds when every literal in its row of cond_literals holds
+        flat = [literal for literals in self._literals for literal in literals]
+        self.lit_zone = np.array([zone for zone, _ in flat], dtype=np.intp)
+        self.lit_negate = np.array([negate for _, negate in flat], dtype=bool)
+        self.cond_literals = np.zeros((len(self._literals), len(flat)), dtype=bool)
+        column = 0
+        for row, literals in enumerate(self._literals):
+            self.cond_literals[row, column:column + len(literals)] = True
+            column += len(literals)
+
+    # ------------------- Evaluation -------------------
+    def measure(self, landmarks, points, out):
+        """Fill ``out`` with every measure for this frame"""
+        xy = landmarks[:, :2]
+        points[:lm.NUM_LANDMARKS] = xy
+        if len(self.virtual_weights):
+            np.matmul(self.virtual_weights, xy, out=points[lm.NUM_LANDMARKS:])
+            points[lm.NUM_LANDMARKS:] += self.virtual_offsets
+
+        n_angles = len(self.angle_table)
+        out[:n_angles] = joint_angles(points, self.angle_table, self.angle_method)
+        diffs = (points[self.diff_points[:, 1], self.diff_axis]
+                 - points[self.diff_points[:, 0], self.diff_axis])
+        out[n_angles:] = np.where(self.diff_abs, np.abs(diffs), diffs)
+        return out
+
+    def zones(self, values, held):
+        """Which zones hold, widening the ones in ``held`` by their band"""
+        if not len(self.pred_measure):
+            return np.zeros(0, dtype=bool)
+        widen = self.pred_band * held[self.pred_zone]
+        measured = values[self.pred_measure]
+        inside = (measured > self.pred_lo - widen) & (measured < self.pred_hi + widen)
+        return np.logical_and.reduceat(inside, self.zone_starts)
+
+    def conditions(self, zones):
+        literals = zones[self.lit_zone] != self.lit_negate
+        return ~(self.cond_literals & ~literals).any(axis=1)
+
+
+@lru_cache(maxsize=None)
+def load_catalog(path=CATALOG_PATH):
+    """Compile every exercise in the catalog file: {catalog: {exercise: ExerciseProgram}}"""
+    with open(path, encoding="utf-8") as f:
+        spec = json.load(f)
+
+    virtual_points = spec.get("points", {})
+    catalogs = {}
+    for catalog_name, catalog in spec["catalogs"].items():
+        shared = {key: value for key, value in catalog.items() if key != "exercises"}
+        programs = {}
+        for name, exercise in catalog["exercises"].items():
+            merged = dict(shared, **exercise)
+            for key in SHARED_SECTIONS:
+                if key in shared and key in exercise:
+                    if isinstance(shared[key], dict):
+                        merged[key] = dict(shared[key], **exercise[key])
+                    else:
+                        merged[key] = shared[key] + exercise[key]
+            programs[name] = ExerciseProgram(name, merged, virtual_points)
+        catalogs[catalog_name] = programs
+    return catalogs
+
+
+def spoken_phrases(catalog, path=CATALOG_PATH):
+    """Every transition "say" text in a catalog, unformatted, for pre-rendering speech"""
+    return sorted({say.text for program in load_catalog(path)[catalog].values()
+                   for say in program.trans_say if say is not None})
+
+
+class RuleSession:
+    """Per-stream state for one catalog: selected exercise, stage, reps and safety score"""
+
+    def __init__(self, catalog, path=CATALOG_PATH):
+        self.programs = load_catalog(path)[catalog]
+        self.program = None
+        self.exercise = None
+        self.reps = 0
+        self.stage = None
+        self.safety_score = 100
+
+    def select(self, exercise):
+        """Switch exercises (reps carry over); False if the catalog has no such exercise"""
+        if exercise != self.exercise:
+            self.exercise = exercise
+            self.program = self.programs.get(exercise)
+            if self.program is not None:
+                program = self.program
+                self._points = np.zeros((program.num_points, 2))
+                self._values = np.zeros(len(program.measure_names))
+                self._held = np.zeros(len(program.zone_names))
+                self._stage = 0
+                self.stage = program.stages[0]
+                self._filter = OneEuroFilter(**program.smoothing)
+        return self.program is not None
+
+    def step(self, landmarks, timestamp=None):
+        """Evaluate the selected exercise on one (33, 4) landmark array
+
+        ``timestamp`` (seconds) drives the smoothing filter; recorded video
+        should pass its frame times, live streams can leave the clock to it.
+        """
+        program = self.program
+        if program is None:
+            return None
+
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        landmarks = self._filter(landmarks, timestamp)
+        values = program.measure(landmarks, self._points, self._values)
+        zones = program.zones(values, self._held)
+        self._held[:] = zones
+        conditions = program.conditions(zones)
+
+        def measures():
+            return dict(zip(program.measure_names, values.tolist()))
+
+        say = None
+        fire = conditions[program.trans_cond] & program.trans_from[:, self._stage] \
+            & (program.trans_to != self._stage)
+        if fire.any():
+            rule = int(fire.argmax())
+            self._stage = int(program.trans_to[rule])
+            self.stage = program.stages[self._stage]
+            self.reps += program.trans_reps[rule]
+            if program.trans_say[rule] is not None:
+                say = program.trans_say[rule].render(self.reps, measures)
+
+        gated = conditions[program.check_gate]
+        passed = gated & conditions[program.check_pass]
+        total = program.check_points[gated].sum()
+        accuracy = program.check_points[passed].sum() / total * 100 if total else 100.0
+        feedback = [program.check_text[i].render(self.reps, measures)
+                    for i in np.flatnonzero(gated & ~passed)]
+
+        cues = conditions[program.cue_cond]
+        if cues.any():
+            feedback.append(program.cue_text[int(cues.argmax())].render(self.reps, measures))
+        elif program.default_cue is not None:
+            feedback.append(program.default_cue.render(self.reps, measures))
+
+        active = conditions[program.alert_cond]
+        alerts = [program.alert_text[i].render(self.reps, measures) for i in np.flatnonzero(active)]
+        self.safety_score = max(0, self.safety_score - int(program.alert_penalty[active].sum()))
+
+        return SimpleNamespace(stage=self.stage, reps=self.reps, feedback=feedback,
+                               accuracy=float(accuracy), alerts=alerts, say=say)
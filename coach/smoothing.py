@@ -0,0 +1,59 @@
+"""One-Euro smoothing over the whole landmark array.
+
+Raw landmarks, the lite model's especially, jitter by a few pixels from frame
+to frame, enough to flip a joint angle back and forth across a threshold.
+A One-Euro filter is an exponential filter whose cutoff rises with speed:
+still poses get heavy smoothing, fast reps stay responsive. Every x, y, z
+coordinate is filtered at once with per-element cutoffs; visibility passes
+through. With ``beta=0`` it is plain exponential smoothing.
+"""
+import math
+
+import numpy as np
+
+from coach.landmarks import NUM_LANDMARKS, VISIBILITY
+
+MIN_CUTOFF = 1.5  # Hz, cutoff for a landmark at rest
+BETA = 5.0  # cutoff added per normalised unit/sec of landmark speed
+D_CUTOFF = 1.0  # Hz, cutoff for the speed estimate itself
+MAX_GAP = 0.5  # seconds without landmarks after which the filter starts over
+
+
+def _alpha(cutoff, dt):
+    """Smoothing factor for a first-order low-pass at ``cutoff`` Hz (scalar or array)"""
+    return 1.0 / (1.0 + 1.0 / (2 * math.pi * cutoff * dt))
+
+
+class OneEuroFilter:
+    """Speed-adaptive low-pass over a (33, 4) landmark array"""
+
+    def __init__(self, min_cutoff=MIN_CUTOFF, beta=BETA, d_cutoff=D_CUTOFF):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.value = np.zeros((NUM_LANDMARKS, 4), dtype=np.float32)
+        self._speed = np.zeros((NUM_LANDMARKS, 3), dtype=np.float32)
+        self.last_time = None
+
+    def reset(self):
+        self._speed[:] = 0
+        self.last_time = None
+
+    def __call__(self, landmarks, timestamp):
+        """Filter one frame; returns the filter's own array (valid until the next call)"""
+        dt = None if self.last_time is None else timestamp - self.last_time
+        self.last_time = timestamp
+        self.value[:, VISIBILITY] = landmarks[:, VISIBILITY]
+        if dt is None or dt > MAX_GAP:
+            self.value[:, :3] = landmarks[:, :3]
+            self._speed[:] = 0
+            return self.value
+        if dt <= 0:
+            return self.value
+
+        position = self.value[:, :3]
+        delta = landmarks[:, :3] - position
+        self._speed += _alpha(self.d_cutoff, dt) * (delta / dt - self._speed)
+        cutoff = self.min_cutoff + self.beta * np.abs(self._speed)
+        position += _alpha(cutoff, dt) * delta
+        return self.value
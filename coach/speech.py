@@ -0,0 +1,218 @@
+"""One text-to-speech worker per process, fed by a bounded priority queue.
+
+Pages and video processors call ``say`` from any thread; it never blocks on
+the speech engine. A single worker thread owns the pyttsx3 engine and speaks
+one phrase at a time:
+
+* a phrase already waiting is not queued twice,
+* each phrase (or caller-chosen key) has a cooldown, so per-rep callouts
+  and repeated alerts can't pile up,
+* safety alerts jump the queue, drop waiting coaching lines and cut off a
+  coaching line that is being spoken,
+* lines that waited too long to still be relevant are dropped unspoken.
+
+Phrases are rendered once to clips (see coach.voice_clips). A phrase said
+with a ``sink`` (a session's coach.audio_out.VoiceMixer) goes to that
+member's browser. Queueing, cooldowns and alerts are then scoped to that
+session, and the worker never waits for the clip to finish. Without a sink
+the phrase plays on the server: from its clip if simpleaudio is installed,
+otherwise synthesised as it is spoken.
+"""
+import heapq
+import itertools
+import threading
+import time
+
+import pyttsx3
+
+from coach.voice_clips import ClipCache
+
+try:
+    import simpleaudio
+except ImportError:  # no player: every phrase is synthesised as it is spoken
+    simpleaudio = None
+
+# ------------------- Speech Settings -------------------
+ALERT = 0  # safety alerts and emergency messages
+COACHING = 1  # rep callouts, cues and greetings
+
+QUEUE_SIZE = 8  # phrases waiting at most; the least urgent, oldest one goes first
+DEFAULT_COOLDOWN = 2.0  # seconds before the same phrase (or key) may be queued again
+STALE_AFTER = {ALERT: 10.0, COACHING: 3.0}  # seconds a phrase may wait before it is dropped
+
+# Engine properties per page catalog; clips are rendered for exactly these
+VOICES = {
+    "gym": {"rate": 160},
+    "senior": {"rate": 150, "volume": 0.8},  # slower speech for clarity
+    "pregnancy": {"rate": 140, "volume": 0.8},  # calm, clear speech
+}
+
+
+class SpeechQueue:
+    """Bounded priority queue in front of a single pyttsx3 worker thread"""
+
+    def __init__(self, maxsize=QUEUE_SIZE):
+        self.maxsize = maxsize
+        self._heap = []  # (priority, seq, text, deadline, voice, sink)
+        self._pending = {}  # (sink, text) -> heap entry
+        self._preload = []  # (phrase, voice) to render while idle
+        self._last = {}  # (sink, cooldown key) -> monotonic time last accepted
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._speaking = None  # priority of the phrase being spoken
+        self._interrupt = False
+        self.clips = None
+        self.stats = {"spoken": 0, "coalesced": 0, "cooled_down": 0, "evicted": 0,
+                      "stale": 0, "interrupted": 0, "errors": 0}
+
+    def say(self, text, priority=COACHING, key=None, cooldown=DEFAULT_COOLDOWN, voice=None, sink=None):
+        """Queue ``text``; returns False if it was coalesced, cooling down or crowded out
+
+        ``voice`` holds engine properties (rate, volume) for this phrase;
+        ``sink`` is the session mixer to send it to (None: the server's speakers).
+        """
+        now = time.monotonic()
+        key = (sink, text if key is None else key)
+        with self._cond:
+            if (sink, text) in self._pending:
+                self.stats["coalesced"] += 1
+                return False
+            last = self._last.get(key)
+            if last is not None and now - last < cooldown:
+                self.stats["cooled_down"] += 1
+                return False
+
+            if priority == ALERT:
+                self._drop_coaching(sink)
+                if sink is None and self._speaking is not None and self._speaking > ALERT:
+                    self._interrupt = True
+            if len(self._heap) >= self.maxsize and not self._evict(priority):
+                self.stats["evicted"] += 1
+                return False
+
+            entry = (priority, next(self._seq), text, now + STALE_AFTER.get(priority, STALE_AFTER[COACHING]),
+                     voice or {}, sink)
+            heapq.heappush(self._heap, entry)
+            self._pending[(sink, text)] = entry
+            self._last[key] = now
+            if len(self._last) > 256:
+                self._last = {k: t for k, t in self._last.items() if now - t < 60}
+            self._start()
+            self._cond.notify()
+        return True
+
+    def _start(self):
+        # Called with the lock held
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="speech", daemon=True)
+            self._thread.start()
+
+    def preload(self, phrases, voice=None):
+        """Render ``phrases`` to clips while the worker is idle"""
+        with self._cond:
+            self._preload.extend((phrase, voice or {}) for phrase in phrases)
+            self._start()
+            self._cond.notify()
+
+    def _drop_coaching(self, sink):
+        kept = [entry for entry in self._heap if entry[0] == ALERT or entry[5] is not sink]
+        self.stats["evicted"] += len(self._heap) - len(kept)
+        self._heap = kept
+        heapq.heapify(self._heap)
+        self._pending = {(entry[5], entry[2]): entry for entry in kept}
+
+    def _evict(self, priority):
+        """Make room for a ``priority`` phrase by dropping the least urgent, oldest one"""
+        victim = max(self._heap, key=lambda entry: (entry[0], -entry[1]))
+        if victim[0] < priority:
+            return False
+        self._heap.remove(victim)
+        heapq.heapify(self._heap)
+        del self._pending[(victim[5], victim[2])]
+        self.stats["evicted"] += 1
+        return True
+
+    def _next(self):
+        """Block for the most urgent fresh phrase; preloads run only when none is waiting
+
+        Returns ``(priority, text, voice, sink)``, with priority None for a preload.
+        """
+        with self._cond:
+            while True:
+                while not self._heap:
+                    if self._preload:
+                        return (None, *self._preload.pop(0), None)
+                    self._cond.wait()
+                priority, _, text, deadline, voice, sink = heapq.heappop(self._heap)
+                del self._pending[(sink, text)]
+                if time.monotonic() > deadline:
+                    self.stats["stale"] += 1
+                    continue
+                if sink is None:
+                    self._speaking, self._interrupt = priority, False
+                return priority, text, voice, sink
+
+    def _play(self, clip):
+        playing = simpleaudio.play_buffer(clip.samples, 1, 2, clip.rate)
+        while playing.is_playing():
+            if self._interrupt:
+                self._interrupt = False
+                self.stats["interrupted"] += 1
+                playing.stop()
+                return
+            time.sleep(0.01)
+
+    def _on_word(self, name, location, length):
+        # Runs inside runAndWait, the one place pyttsx3 allows stopping an utterance
+        if self._interrupt:
+            self._interrupt = False
+            self.stats["interrupted"] += 1
+            self._engine.stop()
+
+    def _run(self):
+        self._engine = pyttsx3.init()
+        self._engine.connect("started-word", self._on_word)
+        defaults = {name: self._engine.getProperty(name) for name in ("rate", "volume")}
+        self.clips = ClipCache(self._engine)
+        while True:
+            priority, text, voice, sink = self._next()
+            voice = {**defaults, **voice}
+            try:
+                if priority is None:
+                    self.clips.add(text, voice)
+                elif sink is not None:
+                    sink.play(self.clips.get(text, voice), priority)
+                    self.stats["spoken"] += 1
+                elif simpleaudio is not None:
+                    self._play(self.clips.get(text, voice))
+                    self.stats["spoken"] += 1
+                else:
+                    for name, value in voice.items():
+                        self._engine.setProperty(name, value)
+                    self._engine.say(text)
+                    self._engine.runAndWait()
+                    self.stats["spoken"] += 1
+            except (RuntimeError, OSError, ValueError):
+                self.stats["errors"] += 1
+            finally:
+                with self._cond:
+                    self._speaking = None
+
+    def snapshot(self):
+        with self._cond:
+            clips = self.clips.stats if self.clips is not None else {}
+            return {"waiting": len(self._heap), **self.stats, **clips}
+
+
+_speech = None
+_speech_lock = threading.Lock()
+
+
+def shared_speech():
+    """The process-wide SpeechQueue"""
+    global _speech
+    with _speech_lock:
+        if _speech is None:
+            _speech = SpeechQueue()
+        return _speech
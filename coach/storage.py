@@ -0,0 +1,584 @@
+"""Shared SQLite access for every page and the rep writer.
+
+The database is opened once per process, in WAL mode with a busy timeout.
+Readers never block the writer and the writer never blocks readers. Writes
+go through one writer connection, serialised by a lock. Reads check out one
+of a few pooled reader connections. Pages no longer connect, create tables
+or close connections on every rerun.
+
+All SQL lives in QUERIES under a name, with parameters. Each pooled
+connection keeps its compiled statements in sqlite3's statement cache, so
+a query is prepared once per connection rather than on every call. Calls
+are timed per query name; see ``Storage.timings``.
+
+The schema is versioned with ``PRAGMA user_version``. Opening the database
+applies any pending MIGRATIONS in place, so an existing data/user_logs.db
+upgrades on first start. Rows carry integer user and exercise ids, an epoch
+timestamp and a day key. Covering indexes on (user, day) and (exercise,
+day) keep per-user queries to index range scans.
+
+Leaderboards and dashboards read rollup tables kept current by triggers, in
+the same transaction as each progress write. After a bulk load, or if the
+rollups are ever in doubt, recompute them from user_progress:
+
+    python -m coach.storage --rebuild-rollups
+
+Today, this-week and this-month leaderboards read per-user day counters
+that cover only the last WINDOW_DAYS days. The rep writer rolls expired
+days off once a day. A cron job can do the same:
+
+    python -m coach.storage --roll-off
+
+Read results are cached per (query, parameters) and stamped with a data
+version. Every write transaction bumps the version, so a cached result is
+served until something is written. Many members viewing an unchanged
+leaderboard run no SQL at all. The version counts this process's writes;
+the app writes only through its shared Storage.
+"""
+import argparse
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+import pandas as pd
+
+DB_PATH = os.path.join("data", "user_logs.db")
+READERS = 4  # pooled read connections
+CACHE_SIZE = 128  # query results kept, least recently used dropped first
+BUSY_TIMEOUT_MS = 5000  # how long a statement waits on a lock before failing
+EPOCH = date(1970, 1, 1)
+WINDOW_DAYS = 31  # days of per-user counters kept for windowed leaderboards
+
+# Leaderboard windows: first day key of each, given today's
+WINDOWS = {
+    "Today": lambda today: today,
+    "This week": lambda today: today - (today + 3) % 7,  # since Monday
+    "This month": lambda today: today - (EPOCH + timedelta(days=today)).day + 1,
+}
+
+# ------------------- Migrations -------------------
+# Applied in order; PRAGMA user_version records how many have run.
+# Version 1 is the original schema, so a fresh database and an old
+# data/user_logs.db take the same path to the current layout.
+LEGACY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_progress (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT,
+    exercise TEXT,
+    reps INTEGER,
+    date TEXT
+)
+"""
+
+V2_SCHEMA = """
+CREATE TABLE users (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE exercises (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+INSERT OR IGNORE INTO users (name) SELECT DISTINCT COALESCE(username, '') FROM user_progress;
+INSERT OR IGNORE INTO exercises (name) SELECT DISTINCT COALESCE(exercise, '') FROM user_progress;
+CREATE TABLE progress (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT UNIQUE,
+    user_id INTEGER NOT NULL REFERENCES users (id),
+    exercise_id INTEGER NOT NULL REFERENCES exercises (id),
+    reps INTEGER NOT NULL,
+    ts INTEGER NOT NULL,  -- epoch seconds
+    day INTEGER NOT NULL  -- local calendar day, counted from 1970-01-01
+);
+INSERT INTO progress (id, session_id, user_id, exercise_id, reps, ts, day)
+SELECT p.id, p.session_id, u.id, e.id, COALESCE(p.reps, 0),
+       COALESCE(CAST(strftime('%s', p.date, 'utc') AS INTEGER), 0),
+       COALESCE(CAST(julianday(date(p.date)) - 2440587.5 AS INTEGER), 0)
+FROM user_progress p
+JOIN users u ON u.name = COALESCE(p.username, '')
+JOIN exercises e ON e.name = COALESCE(p.exercise, '');
+DROP TABLE user_progress;
+ALTER TABLE progress RENAME TO user_progress;
+CREATE INDEX user_progress_user_day ON user_progress (user_id, day, exercise_id, reps, ts);
+CREATE INDEX user_progress_exercise_day ON user_progress (exercise_id, day, user_id, reps);
+"""
+
+
+# Rollups: per user, per (user, exercise) and per (user, day). Triggers on
+# user_progress keep them current in the same transaction as every write.
+# rebuild_rollups() recomputes them after a bulk load.
+V3_SCHEMA = """
+CREATE TABLE user_rollup (
+    user_id INTEGER PRIMARY KEY,
+    total_reps INTEGER NOT NULL,
+    sessions INTEGER NOT NULL,
+    active_days INTEGER NOT NULL,
+    first_day INTEGER NOT NULL,
+    last_day INTEGER NOT NULL
+);
+CREATE INDEX user_rollup_total ON user_rollup (total_reps DESC);
+CREATE TABLE user_exercise_rollup (
+    user_id INTEGER NOT NULL,
+    exercise_id INTEGER NOT NULL,
+    total_reps INTEGER NOT NULL,
+    sessions INTEGER NOT NULL,
+    last_ts INTEGER NOT NULL,
+    PRIMARY KEY (user_id, exercise_id)
+);
+CREATE TABLE user_day_rollup (
+    user_id INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    reps INTEGER NOT NULL,
+    sessions INTEGER NOT NULL,
+    PRIMARY KEY (user_id, day)
+)
+"""
+
+# One progress row joining the rollups; {row} is NEW or OLD
+ADD_ROW = """
+    INSERT INTO user_rollup (user_id, total_reps, sessions, active_days, first_day, last_day)
+    VALUES ({row}.user_id, {row}.reps, 1,
+            NOT EXISTS (SELECT 1 FROM user_day_rollup WHERE user_id = {row}.user_id AND day = {row}.day),
+            {row}.day, {row}.day)
+    ON CONFLICT (user_id) DO UPDATE SET
+        total_reps = total_reps + excluded.total_reps,
+        sessions = sessions + 1,
+        active_days = active_days + excluded.active_days,
+        first_day = MIN(first_day, excluded.first_day),
+        last_day = MAX(last_day, excluded.last_day);
+    INSERT INTO user_day_rollup (user_id, day, reps, sessions) VALUES ({row}.user_id, {row}.day, {row}.reps, 1)
+    ON CONFLICT (user_id, day) DO UPDATE SET reps = reps + excluded.reps, sessions = sessions + 1;
+    INSERT INTO user_exercise_rollup (user_id, exercise_id, total_reps, sessions, last_ts)
+    VALUES ({row}.user_id, {row}.exercise_id, {row}.reps, 1, {row}.ts)
+    ON CONFLICT (user_id, exercise_id) DO UPDATE SET
+        total_reps = total_reps + excluded.total_reps,
+        sessions = sessions + 1,
+        last_ts = MAX(last_ts, excluded.last_ts);
+"""
+
+# One progress row leaving the rollups; extremes are recomputed from what is left
+REMOVE_ROW = """
+    UPDATE user_day_rollup SET reps = reps - {row}.reps, sessions = sessions - 1
+    WHERE user_id = {row}.user_id AND day = {row}.day;
+    DELETE FROM user_day_rollup WHERE user_id = {row}.user_id AND day = {row}.day AND sessions = 0;
+    UPDATE user_rollup SET
+        total_reps = total_reps - {row}.reps,
+        sessions = sessions - 1,
+        active_days = (SELECT COUNT(*) FROM user_day_rollup WHERE user_id = {row}.user_id),
+        first_day = COALESCE((SELECT MIN(day) FROM user_day_rollup WHERE user_id = {row}.user_id), 0),
+        last_day = COALESCE((SELECT MAX(day) FROM user_day_rollup WHERE user_id = {row}.user_id), 0)
+    WHERE user_id = {row}.user_id;
+    DELETE FROM user_rollup WHERE user_id = {row}.user_id AND sessions = 0;
+    UPDATE user_exercise_rollup SET
+        total_reps = total_reps - {row}.reps,
+        sessions = sessions - 1,
+        last_ts = COALESCE((SELECT MAX(ts) FROM user_progress
+                            WHERE user_id = {row}.user_id AND exercise_id = {row}.exercise_id), 0)
+    WHERE user_id = {row}.user_id AND exercise_id = {row}.exercise_id;
+    DELETE FROM user_exercise_rollup
+    WHERE user_id = {row}.user_id AND exercise_id = {row}.exercise_id AND sessions = 0;
+"""
+
+SAME_KEYS = "OLD.user_id = NEW.user_id AND OLD.exercise_id = NEW.exercise_id AND OLD.day = NEW.day"
+
+ROLLUP_TRIGGERS = {
+    "user_progress_rollup_insert": "AFTER INSERT ON user_progress BEGIN" + ADD_ROW.format(row="NEW"),
+    "user_progress_rollup_delete": "AFTER DELETE ON user_progress BEGIN" + REMOVE_ROW.format(row="OLD"),
+    # The rep writer's in-place count updates: only the totals move
+    "user_progress_rollup_update": f"""AFTER UPDATE OF reps, ts ON user_progress WHEN {SAME_KEYS} BEGIN
+    UPDATE user_rollup SET total_reps = total_reps + NEW.reps - OLD.reps WHERE user_id = NEW.user_id;
+    UPDATE user_day_rollup SET reps = reps + NEW.reps - OLD.reps WHERE user_id = NEW.user_id AND day = NEW.day;
+    UPDATE user_exercise_rollup SET total_reps = total_reps + NEW.reps - OLD.reps, last_ts = MAX(last_ts, NEW.ts)
+    WHERE user_id = NEW.user_id AND exercise_id = NEW.exercise_id;
+""",
+    "user_progress_rollup_move": f"""AFTER UPDATE OF user_id, exercise_id, day ON user_progress
+WHEN NOT ({SAME_KEYS}) BEGIN""" + REMOVE_ROW.format(row="OLD") + ADD_ROW.format(row="NEW"),
+}
+
+REBUILD_ROLLUPS = """
+DELETE FROM user_rollup;
+DELETE FROM user_exercise_rollup;
+DELETE FROM user_day_rollup;
+INSERT INTO user_day_rollup (user_id, day, reps, sessions)
+SELECT user_id, day, SUM(reps), COUNT(*) FROM user_progress GROUP BY user_id, day;
+INSERT INTO user_rollup (user_id, total_reps, sessions, active_days, first_day, last_day)
+SELECT user_id, SUM(reps), SUM(sessions), COUNT(*), MIN(day), MAX(day) FROM user_day_rollup GROUP BY user_id;
+INSERT INTO user_exercise_rollup (user_id, exercise_id, total_reps, sessions, last_ts)
+SELECT user_id, exercise_id, SUM(reps), COUNT(*), MAX(ts) FROM user_progress GROUP BY user_id, exercise_id
+"""
+
+
+def _run_script(conn, script):
+    # executescript would commit the caller's transaction
+    for statement in script.split(";\n"):
+        if statement.strip():
+            conn.execute(statement)
+
+
+def rebuild_rollups(conn):
+    """Recompute every rollup from user_progress, inside the caller's transaction"""
+    _run_script(conn, REBUILD_ROLLUPS)
+    roll_off_windows(conn)
+
+
+# Windowed leaderboards: per-user counters for the last WINDOW_DAYS days
+# only, mirrored from user_day_rollup by triggers. A day, week or month
+# total sums at most WINDOW_DAYS rows per member, however long the
+# history. roll_off_windows() drops the days that can no longer fall in
+# a window.
+V4_SCHEMA = """
+CREATE TABLE window_counters (
+    day INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    reps INTEGER NOT NULL,
+    PRIMARY KEY (day, user_id)
+) WITHOUT ROWID
+"""
+
+WINDOW_TRIGGERS = {
+    "user_day_rollup_window_insert": """AFTER INSERT ON user_day_rollup BEGIN
+    INSERT INTO window_counters (day, user_id, reps) VALUES (NEW.day, NEW.user_id, NEW.reps)
+    ON CONFLICT (day, user_id) DO UPDATE SET reps = excluded.reps;
+""",
+    "user_day_rollup_window_update": """AFTER UPDATE OF reps ON user_day_rollup BEGIN
+    UPDATE window_counters SET reps = NEW.reps WHERE day = NEW.day AND user_id = NEW.user_id;
+""",
+    "user_day_rollup_window_delete": """AFTER DELETE ON user_day_rollup BEGIN
+    DELETE FROM window_counters WHERE day = OLD.day AND user_id = OLD.user_id;
+""",
+}
+
+
+def roll_off_windows(conn, today=None):
+    """Drop window counters older than any window can reach; returns the rows dropped"""
+    today = day_key(time.time()) if today is None else today
+    return conn.execute(QUERIES["roll_off_windows"], (today - WINDOW_DAYS,)).rowcount
+
+
+def _v1_legacy(conn):
+    """The original table, plus the session_id key the rep writer upserts on"""
+    conn.execute(LEGACY_SCHEMA)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(user_progress)")}
+    if "session_id" not in columns:
+        conn.execute("ALTER TABLE user_progress ADD COLUMN session_id TEXT")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS user_progress_session ON user_progress (session_id)")
+
+
+def _v2_normalised(conn):
+    """Integer user/exercise ids, epoch timestamps, a day key and covering indexes"""
+    _run_script(conn, V2_SCHEMA)
+
+
+def _v3_rollups(conn):
+    """Rollup tables, the triggers that maintain them and their initial contents"""
+    _run_script(conn, V3_SCHEMA)
+    for name, body in ROLLUP_TRIGGERS.items():
+        conn.execute(f"CREATE TRIGGER {name} {body}END")
+    _run_script(conn, REBUILD_ROLLUPS)
+
+
+def _v4_window_counters(conn):
+    """Recent per-user day counters for windowed leaderboards"""
+    conn.execute(V4_SCHEMA)
+    for name, body in WINDOW_TRIGGERS.items():
+        conn.execute(f"CREATE TRIGGER {name} {body}END")
+    conn.execute("INSERT INTO window_counters (day, user_id, reps) SELECT day, user_id, reps FROM user_day_rollup")
+    roll_off_windows(conn)
+
+
+MIGRATIONS = [_v1_legacy, _v2_normalised, _v3_rollups, _v4_window_counters]
+
+
+def migrate(conn):
+    """Bring the database up to the latest version; safe to call from several processes"""
+    isolation = conn.isolation_level
+    conn.isolation_level = None  # explicit transactions, DDL included
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for number, step in enumerate(MIGRATIONS[version:], start=version + 1):
+                step(conn)
+                conn.execute(f"PRAGMA user_version = {number}")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.isolation_level = isolation
+
+
+def day_key(ts):
+    """The ``day`` column for an epoch timestamp: local calendar days since 1970-01-01"""
+    return (date.fromtimestamp(ts) - EPOCH).days
+
+
+def window_range(window, today=None):
+    """(first day, last day) of a leaderboard window in WINDOWS"""
+    today = day_key(time.time()) if today is None else today
+    return WINDOWS[window](today), today
+
+
+# ------------------- Queries -------------------
+QUERIES = {
+    # ------------------- Writes -------------------
+    "add_user": "INSERT OR IGNORE INTO users (name) VALUES (?)",
+    "add_exercise": "INSERT OR IGNORE INTO exercises (name) VALUES (?)",
+    "upsert_progress": """
+        INSERT INTO user_progress (session_id, user_id, exercise_id, reps, ts, day)
+        VALUES (?, (SELECT id FROM users WHERE name = ?), (SELECT id FROM exercises WHERE name = ?), ?, ?, ?)
+        ON CONFLICT(session_id) DO UPDATE SET reps = excluded.reps, ts = excluded.ts, day = excluded.day
+    """,
+    "roll_off_windows": "DELETE FROM window_counters WHERE day <= ?",
+    # ------------------- Reads -------------------
+    # Dashboards read the rollups, so their cost follows the number of users
+    # (or of one user's days and exercises), not of rows ever logged.
+    "rank_totals": """
+        SELECT r.user_id, u.name, r.total_reps
+        FROM user_rollup r
+        JOIN users u ON u.id = r.user_id
+    """,
+    "progress_by_exercise": """
+        SELECT u.name as username, e.name as exercise, r.total_reps, r.sessions,
+               datetime(r.last_ts, 'unixepoch', 'localtime') as last_activity,
+               CAST(r.total_reps AS REAL) / r.sessions as avg_reps_per_session
+        FROM user_exercise_rollup r
+        JOIN users u ON u.id = r.user_id
+        JOIN exercises e ON e.id = r.exercise_id
+    """,
+    # Leaderboard pages: rank ties are broken by who got there first (user id)
+    "leaderboard_page": """
+        SELECT ROW_NUMBER() OVER (ORDER BY r.total_reps DESC, r.user_id) as rank,
+               u.name as username, r.total_reps, r.active_days,
+               date(r.last_day * 86400, 'unixepoch') as last_active
+        FROM user_rollup r
+        JOIN users u ON u.id = r.user_id
+        ORDER BY rank
+        LIMIT ? OFFSET ?
+    """,
+    # Windowed leaderboards over the recent day counters; params: first day, last day
+    "window_leaderboard_page": """
+        SELECT ROW_NUMBER() OVER (ORDER BY SUM(c.reps) DESC, c.user_id) as rank,
+               u.name as username, SUM(c.reps) as total_reps, COUNT(*) as active_days,
+               date(MAX(c.day) * 86400, 'unixepoch') as last_active
+        FROM window_counters c
+        JOIN users u ON u.id = c.user_id
+        WHERE c.day BETWEEN ? AND ? AND c.reps > 0
+        GROUP BY c.user_id
+        ORDER BY rank
+        LIMIT ? OFFSET ?
+    """,
+    "window_user_count": """
+        SELECT COUNT(DISTINCT user_id) as users
+        FROM window_counters
+        WHERE day BETWEEN ? AND ? AND reps > 0
+    """,
+    "user_rank": """
+        SELECT 1 + (SELECT COUNT(*) FROM user_rollup o
+                    WHERE o.total_reps > r.total_reps
+                       OR (o.total_reps = r.total_reps AND o.user_id < r.user_id)) as rank,
+               u.name as username, r.total_reps, r.active_days,
+               date(r.last_day * 86400, 'unixepoch') as last_active
+        FROM users u
+        JOIN user_rollup r ON r.user_id = u.id
+        WHERE u.name = ?
+    """,
+    "user_names": """
+        SELECT u.name as username
+        FROM user_rollup r
+        JOIN users u ON u.id = r.user_id
+        ORDER BY r.total_reps DESC, r.user_id
+    """,
+    "community_totals": """
+        SELECT COALESCE(SUM(total_reps), 0) as total_reps, COUNT(*) as total_users,
+               COALESCE(SUM(active_days), 0) as total_days,
+               COALESCE(AVG(total_reps), 0) as avg_reps_per_user
+        FROM user_rollup
+    """,
+    "user_totals": """
+        SELECT total_reps, active_days as total_days, sessions as total_sessions,
+               first_day as join_day, date(first_day * 86400, 'unixepoch') as join_date
+        FROM user_rollup
+        WHERE user_id = (SELECT id FROM users WHERE name = ?)
+    """,
+    "user_exercises": """
+        SELECT e.name as exercise, r.total_reps as exercise_reps, r.sessions
+        FROM user_exercise_rollup r
+        JOIN exercises e ON e.id = r.exercise_id
+        WHERE r.user_id = (SELECT id FROM users WHERE name = ?)
+        ORDER BY exercise_reps DESC
+    """,
+    # Chart series (coach.timeseries): reps per bucket for a user and day range.
+    # A bucket is keyed by its first day; weeks start on Monday.
+    "user_reps_by_day": """
+        SELECT day as bucket, date(day * 86400, 'unixepoch') as date, reps
+        FROM user_day_rollup
+        WHERE user_id = (SELECT id FROM users WHERE name = ?) AND day BETWEEN ? AND ?
+        ORDER BY day
+    """,
+    "user_reps_by_week": """
+        SELECT (day + 3) / 7 * 7 - 3 as bucket,
+               date(((day + 3) / 7 * 7 - 3) * 86400, 'unixepoch') as date, SUM(reps) as reps
+        FROM user_day_rollup
+        WHERE user_id = (SELECT id FROM users WHERE name = ?) AND day BETWEEN ? AND ?
+        GROUP BY (day + 3) / 7
+        ORDER BY bucket
+    """,
+    "user_reps_by_month": """
+        SELECT CAST(julianday(MIN(day) * 86400, 'unixepoch', 'start of month') - 2440587.5 AS INTEGER) as bucket,
+               date(MIN(day) * 86400, 'unixepoch', 'start of month') as date, SUM(reps) as reps
+        FROM user_day_rollup
+        WHERE user_id = (SELECT id FROM users WHERE name = ?) AND day BETWEEN ? AND ?
+        GROUP BY strftime('%Y-%m', day * 86400, 'unixepoch')
+        ORDER BY bucket
+    """,
+}
+
+
+class Storage:
+    """One writer connection and a small pool of readers over a WAL database"""
+
+    def __init__(self, path=DB_PATH, readers=READERS, cache_size=CACHE_SIZE):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._writer = self._connect()
+        migrate(self._writer)
+        self._write_lock = threading.Lock()
+        self._readers = queue.LifoQueue()
+        for _ in range(readers):
+            self._readers.put(self._connect())
+        self._timing_lock = threading.Lock()
+        self.timings = {}  # query name -> {"calls", "total_ms", "max_ms"}
+        self.version = 0  # bumped by every write transaction
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # (name, params) -> (version, DataFrame)
+        self._cache_lock = threading.Lock()
+        self.cache_stats = {"hits": 0, "misses": 0, "evicted": 0}
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        # Safe with WAL: a crash can lose the last commits, never corrupt the file
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def _timed(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            with self._timing_lock:
+                timing = self.timings.setdefault(name, {"calls": 0, "total_ms": 0.0, "max_ms": 0.0})
+                timing["calls"] += 1
+                timing["total_ms"] += elapsed
+                timing["max_ms"] = max(timing["max_ms"], elapsed)
+
+    @contextmanager
+    def reader(self):
+        """Check out a read connection for the duration of the block"""
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+    @contextmanager
+    def writer(self):
+        """The writer connection, inside one transaction"""
+        with self._write_lock:
+            try:
+                with self._writer:
+                    yield self._writer
+            finally:
+                self.version += 1  # results cached before this write are stale
+
+    def query(self, name, params=()):
+        """Run a named read query into a DataFrame, cached until the next write"""
+        key = (name, tuple(params))
+        version = self.version  # read first: a write landing mid-query leaves the entry stale
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] == version:
+                self._cache.move_to_end(key)
+                self.cache_stats["hits"] += 1
+                return entry[1].copy()
+            self.cache_stats["misses"] += 1
+        with self._timed(name), self.reader() as conn:
+            df = pd.read_sql_query(QUERIES[name], conn, params=params)
+        with self._cache_lock:
+            self._cache[key] = (version, df)
+            self._cache.move_to_end(key)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+                self.cache_stats["evicted"] += 1
+        return df.copy()  # pages add columns to what they get back
+
+    def execute_many(self, name, rows):
+        """Run a named write for every row in one transaction"""
+        self.write([(name, rows)])
+
+    def write(self, steps):
+        """Run several ``(name, rows)`` writes in order, in one transaction"""
+        with self.writer() as conn:
+            for name, rows in steps:
+                with self._timed(name):
+                    conn.executemany(QUERIES[name], rows)
+
+    def timing_stats(self):
+        """Calls, mean and worst time per named query"""
+        with self._timing_lock:
+            return pd.DataFrame([
+                {"query": name, "calls": t["calls"], "mean_ms": t["total_ms"] / t["calls"], "max_ms": t["max_ms"]}
+                for name, t in self.timings.items()
+            ], columns=["query", "calls", "mean_ms", "max_ms"])
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def shared_storage():
+    """The process-wide Storage, opened on first use"""
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            _storage = Storage()
+        return _storage
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m coach.storage", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--path", default=DB_PATH, help="database file (default: %(default)s)")
+    parser.add_argument("--rebuild-rollups", action="store_true", help="recompute the rollup tables")
+    parser.add_argument("--roll-off", action="store_true", help="drop expired window counters (for cron)")
+    args = parser.parse_args(argv)
+    storage = Storage(args.path, readers=1)  # opening it applies pending migrations
+    if args.roll_off:
+        with storage.writer() as conn:
+            print(f"{roll_off_windows(conn)} expired window counters dropped")
+        return 0
+    if not args.rebuild_rollups:
+        with storage.reader() as conn:
+            print(f"{args.path}: schema version {conn.execute('PRAGMA user_version').fetchone()[0]}")
+        return 0
+    start = time.perf_counter()
+    with storage.writer() as conn:
+        rebuild_rollups(conn)
+        users = conn.execute("SELECT COUNT(*) FROM user_rollup").fetchone()[0]
+    print(f"Rollups rebuilt for {users} users in {(time.perf_counter() - start) * 1000:.0f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""Progress chart series with a fixed size, however long the history.
+
+The bucket size follows the visible range. Up to a year is charted per day,
+up to five years per week and anything longer per month. The bucketing runs
+in SQL over the per-day rollup (coach.storage). A range that still has more
+than POINT_BUDGET buckets is thinned with Largest-Triangle-Three-Buckets
+(LTTB). LTTB keeps the peaks and dips a plain stride would skip, so what
+reaches Plotly is at most POINT_BUDGET points.
+"""
+import time
+
+import numpy as np
+
+from coach.storage import day_key
+
+POINT_BUDGET = 120  # points per chart
+
+# Chart ranges offered to members, in days (None: since their first session)
+RANGES = {"Last 30 days": 30, "Last 90 days": 90, "Last year": 365, "All time": None}
+
+# (widest span in days, bucket): the first bucket whose span fits is used
+BUCKETS = [(365, "day"), (5 * 365, "week"), (None, "month")]
+
+
+def bucket_for(span_days):
+    """The bucket size for a range of ``span_days`` days"""
+    for widest, bucket in BUCKETS:
+        if widest is None or span_days <= widest:
+            return bucket
+
+
+def lttb(x, y, threshold):
+    """Indices of ``threshold`` points that keep the visual shape of (x, y)
+
+    The first and last points are always kept. The rest are split into
+    ``threshold - 2`` buckets. Each bucket keeps the point that forms the
+    largest triangle with the last kept point and the next bucket's mean.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    keep = [0]
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_x, next_y = x[end:edges[i + 2]].mean(), y[end:edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        ax, ay = x[keep[-1]], y[keep[-1]]
+        area = np.abs((ax - next_x) * (y[start:end] - ay) - (ax - x[start:end]) * (next_y - ay))
+        keep.append(start + int(area.argmax()))
+    keep.append(n - 1)
+    return np.array(keep)
+
+
+def reps_series(storage, username, days=None, budget=POINT_BUDGET):
+    """Reps per bucket over the last ``days`` days; returns (DataFrame, bucket)
+
+    The frame has ``bucket`` (the bucket's first day key), ``date`` and ``reps``.
+    """
+    today = day_key(time.time())
+    if days is None:
+        totals = storage.query("user_totals", (username,))
+        first = int(totals.iloc[0]["join_day"]) if not totals.empty else today
+    else:
+        first = today - days + 1
+    bucket = bucket_for(today - first + 1)
+    series = storage.query(f"user_reps_by_{bucket}", (username, first, today))
+    if len(series) > budget:
+        series = series.iloc[lttb(series["bucket"], series["reps"], budget)].reset_index(drop=True)
+    return series, bucket
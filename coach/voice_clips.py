@@ -0,0 +1,179 @@
+"""Pre-rendered speech clips, played from memory instead of synthesised per phrase.
+
+Nearly everything the coach says is a fixed phrase from the exercise catalog,
+so the speech worker renders each one to PCM once, keyed by text, engine
+voice, rate and volume, and plays it straight from memory. Phrases with a
+count ("Perfect! {reps} pelvic tilts completed") are registered as
+templates. Their text pieces and the numbers up to MAX_COUNT are rendered
+once, and a spoken line is stitched together from them. Anything else lands
+in a small LRU tier.
+
+Rendered clips are also written to CLIP_DIR, so later start-ups only read
+files. To render every catalog phrase ahead of a deploy:
+
+    python -m coach.voice_clips
+"""
+import hashlib
+import os
+import re
+import sys
+import tempfile
+import wave
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import numpy as np
+
+CLIP_DIR = os.path.join("data", "voice_clips")
+LRU_SIZE = 64  # rendered clips kept for phrases that aren't pre-rendered
+MAX_COUNT = 30  # counts pre-rendered for templated phrases
+GAP_SECONDS = 0.05  # pause between stitched fragments
+SILENCE = 300  # int16 amplitude below which fragment edges are trimmed
+
+FIELD = re.compile(r"\{\w+\}")
+
+
+def read_wav(path):
+    """A mono int16 clip from a WAV file"""
+    with wave.open(path, "rb") as f:
+        if f.getsampwidth() != 2:
+            raise ValueError(f"{path}: expected 16-bit samples")
+        samples = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+        channels, rate = f.getnchannels(), f.getframerate()
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+    return SimpleNamespace(samples=samples, rate=rate)
+
+
+def write_wav(path, clip):
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(clip.rate)
+        f.writeframes(clip.samples.tobytes())
+
+
+def trim(samples):
+    """Cut leading and trailing silence, which every synthesised fragment has"""
+    loud = np.flatnonzero(np.abs(samples) > SILENCE)
+    if not len(loud):
+        return samples[:0]
+    return samples[loud[0]:loud[-1] + 1]
+
+
+class ClipCache:
+    """Clips rendered by one pyttsx3 engine; use it only from the engine's thread"""
+
+    def __init__(self, engine, clip_dir=CLIP_DIR, lru_size=LRU_SIZE):
+        self.engine = engine
+        self.clip_dir = clip_dir
+        self.lru_size = lru_size
+        self._fixed = {}
+        self._lru = OrderedDict()
+        self._templates = {}  # template -> (pattern, text pieces)
+        self._defaults = {name: engine.getProperty(name) for name in ("rate", "volume")}
+        self.stats = {"fixed_hits": 0, "lru_hits": 0, "composed": 0, "rendered": 0, "disk_loads": 0}
+
+    def _voice(self, voice):
+        """Fill in the engine's defaults, so a clip's key names every property it was rendered with"""
+        return {**self._defaults, **(voice or {})}
+
+    def _key(self, text, voice):
+        return (text, self.engine.getProperty("voice"), voice["rate"], voice["volume"])
+
+    def _path(self, key):
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:20]
+        return os.path.join(self.clip_dir, f"{digest}.wav")
+
+    def _render(self, key, text, voice):
+        path = self._path(key) if self.clip_dir else None
+        if path and os.path.exists(path):
+            self.stats["disk_loads"] += 1
+            return read_wav(path)
+        for name, value in voice.items():
+            self.engine.setProperty(name, value)
+        fd, scratch = tempfile.mkstemp(suffix=".wav")
+        os.close(fd)
+        try:
+            self.engine.save_to_file(text, scratch)
+            self.engine.runAndWait()
+            clip = read_wav(scratch)
+        finally:
+            os.remove(scratch)
+        self.stats["rendered"] += 1
+        if path:
+            os.makedirs(self.clip_dir, exist_ok=True)
+            write_wav(path, clip)
+        return clip
+
+    def add(self, text, voice=None):
+        """Render a fixed phrase, or a template's pieces and counts, ahead of time"""
+        voice = self._voice(voice)
+        if FIELD.search(text):
+            pieces = FIELD.split(text)
+            pattern = re.compile(r"(\d+)".join(re.escape(piece) for piece in pieces) + "$")
+            self._templates[text] = (pattern, pieces)
+            for fragment in [*pieces, *map(str, range(MAX_COUNT + 1))]:
+                if fragment.strip():
+                    self.add(fragment.strip(), voice)
+            return
+        key = self._key(text, voice)
+        if key not in self._fixed:
+            self._fixed[key] = self._render(key, text, voice)
+
+    def _compose(self, text, voice):
+        """Stitch a templated line from its rendered pieces, or None if no template fits"""
+        for pattern, pieces in self._templates.values():
+            match = pattern.match(text)
+            if match is None:
+                continue
+            fragments = []
+            for i, piece in enumerate(pieces):
+                fragments.append(piece.strip())
+                if i < len(match.groups()):
+                    fragments.append(match.group(i + 1))
+            clips = [self.get(fragment, voice) for fragment in fragments if fragment]
+            rate = clips[0].rate
+            gap = np.zeros(int(rate * GAP_SECONDS), dtype=np.int16)
+            joined = [part for clip in clips for part in (trim(clip.samples), gap)][:-1]
+            self.stats["composed"] += 1
+            return SimpleNamespace(samples=np.concatenate(joined), rate=rate)
+        return None
+
+    def get(self, text, voice=None):
+        """The clip for ``text``: pre-rendered, stitched from a template, cached or rendered now"""
+        voice = self._voice(voice)
+        key = self._key(text, voice)
+        clip = self._fixed.get(key)
+        if clip is not None:
+            self.stats["fixed_hits"] += 1
+            return clip
+        clip = self._lru.get(key)
+        if clip is not None:
+            self._lru.move_to_end(key)
+            self.stats["lru_hits"] += 1
+            return clip
+        clip = self._compose(text, voice) or self._render(key, text, voice)
+        self._lru[key] = clip
+        if len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+        return clip
+
+
+def main():
+    """Render every catalog phrase with its page's voice into CLIP_DIR"""
+    import pyttsx3
+
+    from coach.rules import spoken_phrases
+    from coach.speech import VOICES
+
+    cache = ClipCache(pyttsx3.init())
+    for catalog, voice in VOICES.items():
+        for phrase in spoken_phrases(catalog):
+            cache.add(phrase, voice)
+    print(f"{cache.stats['rendered']} clips rendered, {cache.stats['disk_loads']} already in {CLIP_DIR}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
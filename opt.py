@@ -1,10 +1,4 @@
-import os
-import sqlite3
+from coach.storage import shared_storage
 
-# Ensure the folder exists
-if not os.path.exists("data"):
-    os.makedirs("data")
-
-# Connect to SQLite database
-conn = sqlite3.connect("data/user_logs.db", check_same_thread=False)
-c = conn.cursor()
+# Opens data/user_logs.db in WAL mode and creates the schema; pages share this pool
+storage = shared_storage()
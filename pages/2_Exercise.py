@@ -1,14 +1,19 @@
 import streamlit as st
 import cv2
-import mediapipe as mp
-import numpy as np
-import pyttsx3
-import threading
-import sqlite3
 import os
 import random
-from datetime import datetime
+import pandas as pd
 from streamlit_webrtc import webrtc_streamer, VideoTransformerBase, RTCConfiguration
+from coach.audio_out import CoachAudioProcessor
+from coach.autotune import tuning_summary
+from coach.events import RepTracker, shared_writer
+from coach.frames import FramePipeline
+from coach.landmarks import mean_visibility
+from coach.pose_engine import BUSY_MESSAGE, PoseSession, prewarm
+from coach.ranking import shared_ranks
+from coach.render import HudText, draw_skeleton
+from coach.rules import RuleSession, spoken_phrases
+from coach.speech import COACHING, VOICES, shared_speech
 
 # ------------------- Page Setup -------------------
 st.set_page_config(page_title="AI Health & Fitness Coach", layout="wide")
@@ -16,58 +21,28 @@ st.title("🏋️ AI Health & Fitness Coach")
 st.write("Interactive AI fitness platform: posture correction, reps counting, heart-rate monitoring, gamification, and telehealth alerts.")
 
 # ------------------- Voice Engine -------------------
-engine = pyttsx3.init()
-engine.setProperty("rate", 160)
-def speak_async(text):
-    threading.Thread(target=lambda: engine.say(text) or engine.runAndWait()).start()
+# One shared speech worker per process (coach.speech)
+VOICE = VOICES["gym"]
+def speak_async(text, priority=COACHING, **options):
+    return shared_speech().say(text, priority, voice=VOICE, **options)
 
 # ------------------- MediaPipe Pose -------------------
-mp_pose = mp.solutions.pose
-pose = mp_pose.Pose(min_detection_confidence=0.5, min_tracking_confidence=0.5)
-
-# ------------------- Database -------------------
-if not os.path.exists("data"):
-    os.makedirs("data")
-conn = sqlite3.connect("data/user_logs.db", check_same_thread=False)
-c = conn.cursor()
-c.execute("""
-CREATE TABLE IF NOT EXISTS user_progress (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    username TEXT,
-    exercise TEXT,
-    reps INTEGER,
-    date TEXT
-)
-""")
-conn.commit()
-
-def save_progress(username, exercise, reps):
-    date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    c.execute("INSERT INTO user_progress (username, exercise, reps, date) VALUES (?, ?, ?, ?)",
-              (username, exercise, reps, date))
-    conn.commit()
-
-def get_leaderboard():
-    df = st.cache_data(lambda:
-        pd.read_sql_query("""
-            SELECT username, SUM(reps) as total_reps 
-            FROM user_progress 
-            GROUP BY username 
-            ORDER BY total_reps DESC
-        """, conn)
-    )()
-    return df
-
-# ------------------- Helper Functions -------------------
-def calculate_angle(a, b, c):
-    a = np.array(a)
-    b = np.array(b)
-    c = np.array(c)
-    radians = np.arctan2(c[1]-b[1], c[0]-b[0]) - np.arctan2(a[1]-b[1], a[0]-b[0])
-    angle = np.abs(radians*180.0/np.pi)
-    if angle > 180.0:
-        angle = 360 - angle
-    return angle
+POSE_CONFIG = dict(min_detection_confidence=0.5, min_tracking_confidence=0.5)
+prewarm(**POSE_CONFIG)
+shared_speech().preload(spoken_phrases("gym"), VOICE)
+
+# ------------------- Leaderboard -------------------
+# Live ranks from memory (coach.ranking), kept current by the rep writer
+LEADERBOARD_SIZE = 10
+ranks = shared_ranks()
+
+def get_leaderboard(username):
+    """Top members, plus the ones around ``username`` when they are further down"""
+    rows = ranks.top(LEADERBOARD_SIZE)
+    rank = ranks.rank(username)
+    if rank is not None and rank > LEADERBOARD_SIZE:
+        rows += ranks.around(username)
+    return pd.DataFrame(rows, columns=["rank", "username", "total_reps"])
 
 # ------------------- Sidebar -------------------
 username = st.sidebar.text_input("Enter Your Name", value="Guest")
@@ -91,121 +66,64 @@ exercise_gifs = {
 
 # ------------------- Pose & Coaching -------------------
 class PoseCoach(VideoTransformerBase):
-    rep_count = 0
-    stage = None
+    def __init__(self):
+        self.session = PoseSession(**POSE_CONFIG)
+        self.frames = FramePipeline()
+        self.rules = RuleSession("gym")
+        self.hud = HudText()
+        # Reps are saved as they happen (see coach.events)
+        self.progress = RepTracker()
+        self.username = None  # set by the page; no reps are published before it is
+        self.exercise = "Bicep Curl"
+        self.voice_out = None  # this member's VoiceMixer, set by the page once audio is up
+        self.rep_count = 0
+        self.stage = None
+
+    def on_ended(self):
+        self.session.close()
+        self.progress.end()
+
+    def stats(self):
+        """Pose session (keyframes, auto-tuner) and frame pipeline counters"""
+        return {**self.session.stats(), **self.frames.stats()}
 
     def transform(self, frame):
-        img = frame.to_ndarray(format="bgr24")
-        height, width, _ = img.shape
-        image_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        results = pose.process(image_rgb)
+        img = self.frames.decode(frame)
+        results = self.session.process(img)
 
         feedback = ""
         confidence = 0
 
-        if results.pose_landmarks:
-            landmarks = results.pose_landmarks.landmark
-            confidence = np.mean([lmk.visibility for lmk in landmarks])*100
+        if results.landmarks is not None:
+            landmarks = results.landmarks
+            confidence = mean_visibility(landmarks)
 
             # Draw skeleton
-            for connection in mp_pose.POSE_CONNECTIONS:
-                start_idx, end_idx = connection
-                start = landmarks[start_idx]
-                end = landmarks[end_idx]
-                x1, y1 = int(start.x * width), int(start.y * height)
-                x2, y2 = int(end.x * width), int(end.y * height)
-                cv2.line(img, (x1, y1), (x2, y2), (0, 255, 0), 3, cv2.LINE_AA)
+            draw_skeleton(img, landmarks, (0, 255, 0), thickness=3, min_visibility=0)
 
             # ----------------- Exercise Logic -----------------
-            if exercise == "Bicep Curl":
-                shoulder = [landmarks[mp_pose.PoseLandmark.RIGHT_SHOULDER.value].x,
-                            landmarks[mp_pose.PoseLandmark.RIGHT_SHOULDER.value].y]
-                elbow = [landmarks[mp_pose.PoseLandmark.RIGHT_ELBOW.value].x,
-                         landmarks[mp_pose.PoseLandmark.RIGHT_ELBOW.value].y]
-                wrist = [landmarks[mp_pose.PoseLandmark.RIGHT_WRIST.value].x,
-                         landmarks[mp_pose.PoseLandmark.RIGHT_WRIST.value].y]
-                angle = calculate_angle(shoulder, elbow, wrist)
-
-                if angle > 160:
-                    self.stage = "down"
-                    speak_async("Lower your arm")
-                if angle < 50 and self.stage == "down":
-                    self.stage = "up"
-                    self.rep_count += 1
-                    speak_async("Good job! One rep completed!")
-
-                feedback = "Curl your arm!" if angle > 160 else ("Keep curling!" if angle < 50 else "Perfect!")
-
-            elif exercise == "Squat":
-                hip = [landmarks[mp_pose.PoseLandmark.RIGHT_HIP.value].x,
-                       landmarks[mp_pose.PoseLandmark.RIGHT_HIP.value].y]
-                knee = [landmarks[mp_pose.PoseLandmark.RIGHT_KNEE.value].x,
-                        landmarks[mp_pose.PoseLandmark.RIGHT_KNEE.value].y]
-                ankle = [landmarks[mp_pose.PoseLandmark.RIGHT_ANKLE.value].x,
-                         landmarks[mp_pose.PoseLandmark.RIGHT_ANKLE.value].y]
-                angle = calculate_angle(hip, knee, ankle)
-
-                if angle > 160:
-                    self.stage = "up"
-                    speak_async("Stand tall")
-                if angle < 90 and self.stage == "up":
-                    self.stage = "down"
-                    self.rep_count += 1
-                    speak_async("Great! One squat done!")
-
-                feedback = "Go deeper!" if angle < 90 else ("Stand tall!" if angle > 160 else "Good posture!")
-
-            elif exercise == "Push-up":
-                shoulder = [landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].x,
-                            landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].y]
-                elbow = [landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].x,
-                         landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].y]
-                wrist = [landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].x,
-                         landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].y]
-                angle = calculate_angle(shoulder, elbow, wrist)
-
-                if angle > 160:
-                    self.stage = "up"
-                    speak_async("Push up")
-                if angle < 90 and self.stage == "up":
-                    self.stage = "down"
-                    self.rep_count += 1
-                    speak_async("Push-up done!")
-
-                feedback = "Go down!" if angle < 90 else ("Push up!" if angle > 160 else "Good!")
-
-            elif exercise == "Shoulder Press":
-                shoulder = [landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].x,
-                            landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].y]
-                elbow = [landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].x,
-                         landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].y]
-                wrist = [landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].x,
-                         landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].y]
-                angle = calculate_angle(shoulder, elbow, wrist)
-
-                if angle < 90:
-                    self.stage = "down"
-                    speak_async("Lower down")
-                if angle > 160 and self.stage == "down":
-                    self.stage = "up"
-                    self.rep_count += 1
-                    speak_async("One shoulder press done!")
-
-                feedback = "Push up!" if angle > 160 else ("Lower down!" if angle < 90 else "Good posture!")
-
-            elif exercise == "Special Needs":
-                feedback = "Gentle movements, lift your arms slowly"
-                speak_async(feedback)
+            # Stages, reps and cues come from the "gym" rules in coach/exercises.json
+            if self.rules.select(self.exercise):
+                result = self.rules.step(landmarks)
+                self.rep_count, self.stage = result.reps, result.stage
+                self.progress.update(self.username, self.exercise, result.reps)
+                feedback = result.feedback[0] if result.feedback else ""
+                if result.say:
+                    speak_async(result.say, sink=self.voice_out)
 
             # Overlay info
-            cv2.putText(img, f"{feedback}", (10,30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0,255,0), 2)
-            cv2.putText(img, f"Reps: {self.rep_count}", (10,60), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0,0,255), 2)
+            self.hud.draw(img, [
+                (f"{feedback}", (10,30), 0.8, (0,255,0), 2),
+                (f"Reps: {self.rep_count}", (10,60), 0.8, (0,0,255), 2)
+            ])
+            # Changes every frame, so it isn't worth caching
             cv2.putText(img, f"Confidence: {confidence:.1f}%", (10,90), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255,255,0), 2)
+        elif results.busy:
+            self.hud.draw(img, [(BUSY_MESSAGE, (10, 30), 0.8, (0, 165, 255), 2)])
 
-        return img
+        return self.frames.finish(img)
 
 # ------------------- Layout -------------------
-import pandas as pd
 col1, col2 = st.columns([1,1])
 
 with col1:
@@ -219,19 +137,32 @@ with col2:
     rtc_configuration = RTCConfiguration({
         "iceServers": [{"urls": ["stun:stun.l.google.com:19302"]}]
     })
-    webrtc_streamer(
+    webrtc_ctx = webrtc_streamer(
         key="fitness_coach",
         video_transformer_factory=PoseCoach,
+        # The microphone track is answered with this session's coaching audio
+        audio_processor_factory=CoachAudioProcessor,
         rtc_configuration=rtc_configuration
     )
+    if webrtc_ctx.video_transformer:
+        webrtc_ctx.video_transformer.username, webrtc_ctx.video_transformer.exercise = username, exercise
+        if webrtc_ctx.audio_processor:
+            webrtc_ctx.video_transformer.voice_out = webrtc_ctx.audio_processor.mixer
+        st.caption(tuning_summary(webrtc_ctx.video_transformer.stats()))
 
 # ------------------- Gamification -------------------
 st.subheader("🏆 Save Your Progress / Leaderboard")
 if st.button("Save Session Progress"):
-    transformer = st.session_state.get("pose_transformer")
-    reps = transformer.rep_count if transformer else 0
-    save_progress(username, exercise, reps)
-    st.success(f"Saved {reps} reps for {username}!")
+    # Reps are already queued as they happen; wait for them to be committed
+    transformer = webrtc_ctx.video_transformer
+    reps = transformer.progress.reps if transformer else 0
+    if shared_writer().flush():
+        st.success(f"Saved {reps} reps for {username}!")
+    else:
+        st.error("Couldn't save your reps yet. They are kept and will be retried, so try again shortly.")
 
-leaderboard = pd.read_sql_query("SELECT username, SUM(reps) as total_reps FROM user_progress GROUP BY username ORDER BY total_reps DESC", conn)
+leaderboard = get_leaderboard(username)
+rank = ranks.rank(username)
+if rank is not None:
+    st.caption(f"🏅 {username} is #{rank} of {len(ranks)}")
 st.dataframe(leaderboard)
\ No newline at end of file
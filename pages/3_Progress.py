@@ -1,10 +1,16 @@
 import streamlit as st
-import sqlite3
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
 import numpy as np
+import html
+import textwrap
+import time
+
+from coach.ranking import shared_ranks
+from coach.storage import WINDOWS, day_key, shared_storage, window_range
+from coach.timeseries import RANGES, reps_series
 
 # Custom CSS for better visibility
 st.markdown("""
@@ -148,69 +154,62 @@ p, div, span {
 """, unsafe_allow_html=True)
 
 
-# Database functions
+LEADERBOARD_PAGE_SIZE = 25
+ALL_TIME = "All time"
+RANK_STYLES = {1: ("rank-1", "👑"), 2: ("rank-2", "🥈"), 3: ("rank-3", "🥉")}
+
+
+# Database functions (pooled connections and named queries, see coach.storage)
 def get_user_progress():
-    conn = sqlite3.connect("data/user_logs.db")
-    query = """
-    SELECT username, exercise, SUM(reps) as total_reps, 
-           COUNT(*) as sessions, MAX(date) as last_activity,
-           AVG(reps) as avg_reps_per_session
-    FROM user_progress 
-    GROUP BY username, exercise
-    """
-    df = pd.read_sql_query(query, conn)
-    conn.close()
-    return df
-
-
-def get_leaderboard():
-    conn = sqlite3.connect("data/user_logs.db")
-    df = pd.read_sql_query("""
-        SELECT username, SUM(reps) as total_reps, 
-               COUNT(DISTINCT date) as active_days,
-               MAX(date) as last_active
-        FROM user_progress 
-        GROUP BY username 
-        ORDER BY total_reps DESC
-    """, conn)
-    conn.close()
-    return df
-
-
-def get_user_stats(username):
-    conn = sqlite3.connect("data/user_logs.db")
-
-    # Total stats
-    total_query = """
-    SELECT SUM(reps) as total_reps, COUNT(DISTINCT date) as total_days,
-           COUNT(*) as total_sessions, MIN(date) as join_date
-    FROM user_progress 
-    WHERE username = ?
-    """
-    total_stats = pd.read_sql_query(total_query, conn, params=(username,))
-
-    # Exercise distribution
-    exercise_query = """
-    SELECT exercise, SUM(reps) as exercise_reps, COUNT(*) as sessions
-    FROM user_progress 
-    WHERE username = ?
-    GROUP BY exercise
-    ORDER BY exercise_reps DESC
-    """
-    exercise_stats = pd.read_sql_query(exercise_query, conn, params=(username,))
-
-    # Weekly progress
-    weekly_query = """
-    SELECT date, SUM(reps) as daily_reps
-    FROM user_progress 
-    WHERE username = ?
-    GROUP BY date
-    ORDER BY date
-    """
-    weekly_stats = pd.read_sql_query(weekly_query, conn, params=(username,))
-
-    conn.close()
-    return total_stats, exercise_stats, weekly_stats
+    return shared_storage().query("progress_by_exercise")
+
+
+def get_leaderboard(page, window=ALL_TIME, per_page=LEADERBOARD_PAGE_SIZE):
+    offset = (page - 1) * per_page
+    if window == ALL_TIME:
+        return shared_storage().query("leaderboard_page", (per_page, offset))
+    # Sums at most a month of day counters per member, however long the history
+    return shared_storage().query("window_leaderboard_page", (*window_range(window), per_page, offset))
+
+
+def count_ranked(window):
+    """Members on the leaderboard for ``window``"""
+    if window == ALL_TIME:
+        return int(community['total_users'])
+    return int(shared_storage().query("window_user_count", window_range(window)).iloc[0]['users'])
+
+
+def get_user_rank(username):
+    return shared_storage().query("user_rank", (username,))
+
+
+def leaderboard_html(rows, username):
+    """The leaderboard rows as one HTML block, sent to the browser in a single update"""
+    items = []
+    for row in rows.itertuples(index=False):
+        rank_class, emoji = RANK_STYLES.get(row.rank, ("", "⭐"))
+        user_class = "user-highlight" if row.username == username else ""
+        items.append(f"""
+    <div class="leaderboard-item {rank_class} {user_class}">
+        <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 0.5rem;">
+            <span class="leaderboard-username">{emoji} #{row.rank} {html.escape(row.username)}</span>
+            <span style="font-size: 1.1rem; font-weight: 600; color: #667eea;">{row.total_reps:,} reps</span>
+        </div>
+        <div class="leaderboard-stats">
+            📅 {row.active_days} active days • 🕐 Last: {row.last_active[:10]}
+        </div>
+    </div>""")
+    # Unindented, so markdown keeps it one HTML block wherever it is placed
+    return textwrap.dedent("".join(items))
+
+
+def get_user_stats(username, days=None):
+    storage = shared_storage()
+    total_stats = storage.query("user_totals", (username,))
+    exercise_stats = storage.query("user_exercises", (username,))
+    # Bucketed and downsampled to a fixed number of points (coach.timeseries)
+    weekly_stats, bucket = reps_series(storage, username, days)
+    return total_stats, exercise_stats, weekly_stats, bucket
 
 
 # Page configuration
@@ -226,7 +225,7 @@ st.markdown("""
 
 # Get data from database
 progress_df = get_user_progress()
-leaderboard_df = get_leaderboard()
+community = shared_storage().query("community_totals").iloc[0]
 
 # User selection in sidebar with better visibility
 st.sidebar.markdown("""
@@ -243,17 +242,24 @@ st.sidebar.markdown("""
 st.sidebar.markdown("### 👤 Select User Profile")
 username = st.sidebar.selectbox(
     "Choose User:",
-    options=["All Users"] + leaderboard_df['username'].tolist(),
+    options=["All Users"] + shared_storage().query("user_names")['username'].tolist(),
     index=0
 )
+chart_range = st.sidebar.selectbox("Chart range:", options=list(RANGES), index=1)
+if username != "All Users":
+    # Live position from the in-memory rank index; no query
+    ranks = shared_ranks()
+    live_rank = ranks.rank(username)
+    if live_rank is not None:
+        st.sidebar.metric("🏅 Live rank", f"#{live_rank} of {len(ranks)}")
 
 # Main Metrics Overview with better contrast
 if username == "All Users":
     # Overall platform stats
-    total_reps = leaderboard_df['total_reps'].sum()
-    total_users = len(leaderboard_df)
-    total_days = leaderboard_df['active_days'].sum()
-    avg_reps_per_user = leaderboard_df['total_reps'].mean()
+    total_reps = int(community['total_reps'])
+    total_users = int(community['total_users'])
+    total_days = int(community['total_days'])
+    avg_reps_per_user = community['avg_reps_per_user']
 
     col1, col2, col3, col4 = st.columns(4)
 
@@ -295,7 +301,7 @@ if username == "All Users":
 
 else:
     # Individual user stats
-    total_stats, exercise_stats, weekly_stats = get_user_stats(username)
+    total_stats, exercise_stats, weekly_stats, bucket = get_user_stats(username, RANGES[chart_range])
 
     if not total_stats.empty:
         col1, col2, col3, col4 = st.columns(4)
@@ -329,7 +335,7 @@ else:
 
         with col4:
             join_date = total_stats.iloc[0]['join_date']
-            days_active = (datetime.now() - datetime.strptime(join_date, '%Y-%m-%d %H:%M:%S')).days
+            days_active = day_key(time.time()) - int(total_stats.iloc[0]['join_day'])
             st.markdown(f"""
             <div class="metric-card">
                 <h3 style="color: #96CEB4; margin: 0;">⏱️ Days Active</h3>
@@ -344,36 +350,18 @@ st.markdown("""
     <h2 style="color: #2D3748; text-align: center; margin-bottom: 2rem;">🏆 Community Leaderboard</h2>
 """, unsafe_allow_html=True)
 
-# Enhanced leaderboard with clear visibility
-leaderboard_df['rank'] = range(1, len(leaderboard_df) + 1)
-
-for _, row in leaderboard_df.iterrows():
-    rank_class = ""
-    if row['rank'] == 1:
-        rank_class = "rank-1"
-        emoji = "👑"
-    elif row['rank'] == 2:
-        rank_class = "rank-2"
-        emoji = "🥈"
-    elif row['rank'] == 3:
-        rank_class = "rank-3"
-        emoji = "🥉"
-    else:
-        emoji = "⭐"
-
-    user_class = "user-highlight" if row['username'] == username else ""
-
-    st.markdown(f"""
-    <div class="leaderboard-item {rank_class} {user_class}">
-        <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 0.5rem;">
-            <span class="leaderboard-username">{emoji} #{row['rank']} {row['username']}</span>
-            <span style="font-size: 1.1rem; font-weight: 600; color: #667eea;">{row['total_reps']:,} reps</span>
-        </div>
-        <div class="leaderboard-stats">
-            📅 {row['active_days']} active days • 🕐 Last: {row['last_active'][:10]}
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
+# One page of the leaderboard, plus the selected user's own (all-time) row if it is on another page
+window = st.radio("Leaderboard window", [ALL_TIME, *WINDOWS], horizontal=True)
+pages = max(1, -(-count_ranked(window) // LEADERBOARD_PAGE_SIZE))
+page = st.number_input("Leaderboard page", min_value=1, max_value=pages, value=1, step=1)
+leaderboard_df = get_leaderboard(page, window)
+leaderboard_block = leaderboard_html(leaderboard_df, username)
+if window == ALL_TIME and username != "All Users" and username not in set(leaderboard_df['username']):
+    own_rank = get_user_rank(username)
+    if not own_rank.empty:
+        leaderboard_block += '<div class="leaderboard-stats">Your position</div>' + leaderboard_html(own_rank, username)
+st.markdown(leaderboard_block, unsafe_allow_html=True)
+st.caption(f"Page {page} of {pages}")
 
 st.markdown("</div>", unsafe_allow_html=True)  # Close leaderboard-container
 
@@ -389,9 +377,9 @@ if username != "All Users" and not weekly_stats.empty:
     with col1:
         # Weekly Progress Chart
         weekly_stats['date'] = pd.to_datetime(weekly_stats['date'])
-        fig_weekly = px.line(weekly_stats, x='date', y='daily_reps',
-                             title=f'{username} - Daily Progress',
-                             labels={'daily_reps': 'Reps per Day', 'date': 'Date'})
+        fig_weekly = px.line(weekly_stats, x='date', y='reps',
+                             title=f'{username} - Progress per {bucket}',
+                             labels={'reps': f'Reps per {bucket.title()}', 'date': 'Date'})
         fig_weekly.update_layout(
             plot_bgcolor='rgba(255,255,255,0.9)',
             paper_bgcolor='rgba(255,255,255,0.9)',
@@ -468,4 +456,9 @@ st.markdown("""
     <h2 style="color: #2D3748; margin-bottom: 1rem;">🚀 Keep Going!</h2>
     <p style="color: #4A5568; font-size: 1.1rem;">Every rep counts toward your fitness goals. Stay consistent and amazing results will follow!</p>
 </div>
-""", unsafe_allow_html=True)
\ No newline at end of file
+""", unsafe_allow_html=True)
+
+with st.expander("⏱️ Query timings", expanded=False):
+    cache = shared_storage().cache_stats
+    st.caption(f"Cache: {cache['hits']} hits, {cache['misses']} misses, {cache['evicted']} evicted")
+    st.dataframe(shared_storage().timing_stats(), use_container_width=True)
@@ -1,312 +1,104 @@
 import streamlit as st
-import cv2
-import mediapipe as mp
-import numpy as np
-import av
-import pyttsx3
-import threading
-import time
 from streamlit_webrtc import webrtc_streamer, VideoProcessorBase, RTCConfiguration
+from coach.audio_out import CoachAudioProcessor
+from coach.autotune import tuning_summary
+from coach.events import RepTracker
+from coach.frames import FramePipeline
+from coach.pose_engine import BUSY_MESSAGE, PoseSession, prewarm
+from coach.render import HudText, draw_skeleton
+from coach.rules import RuleSession, spoken_phrases, whole_reps
+from coach.speech import ALERT, COACHING, VOICES, shared_speech
 
-# Initialize text-to-speech engine
-engine = pyttsx3.init()
-engine.setProperty('rate', 140)  # Calm, clear speech
-engine.setProperty('volume', 0.8)
+# Speech goes through the shared worker in coach.speech
+VOICE = VOICES['pregnancy']
+STOP_MESSAGE = ("Exercise stopped immediately. Please sit down and rest. "
+                "Contact your healthcare provider if you experience any concerning symptoms.")
 
 
-def speak_async(text):
-    """Speak text asynchronously without blocking the main thread"""
-
-    def speak():
-        engine.say(text)
-        engine.runAndWait()
-
-    threading.Thread(target=speak).start()
-
-
-# MediaPipe setup
-mp_pose = mp.solutions.pose
-mp_drawing = mp.solutions.drawing_utils
+def speak_async(text, priority=COACHING, **options):
+    """Queue text for the speech worker without blocking the caller"""
+    return shared_speech().say(text, priority, voice=VOICE, **options)
 
 
 class PregWorkoutProcessor(VideoProcessorBase):
+    POSE_CONFIG = dict(
+        min_detection_confidence=0.6,
+        min_tracking_confidence=0.6,
+        model_complexity=0  # lite model; coach.rules smooths its landmarks
+    )
+
     def __init__(self):
-        self.pose = mp_pose.Pose(
-            min_detection_confidence=0.6,
-            min_tracking_confidence=0.6,
-            model_complexity=1
-        )
+        # The estimator is checked out of the shared pool on the first frame
+        self.session = PoseSession(**self.POSE_CONFIG)
+        self.frames = FramePipeline()
+        self.rules = RuleSession("pregnancy")
+        self.hud = HudText()
+        # Reps are saved as they happen (see coach.events)
+        self.progress = RepTracker()
+        self.username = None  # set by the page; no reps are published before it is
+        self.voice_out = None  # this member's VoiceMixer, set by the page once audio is up
         self.current_exercise = "Pregnancy Squats"
         self.feedback = []
         self.safety_alerts = []
         self.accuracy_score = 0
         self.reps_count = 0
         self.stage = "rest"
-        self.last_voice_time = 0
         self.voice_cooldown = 8  # seconds between voice prompts
         self.safety_score = 100  # Starts at 100, decreases with risky movements
 
-    def calculate_angle(self, a, b, c):
-        """Calculate angle between three points with error handling"""
-        try:
-            a = np.array([a.x, a.y])
-            b = np.array([b.x, b.y])
-            c = np.array([c.x, c.y])
-
-            ba = a - b
-            bc = c - b
-
-            cosine_angle = np.dot(ba, bc) / (np.linalg.norm(ba) * np.linalg.norm(bc))
-            cosine_angle = np.clip(cosine_angle, -1, 1)
-            angle = np.degrees(np.arccos(cosine_angle))
-
-            return angle
-        except:
-            return 0
-
-    def check_pregnancy_safety(self, landmarks):
-        """Special safety checks for pregnancy exercises"""
-        alerts = []
-
-        try:
-            # Check for excessive forward bending (dangerous in pregnancy)
-            nose = landmarks[mp_pose.PoseLandmark.NOSE]
-            left_hip = landmarks[mp_pose.PoseLandmark.LEFT_HIP]
-            right_hip = landmarks[mp_pose.PoseLandmark.RIGHT_HIP]
-
-            # Calculate forward lean
-            hip_center_y = (left_hip.y + right_hip.y) / 2
-            forward_lean = nose.y - hip_center_y
-
-            if forward_lean > 0.15:  # Excessive forward bending
-                alerts.append("Avoid excessive forward bending")
-                self.safety_score = max(0, self.safety_score - 5)
-
-            # Check for balance issues
-            left_ankle = landmarks[mp_pose.PoseLandmark.LEFT_ANKLE]
-            right_ankle = landmarks[mp_pose.PoseLandmark.RIGHT_ANKLE]
-
-            balance_diff = abs(left_ankle.x - right_ankle.x)
-            if balance_diff > 0.25:  # Unstable stance
-                alerts.append("Widen stance for better balance")
-                self.safety_score = max(0, self.safety_score - 3)
-
-            # Check for twisting motions (avoid in pregnancy)
-            left_shoulder = landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER]
-            right_shoulder = landmarks[mp_pose.PoseLandmark.RIGHT_SHOULDER]
-            left_hip = landmarks[mp_pose.PoseLandmark.LEFT_HIP]
-            right_hip = landmarks[mp_pose.PoseLandmark.RIGHT_HIP]
-
-            shoulder_hip_twist = abs((left_shoulder.x - right_shoulder.x) - (left_hip.x - right_hip.x))
-            if shoulder_hip_twist > 0.1:  # Excessive twisting
-                alerts.append("Avoid twisting motions - keep torso stable")
-                self.safety_score = max(0, self.safety_score - 7)
-
-        except Exception as e:
-            print(f"Safety check error: {e}")
-
-        return alerts
-
-    def check_pregnancy_squats(self, landmarks):
-        """Safe squats for pregnancy with limited range"""
-        feedback = []
-        accuracy_points = 0
-        total_points = 0
-
-        try:
-            # Gentle knee angle check (limited depth for pregnancy)
-            left_hip = landmarks[mp_pose.PoseLandmark.LEFT_HIP]
-            left_knee = landmarks[mp_pose.PoseLandmark.LEFT_KNEE]
-            left_ankle = landmarks[mp_pose.PoseLandmark.LEFT_ANKLE]
-
-            right_hip = landmarks[mp_pose.PoseLandmark.RIGHT_HIP]
-            right_knee = landmarks[mp_pose.PoseLandmark.RIGHT_KNEE]
-            right_ankle = landmarks[mp_pose.PoseLandmark.RIGHT_ANKLE]
-
-            left_knee_angle = self.calculate_angle(left_hip, left_knee, left_ankle)
-            right_knee_angle = self.calculate_angle(right_hip, right_knee, right_ankle)
-
-            total_points += 2
-
-            # Pregnancy-safe squat range (shallower than normal)
-            is_squatting = (left_knee_angle < 140 and right_knee_angle < 140)
-
-            if is_squatting:
-                # Check for safe depth (not too deep during pregnancy)
-                if 100 < left_knee_angle < 140 and 100 < right_knee_angle < 140:
-                    accuracy_points += 2
-                    if self.stage != "down":
-                        self.stage = "down"
-                        if time.time() - self.last_voice_time > self.voice_cooldown:
-                            speak_async("Good squat depth. Now slowly stand up")
-                            self.last_voice_time = time.time()
-                else:
-                    feedback.append("Squat shallower - pregnancy safety")
+    def on_ended(self):
+        """Return the estimator to the pool and close the rep segment when the stream stops"""
+        self.session.close()
+        self.progress.end()
 
-                # Knee alignment check
-                if (left_knee.x < left_hip.x and right_knee.x > right_hip.x):
-                    accuracy_points += 1
-                else:
-                    feedback.append("Keep knees aligned with hips")
-
-            else:  # Standing position
-                if left_knee_angle > 160 and right_knee_angle > 160:
-                    accuracy_points += 2
-                    if self.stage == "down":
-                        self.stage = "up"
-                        self.reps_count += 1
-                        if time.time() - self.last_voice_time > self.voice_cooldown:
-                            speak_async(f"Excellent! You've completed {self.reps_count} safe squats")
-                            self.last_voice_time = time.time()
-                else:
-                    feedback.append("Return to full standing position")
-
-        except Exception as e:
-            feedback.append("Adjust position for better detection")
-
-        return feedback, (accuracy_points / total_points) * 100 if total_points > 0 else 0
-
-    def check_pelvic_tilts(self, landmarks):
-        """Safe pelvic tilts for pregnancy"""
-        feedback = []
-        accuracy_points = 0
-        total_points = 0
-
-        try:
-            # Pelvic tilt detection through hip and shoulder alignment
-            left_shoulder = landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER]
-            right_shoulder = landmarks[mp_pose.PoseLandmark.RIGHT_SHOULDER]
-            left_hip = landmarks[mp_pose.PoseLandmark.LEFT_HIP]
-            right_hip = landmarks[mp_pose.PoseLandmark.RIGHT_HIP]
-
-            # Calculate pelvic tilt angle
-            shoulder_center = [(left_shoulder.x + right_shoulder.x) / 2,
-                               (left_shoulder.y + right_shoulder.y) / 2]
-            hip_center = [(left_hip.x + right_hip.x) / 2,
-                          (left_hip.y + right_hip.y) / 2]
-
-            # Simple tilt detection (this is a simplified approach)
-            tilt_angle = abs(shoulder_center[1] - hip_center[1])
-            total_points += 1
-
-            if tilt_angle > 0.02:  # Gentle tilt detected
-                accuracy_points += 1
-                if self.stage != "tilt":
-                    self.stage = "tilt"
-                    if time.time() - self.last_voice_time > self.voice_cooldown:
-                        speak_async("Good pelvic tilt. Now return to neutral")
-                        self.last_voice_time = time.time()
-            else:  # Neutral position
-                if self.stage == "tilt":
-                    self.stage = "neutral"
-                    self.reps_count += 1
-                    if time.time() - self.last_voice_time > self.voice_cooldown:
-                        speak_async(f"Perfect! {self.reps_count} pelvic tilts completed")
-                        self.last_voice_time = time.time()
-                accuracy_points += 1
-
-        except Exception as e:
-            feedback.append("Stand sideways for better pelvic tilt detection")
-
-        return feedback, (accuracy_points / total_points) * 100 if total_points > 0 else 0
-
-    def check_arm_circles(self, landmarks):
-        """Gentle arm circles for shoulder mobility during pregnancy"""
-        feedback = []
-        accuracy_points = 0
-        total_points = 0
-
-        try:
-            # Arm position detection
-            left_shoulder = landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER]
-            left_elbow = landmarks[mp_pose.PoseLandmark.LEFT_ELBOW]
-            left_wrist = landmarks[mp_pose.PoseLandmark.LEFT_WRIST]
-
-            right_shoulder = landmarks[mp_pose.PoseLandmark.RIGHT_SHOULDER]
-            right_elbow = landmarks[mp_pose.PoseLandmark.RIGHT_ELBOW]
-            right_wrist = landmarks[mp_pose.PoseLandmark.RIGHT_WRIST]
-
-            # Check if arms are raised (gentle arm circles)
-            left_arm_raised = left_elbow.y < left_shoulder.y
-            right_arm_raised = right_elbow.y < right_shoulder.y
-
-            total_points += 2
-
-            if left_arm_raised and right_arm_raised:
-                accuracy_points += 2
-                if self.stage != "raised":
-                    self.stage = "raised"
-                    if time.time() - self.last_voice_time > self.voice_cooldown:
-                        speak_async("Arms raised nicely. Make gentle circles")
-                        self.last_voice_time = time.time()
-            else:
-                if self.stage == "raised":
-                    self.stage = "lowered"
-                    self.reps_count += 0.5  # Half rep for each cycle
-                    if time.time() - self.last_voice_time > self.voice_cooldown:
-                        speak_async(f"Good arm movement. {int(self.reps_count)} circles done")
-                        self.last_voice_time = time.time()
-                accuracy_points += 2
-
-        except Exception as e:
-            feedback.append("Ensure arms are visible for detection")
-
-        return feedback, (accuracy_points / total_points) * 100 if total_points > 0 else 0
+    def stats(self):
+        """Pose session (keyframes, auto-tuner) and frame pipeline counters"""
+        return {**self.session.stats(), **self.frames.stats()}
 
     def recv(self, frame):
-        image = frame.to_ndarray(format="bgr24")
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        image.flags.writeable = False
+        # Decoded once into a reused buffer; the overlay is drawn straight onto it
+        image = self.frames.decode(frame)
+        results = self.session.process(image)
 
-        results = self.pose.process(image_rgb)
-        image.flags.writeable = True
-        image = cv2.cvtColor(image_rgb, cv2.COLOR_RGB2BGR)
-
-        if results.pose_landmarks:
+        landmarks = results.landmarks
+        if landmarks is not None:
             # Draw pose landmarks with pregnancy-safe colors (softer)
-            mp_drawing.draw_landmarks(
-                image, results.pose_landmarks, mp_pose.POSE_CONNECTIONS,
-                mp_drawing.DrawingSpec(color=(100, 200, 100), thickness=3, circle_radius=4),
-                mp_drawing.DrawingSpec(color=(200, 100, 100), thickness=3, circle_radius=4)
-            )
-
-            landmarks = results.pose_landmarks.landmark
-
-            # Pregnancy-specific safety checks
-            self.safety_alerts = self.check_pregnancy_safety(landmarks)
-
-            # Exercise-specific analysis
-            if self.current_exercise == "Pregnancy Squats":
-                self.feedback, self.accuracy_score = self.check_pregnancy_squats(landmarks)
-            elif self.current_exercise == "Pelvic Tilts":
-                self.feedback, self.accuracy_score = self.check_pelvic_tilts(landmarks)
-            elif self.current_exercise == "Arm Circles":
-                self.feedback, self.accuracy_score = self.check_arm_circles(landmarks)
+            draw_skeleton(image, landmarks, line_color=(200, 100, 100), point_color=(100, 200, 100),
+                          thickness=3, radius=4)
+
+            # Safety alerts and exercise analysis from the "pregnancy" rules in coach/exercises.json
+            if self.rules.select(self.current_exercise):
+                result = self.rules.step(landmarks)
+                self.safety_alerts, self.safety_score = result.alerts, self.rules.safety_score
+                self.feedback, self.accuracy_score = result.feedback, result.accuracy
+                self.reps_count, self.stage = result.reps, result.stage
+                self.progress.update(self.username, self.current_exercise, result.reps)
+                if result.say:
+                    speak_async(result.say, key=id(self), cooldown=self.voice_cooldown, sink=self.voice_out)
             else:
                 self.feedback = ["Select a pregnancy-safe exercise to begin"]
                 self.accuracy_score = 0
 
             # Display pregnancy-safe information
-            cv2.putText(image, f"Exercise: {self.current_exercise}", (10, 40),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 150, 0), 2)
-            cv2.putText(image, f"Safety Score: {self.safety_score}%", (10, 80),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 150, 0), 2)
-            cv2.putText(image, f"Form Accuracy: {self.accuracy_score:.1f}%", (10, 120),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.8, (200, 100, 0), 2)
-            cv2.putText(image, f"Reps: {int(self.reps_count)}", (10, 160),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.8, (200, 100, 0), 2)
+            self.hud.draw(image, [
+                (f"Exercise: {self.current_exercise}", (10, 40), 0.8, (0, 150, 0), 2),
+                (f"Safety Score: {self.safety_score}%", (10, 80), 0.8, (0, 150, 0), 2),
+                (f"Form Accuracy: {self.accuracy_score:.1f}%", (10, 120), 0.8, (200, 100, 0), 2),
+                (f"Reps: {whole_reps(self.reps_count)}", (10, 160), 0.8, (200, 100, 0), 2),
+                # Safety alerts in red, feedback in blue
+                *[(f"! {alert}", (10, 200 + i * 40), 0.6, (0, 0, 255), 2)
+                  for i, alert in enumerate(self.safety_alerts[:2])],
+                *[(f"* {text}", (10, 280 + i * 40), 0.6, (255, 100, 0), 2)
+                  for i, text in enumerate(self.feedback[:2])]
+            ])
+        elif results.busy:
+            self.hud.draw(image, [(BUSY_MESSAGE, (10, 30), 0.8, (0, 165, 255), 2)])
 
-            # Display safety alerts in red
-            for i, alert in enumerate(self.safety_alerts[:2]):
-                cv2.putText(image, f"! {alert}", (10, 200 + i * 40),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
+        return self.frames.encode(image)
 
-            # Display feedback in blue
-            for i, text in enumerate(self.feedback[:2]):
-                cv2.putText(image, f"* {text}", (10, 280 + i * 40),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 100, 0), 2)
 
-        return av.VideoFrame.from_ndarray(image, format="bgr24")
+prewarm(**PregWorkoutProcessor.POSE_CONFIG)
+shared_speech().preload(spoken_phrases("pregnancy") + [STOP_MESSAGE], VOICE)
 
 
 def pregnancy_workout_panel():
@@ -409,6 +201,7 @@ def pregnancy_workout_panel():
 
     # Sidebar with pregnancy-specific settings
     st.sidebar.markdown("### 🤰 Pregnancy Settings")
+    username = st.sidebar.text_input("Your Name", value="Guest")
 
     # Voice guidance settings
     st.sidebar.markdown("#### 🔊 Voice Guidance")
@@ -517,9 +310,7 @@ def pregnancy_workout_panel():
         processor.current_exercise = selected_exercise
 
         # Welcome message with voice
-        if voice_enabled and st.button("🎤 Start Pregnancy-Safe Guidance"):
-            speak_async(
-                f"Beginning {selected_exercise}. Remember to move slowly and stop if you feel any discomfort. Your safety and your baby's safety come first.")
+        greet = voice_enabled and st.button("🎤 Start Pregnancy-Safe Guidance")
 
         # Webcam stream
         webrtc_ctx = webrtc_streamer(
@@ -528,12 +319,22 @@ def pregnancy_workout_panel():
             rtc_configuration=RTCConfiguration({
                 "iceServers": [{"urls": ["stun:stun.l.google.com:19302"]}]
             }),
-            media_stream_constraints={"video": True, "audio": False}
+            # The microphone track is answered with this session's coaching audio
+            audio_processor_factory=CoachAudioProcessor,
+            media_stream_constraints={"video": True, "audio": True}
         )
+        voice_out = webrtc_ctx.audio_processor.mixer if webrtc_ctx.audio_processor else None
+        if greet:
+            speak_async(
+                f"Beginning {selected_exercise}. Remember to move slowly and stop if you feel any discomfort. Your safety and your baby's safety come first.",
+                sink=voice_out)
 
         # Real-time feedback display
         if webrtc_ctx.video_processor:
             processor = webrtc_ctx.video_processor
+            processor.username, processor.current_exercise = username, selected_exercise
+            processor.voice_out = voice_out
+            st.caption(tuning_summary(processor.stats()))
 
             # Critical safety alerts
             if processor.safety_alerts and safety_alerts:
@@ -541,7 +342,7 @@ def pregnancy_workout_panel():
                     st.markdown(f'<div class="safety-warning">⚠️ PREGNANCY ALERT: {alert}</div>',
                                 unsafe_allow_html=True)
                     if voice_enabled:
-                        speak_async(f"Pregnancy safety alert: {alert}")
+                        speak_async(f"Pregnancy safety alert: {alert}", ALERT, sink=voice_out)
 
             # Exercise feedback
             st.markdown("### 💬 Coach Feedback")
@@ -564,7 +365,7 @@ def pregnancy_workout_panel():
                 st.metric("Form Accuracy", f"{processor.accuracy_score:.1f}%")
 
             with col5:
-                st.metric("Safe Reps", int(processor.reps_count))
+                st.metric("Safe Reps", whole_reps(processor.reps_count))
 
     # Emergency section for pregnancy
     st.markdown("---")
@@ -574,8 +375,7 @@ def pregnancy_workout_panel():
 
     with emergency_col1:
         if st.button("🆘 STOP EXERCISE - Emergency", use_container_width=True):
-            speak_async(
-                "Exercise stopped immediately. Please sit down and rest. Contact your healthcare provider if you experience any concerning symptoms.")
+            speak_async(STOP_MESSAGE, ALERT, sink=voice_out)
             st.error("""
             **EMERGENCY STOP - Contact your doctor if you experience:**
             - Vaginal bleeding or fluid leakage
@@ -1,15 +1,9 @@
 import streamlit as st
 import datetime
-import json
-import os
 import random
 import plotly.express as px
 from plyer import notification
-
-# -----------------------------
-# File to save hydration history
-# -----------------------------
-DATA_FILE = "water_data.json"
+from coach.hydration import LEGACY_USER, shared_log
 
 # -----------------------------
 # Medical Conditions & Water Recommendations
@@ -29,21 +23,6 @@ MEDICAL_CONDITIONS = {
     "Custom": {"min_l": 2.0, "max_l": 3.5},
 }
 
-# -----------------------------
-# Load / Save Functions
-# -----------------------------
-def load_data():
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, "r") as f:
-            return json.load(f)
-    return {"history": {}, "streak": 0, "last_completed": None}
-
-def save_data(data):
-    with open(DATA_FILE, "w") as f:
-        json.dump(data, f, indent=2)
-
-data = load_data()
-
 # -----------------------------
 # Compute Daily Goal
 # -----------------------------
@@ -77,36 +56,15 @@ def send_notification(message):
 # Log Intake
 # -----------------------------
 def log_water(amount_l):
-    now = datetime.datetime.now().strftime("%H:%M:%S")
-    today = str(datetime.date.today())
-    if today not in data["history"]:
-        data["history"][today] = []
-
-    data["history"][today].append({"time": now, "amount_l": amount_l})
-
-    total_today = sum(entry["amount_l"] for entry in data["history"][today])
-
-    if total_today >= st.session_state["goal"]:
-        yesterday = str(datetime.date.today() - datetime.timedelta(days=1))
-        if data.get("last_completed") == yesterday:
-            data["streak"] += 1
-        elif data.get("last_completed") != today:
-            data["streak"] = 1
-        data["last_completed"] = today
-
-    save_data(data)
-    return total_today
+    # One appended line in this member's log (coach.hydration); reaching the goal feeds the streak
+    return shared_log(username).log(amount_l, st.session_state["goal"])
 
 # -----------------------------
 # Delete Entry
 # -----------------------------
-def delete_entry(today, index):
-    if today in data["history"]:
-        data["history"][today].pop(index)
-        if not data["history"][today]:
-            del data["history"][today]
-        save_data(data)
-        st.session_state["refresh"] = not st.session_state.get("refresh", False)  # trigger rerun
+def delete_entry(entry_id):
+    shared_log(username).delete(entry_id)
+    st.session_state["refresh"] = not st.session_state.get("refresh", False)  # trigger rerun
 
 # -----------------------------
 # Streamlit UI
@@ -129,6 +87,7 @@ st.subheader("Track your hydration with real-time reminders & medical guidance")
 # -----------------------------
 # User Inputs
 # -----------------------------
+username = st.text_input("Enter Your Name", value=LEGACY_USER)
 age = st.number_input("Enter Age", 10, 100, 30)
 weight = st.number_input("Enter Weight (kg)", 30, 150, 70)
 activity = st.selectbox("Activity Level", ["low", "moderate", "high"])
@@ -195,9 +154,7 @@ if st.session_state["goal"] > 0:
 # Weekly Report & Streaks (Attractive Graph)
 # -----------------------------
 st.markdown("### 📊 Weekly Hydration Report & Streaks")
-daily_totals = {}
-for day, entries in data["history"].items():
-    daily_totals[day] = sum(entry.get("amount_l", 0) for entry in entries)
+daily_totals = shared_log(username).daily_totals()
 
 if daily_totals:
     last7 = sorted(daily_totals.items())[-7:]
@@ -241,7 +198,7 @@ if daily_totals:
     )
 
     st.plotly_chart(fig, use_container_width=True)
-    st.info(f"🔥 Current streak: {data.get('streak', 0)} days")
+    st.info(f"🔥 Current streak: {shared_log(username).streak()} days")
 else:
     st.write("No hydration history yet 🚰")
 
@@ -250,12 +207,13 @@ else:
 # -----------------------------
 st.markdown("### 🕒 Today's Intake Log")
 today = str(datetime.date.today())
-if today in data["history"] and len(data["history"][today]) > 0:
-    for i, entry in enumerate(data["history"][today]):
+today_entries = shared_log(username).entries(today)
+if today_entries:
+    for entry in today_entries:
         col1, col2, col3 = st.columns([2, 2, 1])
         col1.write(entry["time"])
         col2.write(f"{entry['amount_l']} L")
-        if col3.button("❌ Clear", key=f"clear_{i}"):
-            delete_entry(today, i)
+        if col3.button("❌ Clear", key=f"clear_{entry['id']}"):
+            delete_entry(entry["id"])
 else:
     st.write("No intake logged today.")
\ No newline at end of file
@@ -1,323 +1,104 @@
 import streamlit as st
-import cv2
-import mediapipe as mp
-import numpy as np
-import av
-import pyttsx3
-import threading
 from streamlit_webrtc import webrtc_streamer, VideoProcessorBase, RTCConfiguration
+from coach.audio_out import CoachAudioProcessor
+from coach.autotune import tuning_summary
+from coach.events import RepTracker
+from coach.frames import FramePipeline
+from coach.pose_engine import BUSY_MESSAGE, PoseSession, prewarm
+from coach.render import HudText, draw_skeleton
+from coach.rules import RuleSession, spoken_phrases, whole_reps
+from coach.speech import ALERT, COACHING, VOICES, shared_speech
 import os
-import time
 
-# Initialize text-to-speech engine
-engine = pyttsx3.init()
-engine.setProperty('rate', 150)  # Slower speech for clarity
-engine.setProperty('volume', 0.8)
+# Speech goes through the shared worker in coach.speech
+VOICE = VOICES['senior']
+STOP_MESSAGE = "Exercise stopped immediately. Please sit down and rest. Help is available if needed."
+HELP_MESSAGE = "Help has been notified. Please remain calm and seated."
 
 
-def speak_async(text):
-    """Speak text asynchronously without blocking the main thread"""
-
-    def speak():
-        engine.say(text)
-        engine.runAndWait()
-
-    threading.Thread(target=speak).start()
-
-
-# MediaPipe setup
-mp_pose = mp.solutions.pose
-mp_drawing = mp.solutions.drawing_utils
+def speak_async(text, priority=COACHING, **options):
+    """Queue text for the speech worker without blocking the caller"""
+    return shared_speech().say(text, priority, voice=VOICE, **options)
 
 
 class SeniorExerciseProcessor(VideoProcessorBase):
+    POSE_CONFIG = dict(
+        min_detection_confidence=0.5,  # Lower confidence for flexibility
+        min_tracking_confidence=0.5,
+        model_complexity=0  # lite model; coach.rules smooths its landmarks
+    )
+
     def __init__(self):
-        self.pose = mp_pose.Pose(
-            min_detection_confidence=0.5,  # Lower confidence for flexibility
-            min_tracking_confidence=0.5,
-            model_complexity=1
-        )
+        # The estimator is checked out of the shared pool on the first frame
+        self.session = PoseSession(**self.POSE_CONFIG)
+        self.frames = FramePipeline()
+        self.rules = RuleSession("senior")
+        self.hud = HudText()
+        # Reps are saved as they happen (see coach.events)
+        self.progress = RepTracker()
+        self.username = None  # set by the page; no reps are published before it is
+        self.voice_out = None  # this member's VoiceMixer, set by the page once audio is up
         self.current_exercise = "Chair Squats"
         self.feedback = []
         self.safety_alerts = []
         self.accuracy_score = 0
         self.rep_count = 0
         self.stage = None
-        self.last_voice_time = 0
         self.voice_cooldown = 5  # seconds between voice prompts
 
-    def calculate_angle(self, a, b, c):
-        """Calculate angle between three points with safety checks"""
-        try:
-            a = np.array(a)
-            b = np.array(b)
-            c = np.array(c)
-
-            radians = np.arctan2(c[1] - b[1], c[0] - b[0]) - np.arctan2(a[1] - b[1], a[0] - b[0])
-            angle = np.abs(radians * 180.0 / np.pi)
-
-            if angle > 180.0:
-                angle = 360 - angle
-
-            return angle
-        except:
-            return 0
-
-    def check_safety_limits(self, landmarks, exercise_type):
-        """Check for movements that could be dangerous for seniors"""
-        alerts = []
-
-        # General safety checks for all exercises
-        try:
-            # Check for excessive bending
-            nose = [landmarks[mp_pose.PoseLandmark.NOSE.value].x,
-                    landmarks[mp_pose.PoseLandmark.NOSE.value].y]
-            left_hip = [landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].x,
-                        landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].y]
-
-            bend_angle = self.calculate_angle(
-                [nose[0], nose[1] + 0.1],  # Point above head
-                nose,
-                left_hip
-            )
-
-            if bend_angle > 45:  # Excessive forward bending
-                alerts.append("Avoid bending too far forward")
-
-            # Check balance stability
-            left_ankle = [landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value].x,
-                          landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value].y]
-            right_ankle = [landmarks[mp_pose.PoseLandmark.RIGHT_ANKLE.value].x,
-                           landmarks[mp_pose.PoseLandmark.RIGHT_ANKLE.value].y]
-
-            balance_diff = abs(left_ankle[0] - right_ankle[0])
-            if balance_diff > 0.2:  # Unstable stance
-                alerts.append("Widen stance for better balance")
-
-        except Exception as e:
-            print(f"Safety check error: {e}")
-
-        return alerts
-
-    def check_chair_squats(self, landmarks):
-        """Safe chair squats for seniors"""
-        feedback = []
-        accuracy_points = 0
-        total_points = 0
-
-        try:
-            # Hip angle for squat depth
-            shoulder = [landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].x,
-                        landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].y]
-            hip = [landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].x,
-                   landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].y]
-            knee = [landmarks[mp_pose.PoseLandmark.LEFT_KNEE.value].x,
-                    landmarks[mp_pose.PoseLandmark.LEFT_KNEE.value].y]
-
-            hip_angle = self.calculate_angle(shoulder, hip, knee)
-            total_points += 1
-
-            # Safe range for seniors (shallower squats)
-            if 120 < hip_angle < 150:  # Partial squat range
-                accuracy_points += 1
-                if self.stage != "down":
-                    self.stage = "down"
-                    if time.time() - self.last_voice_time > self.voice_cooldown:
-                        speak_async("Good! Now slowly stand back up")
-                        self.last_voice_time = time.time()
-            elif hip_angle > 150:  # Standing position
-                if self.stage == "down":
-                    self.stage = "up"
-                    self.rep_count += 1
-                    if time.time() - self.last_voice_time > self.voice_cooldown:
-                        speak_async(f"Excellent! You've completed {int(self.rep_count)} squats")
-                        self.last_voice_time = time.time()
-                accuracy_points += 1
-            else:
-                feedback.append("Don't squat too deep - keep it gentle")
-
-        except Exception as e:
-            feedback.append("Adjust your position for better detection")
-
-        return feedback, (accuracy_points / total_points) * 100 if total_points > 0 else 0
-
-    def check_arm_raises(self, landmarks):
-        """Gentle arm raises for shoulder mobility"""
-        feedback = []
-        accuracy_points = 0
-        total_points = 0
-
-        try:
-            # Arm angle for raising
-            shoulder = [landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].x,
-                        landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].y]
-            elbow = [landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].x,
-                     landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].y]
-            wrist = [landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].x,
-                     landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].y]
-
-            arm_angle = self.calculate_angle(shoulder, elbow, wrist)
-            total_points += 1
-
-            # Safe arm raising range
-            if arm_angle > 150:  # Arm raised
-                accuracy_points += 1
-                if self.stage != "up":
-                    self.stage = "up"
-                    if time.time() - self.last_voice_time > self.voice_cooldown:
-                        speak_async("Good lift! Now slowly lower your arm")
-                        self.last_voice_time = time.time()
-            else:  # Arm lowered
-                if self.stage == "up":
-                    self.stage = "down"
-                    self.rep_count += 1
-                    if time.time() - self.last_voice_time > self.voice_cooldown:
-                        speak_async(f"Perfect! That's {int(self.rep_count)} arm raises")
-                        self.last_voice_time = time.time()
-                accuracy_points += 1
-
-        except Exception as e:
-            feedback.append("Make sure your arm is visible")
-
-        return feedback, (accuracy_points / total_points) * 100 if total_points > 0 else 0
-
-    def check_leg_lifts(self, landmarks):
-        """Seated or supported leg lifts"""
-        feedback = []
-        accuracy_points = 0
-        total_points = 0
-
-        try:
-            # Leg angle for lifting
-            hip = [landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].x,
-                   landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].y]
-            knee = [landmarks[mp_pose.PoseLandmark.LEFT_KNEE.value].x,
-                    landmarks[mp_pose.PoseLandmark.LEFT_KNEE.value].y]
-            ankle = [landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value].x,
-                     landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value].y]
-
-            leg_angle = self.calculate_angle(hip, knee, ankle)
-            total_points += 1
-
-            # Gentle leg lift range
-            if 130 < leg_angle < 160:  # Leg lifted
-                accuracy_points += 1
-                if self.stage != "up":
-                    self.stage = "up"
-                    if time.time() - self.last_voice_time > self.voice_cooldown:
-                        speak_async("Nice leg lift! Hold for a moment")
-                        self.last_voice_time = time.time()
-            else:  # Leg down
-                if self.stage == "up":
-                    self.stage = "down"
-                    self.rep_count += 1
-                    if time.time() - self.last_voice_time > self.voice_cooldown:
-                        speak_async(f"Great control! {int(self.rep_count)} leg lifts done")
-                        self.last_voice_time = time.time()
-                accuracy_points += 1
-
-        except Exception as e:
-            feedback.append("Adjust position for leg detection")
-
-        return feedback, (accuracy_points / total_points) * 100 if total_points > 0 else 0
-
-    def check_neck_rotations(self, landmarks):
-        """Gentle neck mobility exercises"""
-        feedback = []
-        accuracy_points = 0
-        total_points = 0
-
-        try:
-            # Head position relative to shoulders
-            nose = [landmarks[mp_pose.PoseLandmark.NOSE.value].x,
-                    landmarks[mp_pose.PoseLandmark.NOSE.value].y]
-            left_shoulder = [landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].x,
-                             landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].y]
-            right_shoulder = [landmarks[mp_pose.PoseLandmark.RIGHT_SHOULDER.value].x,
-                              landmarks[mp_pose.PoseLandmark.RIGHT_SHOULDER.value].y]
-
-            shoulder_center = [(left_shoulder[0] + right_shoulder[0]) / 2,
-                               (left_shoulder[1] + right_shoulder[1]) / 2]
-
-            head_offset = abs(nose[0] - shoulder_center[0])
-            total_points += 1
-
-            # Gentle neck rotation range
-            if 0.05 < head_offset < 0.15:  # Head turned
-                accuracy_points += 1
-                if self.stage != "turned":
-                    self.stage = "turned"
-                    if time.time() - self.last_voice_time > self.voice_cooldown:
-                        speak_async("Good neck turn. Now slowly return to center")
-                        self.last_voice_time = time.time()
-            else:  # Head centered
-                if self.stage == "turned":
-                    self.stage = "center"
-                    self.rep_count += 0.5  # Half rep for each side
-                    if time.time() - self.last_voice_time > self.voice_cooldown:
-                        speak_async("Excellent neck mobility")
-                        self.last_voice_time = time.time()
-                accuracy_points += 1
-
-        except Exception as e:
-            feedback.append("Face the camera for neck exercise")
-
-        return feedback, (accuracy_points / total_points) * 100 if total_points > 0 else 0
+    def on_ended(self):
+        """Return the estimator to the pool and close the rep segment when the stream stops"""
+        self.session.close()
+        self.progress.end()
+
+    def stats(self):
+        """Pose session (keyframes, auto-tuner) and frame pipeline counters"""
+        return {**self.session.stats(), **self.frames.stats()}
 
     def recv(self, frame):
-        image = frame.to_ndarray(format="bgr24")
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        image.flags.writeable = False
+        # Decoded once into a reused buffer; the overlay is drawn straight onto it
+        image = self.frames.decode(frame)
+        results = self.session.process(image)
 
-        results = self.pose.process(image_rgb)
-        image.flags.writeable = True
-        image = cv2.cvtColor(image_rgb, cv2.COLOR_RGB2BGR)
+        if results.landmarks is not None:
+            landmarks = results.landmarks
 
-        if results.pose_landmarks:
             # Draw pose landmarks with senior-friendly colors (softer)
-            mp_drawing.draw_landmarks(
-                image, results.pose_landmarks, mp_pose.POSE_CONNECTIONS,
-                mp_drawing.DrawingSpec(color=(100, 200, 100), thickness=3, circle_radius=4),
-                mp_drawing.DrawingSpec(color=(200, 100, 100), thickness=3, circle_radius=4)
-            )
-
-            landmarks = results.pose_landmarks.landmark
-
-            # Safety checks first
-            self.safety_alerts = self.check_safety_limits(landmarks, self.current_exercise)
-
-            # Exercise-specific analysis
-            if self.current_exercise == "Chair Squats":
-                self.feedback, self.accuracy_score = self.check_chair_squats(landmarks)
-            elif self.current_exercise == "Arm Raises":
-                self.feedback, self.accuracy_score = self.check_arm_raises(landmarks)
-            elif self.current_exercise == "Leg Lifts":
-                self.feedback, self.accuracy_score = self.check_leg_lifts(landmarks)
-            elif self.current_exercise == "Neck Rotations":
-                self.feedback, self.accuracy_score = self.check_neck_rotations(landmarks)
+            draw_skeleton(image, landmarks, line_color=(200, 100, 100), point_color=(100, 200, 100),
+                          thickness=3, radius=4)
+
+            # Safety alerts and exercise analysis from the "senior" rules in coach/exercises.json
+            if self.rules.select(self.current_exercise):
+                result = self.rules.step(landmarks)
+                self.safety_alerts = result.alerts
+                self.feedback, self.accuracy_score = result.feedback, result.accuracy
+                self.rep_count, self.stage = result.reps, result.stage
+                self.progress.update(self.username, self.current_exercise, result.reps)
+                if result.say:
+                    speak_async(result.say, key=id(self), cooldown=self.voice_cooldown, sink=self.voice_out)
             else:
                 self.feedback = ["Select an exercise to begin"]
                 self.accuracy_score = 0
 
             # Display senior-friendly information
-            cv2.putText(image, f"Exercise: {self.current_exercise}", (10, 40),
-                        cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 150, 0), 2)
-            cv2.putText(image, f"Safety Score: {self.accuracy_score:.1f}%", (10, 80),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 150, 0), 2)
-            cv2.putText(image, f"Reps: {int(self.rep_count)}", (10, 120),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.8, (200, 100, 0), 2)
+            self.hud.draw(image, [
+                (f"Exercise: {self.current_exercise}", (10, 40), 1, (0, 150, 0), 2),
+                (f"Safety Score: {self.accuracy_score:.1f}%", (10, 80), 0.8, (0, 150, 0), 2),
+                (f"Reps: {whole_reps(self.rep_count)}", (10, 120), 0.8, (200, 100, 0), 2),
+                # Safety alerts in red, feedback in blue
+                *[(f"! {alert}", (10, 160 + i * 40), 0.7, (0, 0, 255), 2)
+                  for i, alert in enumerate(self.safety_alerts[:2])],
+                *[(f"* {text}", (10, 240 + i * 40), 0.6, (255, 100, 0), 2)
+                  for i, text in enumerate(self.feedback[:2])]
+            ])
+        elif results.busy:
+            self.hud.draw(image, [(BUSY_MESSAGE, (10, 30), 0.8, (0, 165, 255), 2)])
 
-            # Display safety alerts in red
-            for i, alert in enumerate(self.safety_alerts[:2]):
-                cv2.putText(image, f"! {alert}", (10, 160 + i * 40),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+        return self.frames.encode(image)
 
-            # Display feedback in blue
-            for i, text in enumerate(self.feedback[:2]):
-                cv2.putText(image, f"* {text}", (10, 240 + i * 40),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 100, 0), 2)
 
-        return av.VideoFrame.from_ndarray(image, format="bgr24")
+prewarm(**SeniorExerciseProcessor.POSE_CONFIG)
+shared_speech().preload(spoken_phrases("senior") + [STOP_MESSAGE, HELP_MESSAGE], VOICE)
 
 
 def senior_exercise_panel():
@@ -378,6 +159,7 @@ def senior_exercise_panel():
 
     # Sidebar with large, clear controls
     st.sidebar.markdown("### 👴 Senior Exercise Settings")
+    username = st.sidebar.text_input("Your Name", value="Guest")
 
     # Voice guidance settings
     st.sidebar.markdown("#### 🔊 Voice Guidance")
@@ -490,9 +272,7 @@ def senior_exercise_panel():
         processor.current_exercise = selected_exercise
 
         # Welcome voice message
-        if voice_enabled and st.button("🎤 Start Voice Guidance"):
-            speak_async(
-                f"Welcome to senior exercises. Let's begin with {selected_exercise}. Remember to move slowly and safely.")
+        greet = voice_enabled and st.button("🎤 Start Voice Guidance")
 
         # Webcam stream
         webrtc_ctx = webrtc_streamer(
@@ -501,19 +281,29 @@ def senior_exercise_panel():
             rtc_configuration=RTCConfiguration({
                 "iceServers": [{"urls": ["stun:stun.l.google.com:19302"]}]
             }),
-            media_stream_constraints={"video": True, "audio": False}
+            # The microphone track is answered with this session's coaching audio
+            audio_processor_factory=CoachAudioProcessor,
+            media_stream_constraints={"video": True, "audio": True}
         )
+        voice_out = webrtc_ctx.audio_processor.mixer if webrtc_ctx.audio_processor else None
+        if greet:
+            speak_async(
+                f"Welcome to senior exercises. Let's begin with {selected_exercise}. Remember to move slowly and safely.",
+                sink=voice_out)
 
         # Real-time feedback display
         if webrtc_ctx.video_processor:
             processor = webrtc_ctx.video_processor
+            processor.username, processor.current_exercise = username, selected_exercise
+            processor.voice_out = voice_out
+            st.caption(tuning_summary(processor.stats()))
 
             # Safety alerts (high priority)
             if processor.safety_alerts and safety_alerts:
                 for alert in processor.safety_alerts:
                     st.markdown(f'<div class="safety-alert">⚠️ {alert}</div>', unsafe_allow_html=True)
                     if voice_enabled:
-                        speak_async(f"Safety alert: {alert}")
+                        speak_async(f"Safety alert: {alert}", ALERT, sink=voice_out)
 
             # Exercise feedback
             st.markdown("### 💬 Coach Feedback")
@@ -533,7 +323,7 @@ def senior_exercise_panel():
                 st.metric("Safety Score", f"{processor.accuracy_score:.1f}%")
 
             with col4:
-                st.metric("Reps Completed", int(processor.rep_count))
+                st.metric("Reps Completed", whole_reps(processor.rep_count))
 
             with col5:
                 st.metric("Exercise Time", "2:30")
@@ -585,13 +375,13 @@ def senior_exercise_panel():
 
     with help_col1:
         if st.button("🆘 Emergency Stop", use_container_width=True):
-            speak_async("Exercise stopped immediately. Please sit down and rest. Help is available if needed.")
+            speak_async(STOP_MESSAGE, ALERT, sink=voice_out)
             st.error("EMERGENCY STOP: Exercise paused. Rest and seek help if needed.")
 
     with help_col2:
         if st.button("📞 Call for Help", use_container_width=True):
             st.warning("Emergency contact feature would connect to caregiver or medical help")
-            speak_async("Help has been notified. Please remain calm and seated.")
+            speak_async(HELP_MESSAGE, ALERT, sink=voice_out)
 
 
 # Setup senior animations folder
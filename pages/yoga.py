@@ -1,198 +1,83 @@
 import streamlit as st
-import cv2
-import mediapipe as mp
-import numpy as np
-import av
 from streamlit_webrtc import webrtc_streamer, VideoProcessorBase, RTCConfiguration
+from coach.autotune import tuning_summary
+from coach.events import RepTracker, shared_writer
+from coach.frames import FramePipeline
+from coach.pose_engine import BUSY_MESSAGE, PoseSession, prewarm
+from coach.render import HudText, draw_skeleton
+from coach.rules import RuleSession
 import os
 
-# MediaPipe setup
-mp_pose = mp.solutions.pose
-mp_drawing = mp.solutions.drawing_utils
-
 
 class YogaPoseProcessor(VideoProcessorBase):
+    POSE_CONFIG = dict(
+        min_detection_confidence=0.7,
+        min_tracking_confidence=0.7,
+        model_complexity=0  # lite model; coach.rules smooths its landmarks
+    )
+
     def __init__(self):
-        self.pose = mp_pose.Pose(
-            min_detection_confidence=0.7,
-            min_tracking_confidence=0.7,
-            model_complexity=1
-        )
+        # The estimator is checked out of the shared pool on the first frame
+        self.session = PoseSession(**self.POSE_CONFIG)
+        self.frames = FramePipeline()
+        self.rules = RuleSession("yoga")
+        self.hud = HudText()
+        # Reps are saved as they happen (see coach.events)
+        self.progress = RepTracker()
+        self.username = None  # set by the page; no reps are published before it is
         self.current_pose = "Mountain Pose"
         self.feedback = []
         self.accuracy_score = 0
         self.rep_count = 0
         self.stage = None
 
-    def calculate_angle(self, a, b, c):
-        """Calculate angle between three points"""
-        a = np.array(a)
-        b = np.array(b)
-        c = np.array(c)
-
-        radians = np.arctan2(c[1] - b[1], c[0] - b[0]) - np.arctan2(a[1] - b[1], a[0] - b[0])
-        angle = np.abs(radians * 180.0 / np.pi)
+    def on_ended(self):
+        """Return the estimator to the pool and close the rep segment when the stream stops"""
+        self.session.close()
+        self.progress.end()
 
-        if angle > 180.0:
-            angle = 360 - angle
-
-        return angle
-
-    def check_mountain_pose(self, landmarks):
-        """Check Mountain Pose (Tadasana)"""
-        feedback = []
-        accuracy_points = 0
-        total_points = 0
-
-        # Shoulder alignment
-        left_shoulder = [landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].x,
-                         landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].y]
-        right_shoulder = [landmarks[mp_pose.PoseLandmark.RIGHT_SHOULDER.value].x,
-                          landmarks[mp_pose.PoseLandmark.RIGHT_SHOULDER.value].y]
-
-        shoulder_diff = abs(left_shoulder[1] - right_shoulder[1])
-        total_points += 1
-        if shoulder_diff < 0.02:
-            accuracy_points += 1
-        else:
-            feedback.append("Level your shoulders")
-
-        # Hip alignment
-        left_hip = [landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].x,
-                    landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].y]
-        right_hip = [landmarks[mp_pose.PoseLandmark.RIGHT_HIP.value].x,
-                     landmarks[mp_pose.PoseLandmark.RIGHT_HIP.value].y]
-
-        hip_diff = abs(left_hip[1] - right_hip[1])
-        total_points += 1
-        if hip_diff < 0.02:
-            accuracy_points += 1
-        else:
-            feedback.append("Align hips evenly")
-
-        return feedback, (accuracy_points / total_points) * 100 if total_points > 0 else 0
-
-    def check_warrior_ii(self, landmarks):
-        """Check Warrior II Pose"""
-        feedback = []
-        accuracy_points = 0
-        total_points = 0
-
-        # Front knee angle
-        hip = [landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].x,
-               landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].y]
-        knee = [landmarks[mp_pose.PoseLandmark.LEFT_KNEE.value].x,
-                landmarks[mp_pose.PoseLandmark.LEFT_KNEE.value].y]
-        ankle = [landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value].x,
-                 landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value].y]
-
-        knee_angle = self.calculate_angle(hip, knee, ankle)
-        total_points += 1
-        if 80 < knee_angle < 100:
-            accuracy_points += 1
-            if self.stage != "correct":
-                self.stage = "correct"
-                self.rep_count += 0.1  # Partial rep for holding correctly
-        else:
-            feedback.append(f"Bend front knee to 90° (Current: {knee_angle:.1f}°)")
-            self.stage = "incorrect"
-
-        return feedback, (accuracy_points / total_points) * 100 if total_points > 0 else 0
-
-    def check_tree_pose(self, landmarks):
-        """Check Tree Pose"""
-        feedback = []
-        accuracy_points = 0
-        total_points = 0
-
-        # Foot placement relative to knee
-        ankle = [landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value].x,
-                 landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value].y]
-        knee = [landmarks[mp_pose.PoseLandmark.RIGHT_KNEE.value].x,
-                landmarks[mp_pose.PoseLandmark.RIGHT_KNEE.value].y]
-
-        vertical_diff = abs(ankle[0] - knee[0])
-        total_points += 1
-        if vertical_diff < 0.05:
-            accuracy_points += 1
-            if self.stage != "balanced":
-                self.stage = "balanced"
-                self.rep_count += 0.1
-        else:
-            feedback.append("Place foot firmly on inner thigh")
-            self.stage = "unbalanced"
-
-        return feedback, (accuracy_points / total_points) * 100 if total_points > 0 else 0
-
-    def check_downward_dog(self, landmarks):
-        """Check Downward Facing Dog"""
-        feedback = []
-        accuracy_points = 0
-        total_points = 0
-
-        # Hip angle for inverted V
-        wrist = [landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].x,
-                 landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].y]
-        hip = [landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].x,
-               landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].y]
-        ankle = [landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value].x,
-                 landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value].y]
-
-        hip_angle = self.calculate_angle(wrist, hip, ankle)
-        total_points += 1
-        if 75 < hip_angle < 105:
-            accuracy_points += 1
-        else:
-            feedback.append(f"Create a V shape (Current: {hip_angle:.1f}°)")
-
-        return feedback, (accuracy_points / total_points) * 100 if total_points > 0 else 0
+    def stats(self):
+        """Pose session (keyframes, auto-tuner) and frame pipeline counters"""
+        return {**self.session.stats(), **self.frames.stats()}
 
     def recv(self, frame):
-        image = frame.to_ndarray(format="bgr24")
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        image.flags.writeable = False
+        # Decoded once into a reused buffer; the overlay is drawn straight onto it
+        image = self.frames.decode(frame)
+        results = self.session.process(image)
 
-        results = self.pose.process(image_rgb)
-        image.flags.writeable = True
-        image = cv2.cvtColor(image_rgb, cv2.COLOR_RGB2BGR)
+        if results.landmarks is not None:
+            landmarks = results.landmarks
 
-        if results.pose_landmarks:
             # Draw pose landmarks
-            mp_drawing.draw_landmarks(
-                image, results.pose_landmarks, mp_pose.POSE_CONNECTIONS,
-                mp_drawing.DrawingSpec(color=(0, 255, 0), thickness=2, circle_radius=2),
-                mp_drawing.DrawingSpec(color=(255, 0, 0), thickness=2, circle_radius=2)
-            )
-
-            landmarks = results.pose_landmarks.landmark
-
-            # Analyze current pose
-            if self.current_pose == "Mountain Pose":
-                self.feedback, self.accuracy_score = self.check_mountain_pose(landmarks)
-            elif self.current_pose == "Warrior II":
-                self.feedback, self.accuracy_score = self.check_warrior_ii(landmarks)
-            elif self.current_pose == "Tree Pose":
-                self.feedback, self.accuracy_score = self.check_tree_pose(landmarks)
-            elif self.current_pose == "Downward Dog":
-                self.feedback, self.accuracy_score = self.check_downward_dog(landmarks)
+            draw_skeleton(image, landmarks, line_color=(255, 0, 0), point_color=(0, 255, 0),
+                          thickness=2, radius=2)
+
+            # Analyze current pose against the "yoga" rules in coach/exercises.json
+            if self.rules.select(self.current_pose):
+                result = self.rules.step(landmarks)
+                self.feedback, self.accuracy_score = result.feedback, result.accuracy
+                self.rep_count, self.stage = result.reps, result.stage
+                self.progress.update(self.username, self.current_pose, result.reps)
             else:
                 self.feedback = ["Select a pose to begin analysis"]
                 self.accuracy_score = 0
 
             # Display information on image
-            cv2.putText(image, f"Pose: {self.current_pose}", (10, 30),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
-            cv2.putText(image, f"Accuracy: {self.accuracy_score:.1f}%", (10, 60),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
-            cv2.putText(image, f"Score: {self.rep_count:.1f}", (10, 90),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 0, 0), 2)
+            self.hud.draw(image, [
+                (f"Pose: {self.current_pose}", (10, 30), 0.8, (0, 255, 0), 2),
+                (f"Accuracy: {self.accuracy_score:.1f}%", (10, 60), 0.8, (0, 255, 0), 2),
+                (f"Score: {self.rep_count:.1f}", (10, 90), 0.8, (255, 0, 0), 2),
+                # Feedback
+                *[(text, (10, 120 + i * 30), 0.6, (0, 0, 255), 2)
+                  for i, text in enumerate(self.feedback[:2])]
+            ])
+        elif results.busy:
+            self.hud.draw(image, [(BUSY_MESSAGE, (10, 30), 0.8, (0, 165, 255), 2)])
 
-            # Display feedback
-            for i, text in enumerate(self.feedback[:2]):
-                cv2.putText(image, text, (10, 120 + i * 30),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
+        return self.frames.encode(image)
 
-        return av.VideoFrame.from_ndarray(image, format="bgr24")
+
+prewarm(**YogaPoseProcessor.POSE_CONFIG)
 
 
 def yoga_panel():
@@ -334,6 +219,8 @@ def yoga_panel():
         # Real-time feedback display
         if webrtc_ctx.video_processor:
             processor = webrtc_ctx.video_processor
+            processor.username, processor.current_pose = username, selected_pose
+            st.caption(tuning_summary(processor.stats()))
 
             st.markdown("### 💬 AI Feedback")
             feedback_card = st.container()
@@ -377,7 +264,11 @@ def yoga_panel():
 
     with col7:
         if st.button("💾 Save Progress", use_container_width=True):
-            st.success("Progress saved to your yoga journal!")
+            # Scores are queued as they change; wait for them to be committed
+            if shared_writer().flush():
+                st.success("Progress saved to your yoga journal!")
+            else:
+                st.error("Couldn't save your progress yet. It is kept and will be retried, so try again shortly.")
 
     with col8:
         if st.button("📊 View History", use_container_width=True):
@@ -0,0 +1,40 @@
+import math
+
+import numpy as np
+import pytest
+
+from coach.angles import joint_angles, joint_table
+
+
+def points(*xy):
+    return np.array(xy, dtype=np.float64)
+
+
+@pytest.mark.parametrize("method", ["arctan2", "arccos"])
+@pytest.mark.parametrize("degrees", [0, 45, 90, 135, 180])
+def test_methods_agree_on_regular_triples(method, degrees):
+    theta = math.radians(degrees)
+    xy = points((1, 0), (0, 0), (math.cos(theta), math.sin(theta)))
+    assert joint_angles(xy, joint_table((0, 1, 2)), method) == pytest.approx([degrees], abs=1e-6)
+
+
+def test_angles_are_batched_per_triple():
+    xy = points((1, 0), (0, 0), (0, 1), (-1, 0))
+    table = joint_table((0, 1, 2), (0, 1, 3), (2, 1, 3))
+    np.testing.assert_allclose(joint_angles(xy, table), [90, 180, 90])
+    assert joint_angles(xy, joint_table()).shape == (0,)
+
+
+def test_zero_length_limb_gives_zero_not_nan():
+    # The old arccos helper divided by zero here and returned NaN
+    xy = points((0.5, 0.5), (0.5, 0.5), (0.7, 0.5))
+    table = joint_table((0, 1, 2), (2, 1, 0), (1, 1, 1))
+    for method in ("arccos", "arctan2"):
+        angles = joint_angles(xy, table, method)
+        assert not np.isnan(angles).any()
+        np.testing.assert_array_equal(angles, [0, 0, 0])
+
+
+def test_unknown_method_is_rejected():
+    with pytest.raises(ValueError):
+        joint_angles(points((0, 0), (1, 1), (2, 2)), joint_table((0, 1, 2)), "degrees")
@@ -0,0 +1,48 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+pytest.importorskip("pyttsx3")
+pytest.importorskip("streamlit_webrtc")
+
+from coach.audio_out import VoiceMixer  # noqa: E402
+from coach.speech import ALERT, COACHING  # noqa: E402
+
+
+def clip(seconds, rate, level=1000):
+    return SimpleNamespace(samples=np.full(int(seconds * rate), level, dtype=np.int16), rate=rate)
+
+
+def voiced(mixer, count, rate):
+    """Samples read before the mixer falls silent"""
+    total = 0
+    while True:
+        pcm = mixer.read(count, rate)
+        total += int(np.count_nonzero(pcm))
+        if not pcm.any():
+            return total
+
+
+@pytest.mark.parametrize("rate", [48000, 16000, 8000])
+def test_clips_are_resampled_to_the_rate_they_are_read_at(rate):
+    mixer = VoiceMixer()
+    mixer.play(clip(0.5, 22050), COACHING)  # queued before the track has read anything
+    assert voiced(mixer, rate // 50, rate) == pytest.approx(rate // 2, abs=1)
+
+
+def test_a_rate_change_mid_clip_keeps_the_clip_length():
+    mixer = VoiceMixer()
+    mixer.play(clip(0.5, 16000), COACHING)
+    first = np.count_nonzero(mixer.read(4800, 48000))  # 0.1 s at 48 kHz
+    rest = voiced(mixer, 160, 8000)  # the other 0.4 s at 8 kHz
+    assert first == 4800 and rest == pytest.approx(3200, abs=1)
+
+
+def test_an_alert_cuts_off_coaching():
+    mixer = VoiceMixer()
+    mixer.play(clip(1.0, 48000, level=1), COACHING)
+    mixer.read(960, 48000)
+    mixer.play(clip(0.1, 48000, level=2), ALERT)
+    assert set(mixer.read(960, 48000)) == {2}
+    assert mixer.stats["cut"] == 1
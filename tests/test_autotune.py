@@ -0,0 +1,63 @@
+from coach.autotune import CALM_WINDOWS, AutoTuner, tuning_summary
+
+
+def windows(tuner, latency_ms, count=1, window=10):
+    for _ in range(count * window):
+        tuner.record(latency_ms)
+
+
+def test_overload_steps_down_the_model_then_the_rate():
+    tuner = AutoTuner(2, budget_ms=50, window=10)
+    steps = []
+    for _ in range(5):
+        windows(tuner, 80)
+        steps.append((tuner.complexity, tuner.target_fps))
+    assert steps == [(1, 30), (0, 30), (0, 15), (0, 7.5), (0, 5)]
+    windows(tuner, 80)
+    assert (tuner.complexity, tuner.target_fps) == (0, 5)  # nothing left to give
+    assert tuner.degraded and tuner.changes == 5
+
+
+def test_headroom_climbs_back_to_the_configured_model():
+    tuner = AutoTuner(1, budget_ms=50, window=10)
+    windows(tuner, 80, count=3)
+    assert (tuner.complexity, tuner.target_fps) == (0, 7.5)
+
+    windows(tuner, 10, count=CALM_WINDOWS - 1)
+    assert tuner.target_fps == 7.5  # not calm for long enough yet
+    windows(tuner, 10, count=CALM_WINDOWS)
+    assert tuner.target_fps == 15
+    windows(tuner, 10, count=2 * CALM_WINDOWS)
+    assert (tuner.complexity, tuner.target_fps) == (1, 30)
+    windows(tuner, 10, count=2 * CALM_WINDOWS)
+    assert (tuner.complexity, tuner.target_fps) == (1, 30) and not tuner.degraded
+
+
+def test_latency_near_the_budget_holds_steady():
+    tuner = AutoTuner(1, budget_ms=50, window=10)
+    windows(tuner, 40, count=3 * CALM_WINDOWS)
+    assert tuner.changes == 0
+
+
+def test_a_busy_window_resets_the_calm_count():
+    tuner = AutoTuner(1, budget_ms=50, window=10)
+    windows(tuner, 80)
+    windows(tuner, 10, count=CALM_WINDOWS - 1)
+    windows(tuner, 40)
+    windows(tuner, 10, count=CALM_WINDOWS - 1)
+    assert tuner.complexity == 0
+
+
+def test_throttled_rate_skips_frames():
+    tuner = AutoTuner(0, budget_ms=50, window=10)
+    windows(tuner, 80)
+    assert tuner.target_fps == 15
+    tuner.record(30.0, timestamp=1.0)
+    assert not tuner.due(1.0 + 1 / 30)
+    assert tuner.due(1.0 + 1 / 15)
+    assert tuner.throttled == 1
+
+
+def test_summary_line():
+    assert tuning_summary({}) == "Pose model: waiting for the stream"
+    assert "lite" in tuning_summary(AutoTuner(0).stats())
@@ -0,0 +1,114 @@
+import sqlite3
+
+import numpy as np
+
+from coach.events import ProgressWriter, RepTracker
+from coach.landmarks import LEFT_ANKLE, LEFT_HIP, LEFT_KNEE, NUM_LANDMARKS, VISIBILITY, X, Y
+from coach.rules import RuleSession
+
+
+class FakeWriter:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, kind, session_id, username, exercise, reps):
+        self.published.append((kind, exercise, reps))
+
+
+def warrior(knee_bent):
+    """Landmarks with the front knee at 90° when bent, straight otherwise"""
+    landmarks = np.zeros((NUM_LANDMARKS, 4), dtype=np.float32)
+    landmarks[:, VISIBILITY] = 1.0
+    landmarks[LEFT_HIP, [X, Y]] = (0.4, 0.5)
+    landmarks[LEFT_KNEE, [X, Y]] = (0.4, 0.7)
+    landmarks[LEFT_ANKLE, [X, Y]] = (0.6, 0.7) if knee_bent else (0.4, 0.9)
+    return landmarks
+
+
+def test_ten_yoga_steps_publish_one_rep():
+    rules = RuleSession("yoga")
+    rules.select("Warrior II")
+    writer = FakeWriter()
+    tracker = RepTracker(writer=writer)
+    tracker.update("alice", "Warrior II", rules.reps)
+    t = 0.0
+    for _ in range(10):
+        for bent in (False, True):
+            t += 1.0  # longer than the smoothing gap, so each pose is taken as is
+            rules.step(warrior(bent), timestamp=t)
+        tracker.update("alice", "Warrior II", rules.reps)
+
+    assert rules.reps != 1.0  # ten 0.1 steps don't sum to exactly 1
+    assert writer.published == [("rep", "Warrior II", 1)]
+    tracker.end()
+    assert writer.published[-1] == ("end", "Warrior II", 1)
+
+
+def test_reps_wait_for_the_username():
+    writer = FakeWriter()
+    tracker = RepTracker(writer=writer)
+    tracker.update(None, "Squat", 0)
+    tracker.update(None, "Squat", 2)
+    assert writer.published == [] and tracker.session_id is None
+    tracker.update("alice", "Squat", 2)
+    tracker.update("alice", "Squat", 3)
+    assert writer.published == [("rep", "Squat", 1)]
+
+
+class FlakyStorage:
+    """Fails the first ``failures`` writes, then records what it is given"""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.rows = []
+
+    def write(self, steps):
+        if self.failures:
+            self.failures -= 1
+            raise sqlite3.OperationalError("database is locked")
+        self.rows.extend(row for name, rows in steps if name == "upsert_progress" for row in rows)
+
+    def execute_many(self, name, rows):
+        pass
+
+
+class FakeRanks:
+    def __init__(self):
+        self.recorded = []
+
+    def record(self, session_id, name, reps, ended=False):
+        self.recorded.append((session_id, reps, ended))
+
+
+def test_failed_batch_is_retried_with_its_end_event():
+    storage = FlakyStorage(failures=1)
+    ranks = FakeRanks()
+    writer = ProgressWriter(storage=storage, batch_ms=10, ranks=ranks)
+    writer.publish("rep", "s1", "alice", "Squats", 3)
+    writer.publish("end", "s1", "alice", "Squats", 4)
+    assert not writer.flush(timeout_ms=0)
+    assert writer.stats["errors"] == 1 and storage.rows == []
+
+    writer.publish("rep", "s2", "bob", "Squats", 1)
+    writer.close()
+    assert [row[:4] for row in storage.rows] == [("s1", "alice", "Squats", 4), ("s2", "bob", "Squats", 1)]
+    assert ranks.recorded == [("s1", 4, True), ("s2", 1, False)]
+
+
+def test_flush_waits_for_a_failed_batch_to_commit():
+    storage = FlakyStorage(failures=1)
+    writer = ProgressWriter(storage=storage, batch_ms=10)
+    writer.publish("rep", "s1", "alice", "Squats", 3)
+    assert writer.flush()  # the retry lands RETRY_MS later
+    assert [row[:4] for row in storage.rows] == [("s1", "alice", "Squats", 3)]
+    writer.close()
+
+
+def test_flush_reports_reps_that_are_still_unsaved():
+    storage = FlakyStorage(failures=100)
+    writer = ProgressWriter(storage=storage, batch_ms=10)
+    writer.publish("rep", "s1", "alice", "Squats", 3)
+    assert not writer.flush(timeout_ms=50)
+    storage.failures = 0
+    assert writer.flush()
+    writer.close()
@@ -0,0 +1,46 @@
+import av
+import cv2
+import numpy as np
+import pytest
+
+from coach.frames import FramePipeline
+
+
+def picture(height, width, seed=0):
+    """Smooth random colours, like camera content rather than per-pixel noise"""
+    noise = np.random.default_rng(seed).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    return cv2.GaussianBlur(noise, (7, 7), 0)
+
+
+@pytest.mark.parametrize("height, width", [(48, 64), (120, 70), (480, 640)])
+def test_i420_decode_matches_pyav_bgr24(height, width):
+    frame = av.VideoFrame.from_ndarray(picture(height, width), format="bgr24").reformat(format="yuv420p")
+    expected = frame.to_ndarray(format="bgr24")
+    decoded = FramePipeline().decode(frame)
+    assert decoded.shape == expected.shape
+    # OpenCV and libswscale round the YUV -> BGR conversion slightly differently
+    diff = np.abs(decoded.astype(np.int16) - expected)
+    assert diff.max() <= 4 and diff.mean() < 1.5
+
+
+@pytest.mark.parametrize("height, width, fmt", [(48, 64, "bgr24"), (47, 63, "yuv420p"), (48, 64, "rgb24")])
+def test_other_frames_decode_exactly(height, width, fmt):
+    frame = av.VideoFrame.from_ndarray(picture(height, width), format="bgr24")
+    if fmt != "bgr24":
+        frame = frame.reformat(format=fmt)
+    np.testing.assert_array_equal(FramePipeline().decode(frame), frame.to_ndarray(format="bgr24"))
+
+
+def test_decode_reuses_the_buffer_until_the_size_changes():
+    pipeline = FramePipeline()
+    first = pipeline.decode(av.VideoFrame.from_ndarray(picture(48, 64), format="bgr24").reformat(format="yuv420p"))
+    second = pipeline.decode(av.VideoFrame.from_ndarray(picture(48, 64, seed=1), format="bgr24")
+                             .reformat(format="yuv420p"))
+    assert second is first
+    third = pipeline.decode(av.VideoFrame.from_ndarray(picture(96, 128), format="bgr24"))
+    assert third is not first and third.shape == (96, 128, 3)
+
+
+def test_copying_decode_is_kept_for_comparison():
+    frame = av.VideoFrame.from_ndarray(picture(48, 64), format="bgr24").reformat(format="yuv420p")
+    np.testing.assert_array_equal(FramePipeline(copy_free=False).decode(frame), frame.to_ndarray(format="bgr24"))
@@ -0,0 +1,46 @@
+import json
+import multiprocessing
+
+from coach.hydration import LEGACY_USER, HydrationLog, migrate_legacy
+
+LEGACY = {
+    "history": {
+        "2026-03-01": [{"time": "08:00:00", "amount_l": 0.5}, {"time": "12:00:00", "amount_l": 1.5}],
+        "2026-03-02": [{"time": "09:30:00", "amount_l": 2.0}],
+    },
+    "last_completed": "2026-03-02",
+    "streak": 2,
+}
+
+
+def test_concurrent_migrations_import_once(tmp_path):
+    legacy_file = tmp_path / "water_data.json"
+    legacy_file.write_text(json.dumps(LEGACY))
+    directory = tmp_path / "hydration"
+
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(4) as pool:
+        imported = pool.starmap(migrate_legacy, [(str(legacy_file), str(directory))] * 4)
+
+    assert sum(imported) == 1
+    assert not legacy_file.exists() and (tmp_path / "water_data.json.migrated").exists()
+    log = HydrationLog(LEGACY_USER, str(directory))
+    assert log.daily_totals() == {"2026-03-01": 2.0, "2026-03-02": 2.0}
+    assert log.streak() == 2
+    with open(log.path) as f:
+        goals = [json.loads(line) for line in f if '"goal"' in line]
+    assert [goal["id"] for goal in goals] == ["goal-2026-03-02", "goal-2026-03-01"]
+
+
+def test_rerun_after_interrupted_import_adds_nothing(tmp_path):
+    legacy_file = tmp_path / "water_data.json"
+    legacy_file.write_text(json.dumps(LEGACY))
+    directory = tmp_path / "hydration"
+    assert migrate_legacy(str(legacy_file), str(directory))
+    (tmp_path / "water_data.json.migrated").rename(legacy_file)  # as if the rename never happened
+
+    assert migrate_legacy(str(legacy_file), str(directory))
+    log = HydrationLog(LEGACY_USER, str(directory))
+    with open(log.path) as f:
+        assert sum(1 for _ in f) == 5
+    assert log.daily_totals() == {"2026-03-01": 2.0, "2026-03-02": 2.0}
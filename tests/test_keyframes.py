@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from coach.keyframes import FAST_MOTION, MAX_KEYFRAME_INTERVAL, SLOW_MOTION, KeyframeScheduler, LandmarkPredictor
+from coach.landmarks import NUM_LANDMARKS, VISIBILITY, X, Y
+
+
+def frame(x, y=0.5, visibility=1.0):
+    landmarks = np.zeros((NUM_LANDMARKS, 4), dtype=np.float32)
+    landmarks[:, X], landmarks[:, Y], landmarks[:, VISIBILITY] = x, y, visibility
+    return landmarks
+
+
+def test_predictor_starts_at_the_first_measurement():
+    predictor = LandmarkPredictor()
+    predictor.update(frame(0.3), 0.0)
+    assert predictor.initialized
+    np.testing.assert_allclose(predictor.predict(0.5), frame(0.3))
+    assert predictor.speed() == 0.0
+
+
+def test_predictor_extrapolates_constant_velocity():
+    predictor = LandmarkPredictor()
+    for i in range(30):
+        t = i / 30
+        predictor.update(frame(0.2 + 0.6 * t), t)  # 0.6 units/sec to the right
+    predicted = predictor.predict(32 / 30)
+    np.testing.assert_allclose(predicted[:, X], 0.2 + 0.6 * 32 / 30, atol=1e-3)
+    np.testing.assert_allclose(predicted[:, Y], 0.5, atol=1e-6)
+    assert predictor.speed() == pytest.approx(0.6, rel=0.01)
+
+
+def test_predictor_speed_ignores_invisible_landmarks():
+    predictor = LandmarkPredictor()
+    moving = frame(0.2, visibility=0.0)
+    moving[0, VISIBILITY] = 1.0
+    predictor.update(moving, 0.0)
+    moving = moving.copy()
+    moving[1:, X] += 0.5  # only hidden landmarks move
+    predictor.update(moving, 1 / 30)
+    assert predictor.speed() == pytest.approx(0.0, abs=1e-6)
+
+
+def test_predictor_reset_takes_the_next_measurement_as_is():
+    predictor = LandmarkPredictor()
+    predictor.update(frame(0.2), 0.0)
+    predictor.update(frame(0.3), 0.1)
+    predictor.reset()
+    assert not predictor.initialized
+    predictor.update(frame(0.9), 5.0)
+    np.testing.assert_allclose(predictor.predict(5.0)[:, X], 0.9)
+
+
+def test_every_frame_is_a_keyframe_until_tracking():
+    scheduler = KeyframeScheduler()
+    assert all(scheduler.is_keyframe(0.0, tracking=False) for _ in range(5))
+    assert (scheduler.keyframes, scheduler.predicted) == (5, 0)
+
+
+@pytest.mark.parametrize("speed, interval", [
+    (FAST_MOTION, 1), (FAST_MOTION + 1, 1),
+    (SLOW_MOTION, MAX_KEYFRAME_INTERVAL), (0.0, MAX_KEYFRAME_INTERVAL),
+])
+def test_keyframe_interval_follows_motion(speed, interval):
+    scheduler = KeyframeScheduler()
+    decisions = [scheduler.is_keyframe(speed, tracking=True) for _ in range(4 * interval)]
+    assert scheduler.interval == interval
+    assert decisions == ([False] * (interval - 1) + [True]) * 4
+
+
+def test_keyframe_interval_shrinks_as_motion_speeds_up():
+    scheduler = KeyframeScheduler()
+    speeds = np.linspace(SLOW_MOTION, FAST_MOTION, 20)
+    intervals = [scheduler._interval_for(speed) for speed in speeds]
+    assert intervals[0] == MAX_KEYFRAME_INTERVAL and intervals[-1] == 1
+    assert all(a >= b for a, b in zip(intervals, intervals[1:]))
+
+
+def test_slow_inference_stretches_the_interval():
+    scheduler = KeyframeScheduler(latency_budget_ms=15.0)
+    scheduler.record_latency(40.0)
+    assert scheduler._interval_for(FAST_MOTION) == 3  # ceil(40 / 15)
+    scheduler.record_latency(1000.0)
+    assert scheduler._interval_for(FAST_MOTION) == MAX_KEYFRAME_INTERVAL
+
+
+def test_latency_is_a_moving_average():
+    scheduler = KeyframeScheduler()
+    scheduler.record_latency(10.0)
+    scheduler.record_latency(20.0)
+    assert scheduler.latency_ms == pytest.approx(12.0)
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from coach.landmarks import NUM_LANDMARKS, X, Y, Z
+from coach.letterbox import Letterbox
+
+
+def marked_frame(height, width, at):
+    """A black frame with a white square centred on normalised point ``at``"""
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    cx, cy = round(at[0] * width), round(at[1] * height)
+    image[cy - 6:cy + 6, cx - 6:cx + 6] = 255
+    return image
+
+
+def centroid(buffer):
+    ys, xs = np.nonzero(buffer[:, :, 0] > 127)
+    return (xs.mean() + 0.5) / buffer.shape[1], (ys.mean() + 0.5) / buffer.shape[0]
+
+
+@pytest.mark.parametrize("height, width", [(480, 640), (640, 480), (300, 300), (720, 1280)])
+def test_unproject_round_trips_a_point_through_the_buffer(height, width):
+    letterbox = Letterbox(128)
+    at = (0.3, 0.7)
+    buffer = letterbox.fit(marked_frame(height, width, at))
+    assert buffer.shape == (128, 128, 3)
+
+    landmarks = np.zeros((NUM_LANDMARKS, 4), dtype=np.float32)
+    landmarks[:, X], landmarks[:, Y] = centroid(buffer)
+    letterbox.unproject(landmarks)
+    assert landmarks[0, X] == pytest.approx(at[0], abs=2 / 128)
+    assert landmarks[0, Y] == pytest.approx(at[1], abs=2 / 128)
+
+
+def test_unproject_maps_the_content_edges_to_the_frame_edges():
+    letterbox = Letterbox(100)
+    letterbox.fit(np.zeros((50, 100, 3), dtype=np.uint8))  # content fills rows 25..75
+    landmarks = np.zeros((NUM_LANDMARKS, 4), dtype=np.float32)
+    landmarks[:2, X] = (0.0, 1.0)
+    landmarks[:2, Y] = (0.25, 0.75)
+    landmarks[:2, Z] = 0.1
+    letterbox.unproject(landmarks)
+    np.testing.assert_allclose(landmarks[:2, [X, Y]], [[0, 0], [1, 1]], atol=1e-6)
+    np.testing.assert_allclose(landmarks[:2, Z], 0.1)  # depth scales with x, which isn't stretched here
+
+
+def test_padding_is_cleared_when_the_frame_shape_changes():
+    letterbox = Letterbox(64)
+    letterbox.fit(np.full((64, 32, 3), 255, dtype=np.uint8))  # tall: pads left and right
+    buffer = letterbox.fit(np.full((32, 64, 3), 255, dtype=np.uint8))  # wide: pads top and bottom
+    assert not buffer[:16].any() and not buffer[48:].any()
+    assert (buffer[16:48] == 255).all()
+
+
+def test_fit_reuses_one_buffer():
+    letterbox = Letterbox(64)
+    first = letterbox.fit(np.zeros((48, 64, 3), dtype=np.uint8))
+    assert letterbox.fit(np.ones((48, 64, 3), dtype=np.uint8)) is first
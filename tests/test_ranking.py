@@ -0,0 +1,54 @@
+import random
+
+from coach.ranking import RankIndex
+from coach.storage import Storage, day_key
+
+TS = 1_750_000_000
+
+
+def progress(storage, rows):
+    """Write (session_id, name, reps) rows the way the rep writer does"""
+    rows = [(session_id, name, "Squat", reps, TS, day_key(TS)) for session_id, name, reps in rows]
+    storage.write([
+        ("add_user", [(name,) for name in dict.fromkeys(row[1] for row in rows)]),  # ids in order of appearance
+        ("add_exercise", [("Squat",)]),
+        ("upsert_progress", rows),
+    ])
+
+
+def sql_order(storage):
+    page = storage.query("leaderboard_page", (1000, 0))
+    return list(page[["rank", "username", "total_reps"]].itertuples(index=False, name=None))
+
+
+def test_warmed_index_matches_sql_leaderboard(tmp_path):
+    storage = Storage(str(tmp_path / "logs.db"), readers=1)
+    rng = random.Random(7)
+    names = [f"member{i:02d}" for i in range(40)]
+    # Few distinct totals, so plenty of ties for the user id to break
+    progress(storage, [(f"s{i}", rng.choice(names), rng.choice([5, 10, 15])) for i in range(150)])
+
+    ranks = RankIndex()
+    ranks.warm(storage)
+    expected = sql_order(storage)
+    assert ranks.top(len(expected)) == expected
+    for rank, name, _ in expected:
+        assert ranks.rank(name) == rank
+        assert storage.query("user_rank", (name,))["rank"].iloc[0] == rank
+
+
+def test_recorded_sessions_keep_the_sql_order(tmp_path):
+    storage = Storage(str(tmp_path / "logs.db"), readers=1)
+    progress(storage, [("s1", "ann", 10), ("s2", "bob", 10), ("s3", "cat", 4)])
+    ranks = RankIndex()
+    ranks.warm(storage)
+
+    # cat's new session catches up with ann and bob; the newcomer dan overtakes everyone
+    updates = [("s4", "cat", 3), ("s4", "cat", 6), ("s5", "dan", 12)]
+    for session_id, name, reps in updates:
+        ranks.record(session_id, name, reps)
+        progress(storage, [(session_id, name, reps)])
+    ranks.record("s4", "cat", 6, ended=True)
+
+    assert ranks.top(10) == sql_order(storage) == [(1, "dan", 12), (2, "ann", 10), (3, "bob", 10), (4, "cat", 10)]
+    assert ranks.around("bob", radius=1) == [(2, "ann", 10), (3, "bob", 10), (4, "cat", 10)]
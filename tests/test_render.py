@@ -0,0 +1,70 @@
+import cv2
+import numpy as np
+import pytest
+
+from coach.landmarks import LEFT_ELBOW, LEFT_SHOULDER, NUM_LANDMARKS, VISIBILITY, X, Y
+from coach.render import FONT, HudText, draw_skeleton
+
+
+def background(seed=0):
+    return np.random.default_rng(seed).integers(0, 256, (120, 200, 3), dtype=np.uint8)
+
+
+LINES = [
+    ("Reps: 12", (10, 30), 0.8, (0, 0, 255), 2),
+    ("Keep curling!", (10, 60), 0.6, (0, 255, 0), 1),
+    ("Confidence: 97.5%", (20, 100), 1.0, (255, 255, 0), 3),
+    ("Clipped at the edge", (150, 10), 0.8, (12, 34, 56), 2),  # runs off the top and right
+    ("Off frame", (300, 300), 0.8, (255, 255, 255), 2),
+]
+
+
+@pytest.mark.parametrize("line", LINES, ids=[line[0] for line in LINES])
+def test_hud_matches_puttext(line):
+    text, origin, scale, color, thickness = line
+    expected = cv2.putText(background(), text, origin, FONT, scale, color, thickness)
+    drawn = HudText().draw(background(), [line])
+    # putText blends partly covered edge pixels itself; the cached overlay can round them one off
+    assert np.abs(drawn.astype(np.int16) - expected).max() <= 1
+
+
+def test_hud_renders_each_line_once():
+    hud = HudText()
+    for seed in range(3):
+        hud.draw(background(seed), LINES[:2])
+    assert hud.rendered == 2
+    hud.draw(background(), [("Reps: 13", (10, 30), 0.8, (0, 0, 255), 2)])
+    assert hud.rendered == 3
+
+
+def test_hud_cache_drops_the_least_recently_used_line():
+    hud = HudText(cache_size=2)
+    a, b, c = LINES[:3]
+    hud.draw(background(), [a, b])
+    hud.draw(background(), [a])  # a is now the most recent
+    hud.draw(background(), [c])  # evicts b
+    hud.draw(background(), [a])
+    assert hud.rendered == 3
+    hud.draw(background(), [b])
+    assert hud.rendered == 4
+
+
+def test_skeleton_draws_only_bones_between_visible_joints():
+    landmarks = np.zeros((NUM_LANDMARKS, 4), dtype=np.float32)
+    landmarks[LEFT_SHOULDER, [X, Y]] = (0.2, 0.5)
+    landmarks[LEFT_ELBOW, [X, Y]] = (0.8, 0.5)
+    landmarks[[LEFT_SHOULDER, LEFT_ELBOW], VISIBILITY] = 1.0
+    image = draw_skeleton(np.zeros((100, 100, 3), dtype=np.uint8), landmarks, (0, 255, 0))
+    ys, xs = np.nonzero(image[:, :, 1])
+    assert xs.min() <= 21 and xs.max() >= 79 and abs(ys.mean() - 50) < 1
+    assert not image[:, :, [0, 2]].any()
+
+    landmarks[LEFT_ELBOW, VISIBILITY] = 0.2
+    assert not draw_skeleton(np.zeros((100, 100, 3), dtype=np.uint8), landmarks).any()
+
+
+def test_skeleton_joints_are_drawn_when_asked():
+    landmarks = np.zeros((NUM_LANDMARKS, 4), dtype=np.float32)
+    landmarks[LEFT_SHOULDER] = (0.5, 0.5, 0, 1.0)
+    image = draw_skeleton(np.zeros((100, 100, 3), dtype=np.uint8), landmarks, point_color=(0, 0, 255))
+    assert image[50, 50, 2] > 0
@@ -0,0 +1,172 @@
+import math
+from itertools import count
+
+import numpy as np
+import pytest
+
+from coach.landmarks import (LEFT_ANKLE, LEFT_ELBOW, LEFT_HIP, LEFT_KNEE, LEFT_SHOULDER, LEFT_WRIST,
+                             NOSE, NUM_LANDMARKS, RIGHT_ANKLE, RIGHT_ELBOW, RIGHT_HIP, RIGHT_KNEE,
+                             RIGHT_SHOULDER, RIGHT_WRIST, VISIBILITY, X, Y)
+from coach.rules import RuleSession, whole_reps
+
+
+def blank():
+    landmarks = np.zeros((NUM_LANDMARKS, 4), dtype=np.float32)
+    landmarks[:, VISIBILITY] = 1.0
+    return landmarks
+
+
+def with_angle(degrees, a, b, c):
+    """Landmarks with ``degrees`` at joint ``b`` between limbs to ``a`` and ``c``"""
+    landmarks = blank()
+    theta = math.radians(degrees)
+    landmarks[b, [X, Y]] = (0.5, 0.5)
+    landmarks[a, [X, Y]] = (0.5, 0.3)
+    landmarks[c, [X, Y]] = (0.5 + 0.2 * math.sin(theta), 0.5 - 0.2 * math.cos(theta))
+    return landmarks
+
+
+class Stepper:
+    """Steps a RuleSession with frames far enough apart that smoothing passes them through"""
+
+    def __init__(self, catalog, exercise):
+        self.rules = RuleSession(catalog)
+        assert self.rules.select(exercise)
+        self._clock = count(1)
+
+    def __call__(self, landmarks):
+        return self.rules.step(landmarks, timestamp=float(next(self._clock)))
+
+
+# (exercise, joint, start stage and an angle just inside/outside its zone,
+#  rep stage and an angle just inside/outside its zone)
+GYM = [
+    ("Bicep Curl", (RIGHT_SHOULDER, RIGHT_ELBOW, RIGHT_WRIST), "down", 160.5, 159.5, "up", 49.5, 50.5),
+    ("Squat", (RIGHT_HIP, RIGHT_KNEE, RIGHT_ANKLE), "up", 160.5, 159.5, "down", 89.5, 90.5),
+    ("Push-up", (LEFT_SHOULDER, LEFT_ELBOW, LEFT_WRIST), "up", 160.5, 159.5, "down", 89.5, 90.5),
+    ("Shoulder Press", (LEFT_SHOULDER, LEFT_ELBOW, LEFT_WRIST), "down", 89.5, 90.5, "up", 160.5, 159.5),
+]
+
+
+@pytest.mark.parametrize("exercise, joint, start, start_in, start_out, rep, rep_in, rep_out", GYM,
+                         ids=[row[0] for row in GYM])
+def test_gym_transitions_at_their_boundaries(exercise, joint, start, start_in, start_out, rep, rep_in, rep_out):
+    step = Stepper("gym", exercise)
+
+    result = step(with_angle(start_out, *joint))
+    assert (result.stage, result.reps) == (None, 0)
+    result = step(with_angle(rep_in, *joint))
+    assert (result.stage, result.reps) == (None, 0)  # the rep only counts coming from the start stage
+
+    result = step(with_angle(start_in, *joint))
+    assert (result.stage, result.reps) == (start, 0) and result.say
+    result = step(with_angle(start_in, *joint))
+    assert result.stage == start and result.say is None  # already there: nothing fires
+
+    result = step(with_angle(rep_out, *joint))
+    assert (result.stage, result.reps) == (start, 0)
+    result = step(with_angle(rep_in, *joint))
+    assert (result.stage, result.reps) == (rep, 1) and result.say
+    result = step(with_angle(rep_in, *joint))
+    assert (result.stage, result.reps) == (rep, 1) and result.say is None
+
+    result = step(with_angle(start_in, *joint))
+    assert (result.stage, result.reps) == (start, 1)
+
+
+def test_gym_transition_without_zones_fires_once():
+    step = Stepper("gym", "Special Needs")
+    assert step(blank()).say
+    result = step(blank())
+    assert result.stage == "active" and result.say is None
+
+
+WARRIOR = (LEFT_HIP, LEFT_KNEE, LEFT_ANKLE)
+
+
+@pytest.mark.parametrize("inside, outside", [(80.5, 79.5), (99.5, 100.5)])
+def test_warrior_ii_knee_zone_boundaries(inside, outside):
+    step = Stepper("yoga", "Warrior II")
+    assert step(with_angle(inside, *WARRIOR)).stage == "correct"
+    assert step(with_angle(outside, *WARRIOR)).stage == "incorrect"
+    result = step(with_angle(inside, *WARRIOR))
+    assert result.stage == "correct" and result.reps == pytest.approx(0.2)
+
+
+def test_tree_pose_foot_offset_boundary():
+    def pose(offset):
+        landmarks = blank()
+        landmarks[RIGHT_KNEE, X] = 0.5
+        landmarks[LEFT_ANKLE, X] = 0.5 + offset
+        return landmarks
+
+    step = Stepper("yoga", "Tree Pose")
+    assert step(pose(0.049)).stage == "balanced"
+    assert step(pose(0.051)).stage == "unbalanced"
+    assert step(pose(-0.049)).stage == "balanced"
+    assert step(pose(-0.049)).reps == pytest.approx(0.2)  # holding the pose doesn't add more
+
+
+ARM = (LEFT_SHOULDER, LEFT_ELBOW, LEFT_WRIST)
+LEG = (LEFT_HIP, LEFT_KNEE, LEFT_ANKLE)
+
+
+def test_arm_raises_hold_within_the_band():
+    step = Stepper("senior", "Arm Raises")
+    assert step(with_angle(149.5, *ARM)).stage is None
+    assert step(with_angle(150.5, *ARM)).stage == "up"
+    # Held on the previous frame, the zone reaches 5° further out
+    assert step(with_angle(146, *ARM)).stage == "up"
+    result = step(with_angle(144, *ARM))
+    assert (result.stage, result.reps) == ("down", 1)
+    # Not held any more, so the band doesn't let 146° back in
+    assert step(with_angle(146, *ARM)).stage == "down"
+    assert step(with_angle(150.5, *ARM)).stage == "up"
+
+
+def test_leg_lifts_band_widens_both_ends():
+    step = Stepper("senior", "Leg Lifts")
+    assert step(with_angle(129.5, *LEG)).stage is None
+    assert step(with_angle(130.5, *LEG)).stage == "up"
+    assert step(with_angle(164, *LEG)).stage == "up"
+    result = step(with_angle(166, *LEG))
+    assert (result.stage, result.reps) == ("down", 1)
+    assert step(with_angle(159.5, *LEG)).stage == "up"
+    assert step(with_angle(126, *LEG)).stage == "up"
+    result = step(with_angle(124, *LEG))
+    assert (result.stage, result.reps) == ("down", 2)
+
+
+def test_chair_squats_count_standing_up_from_a_partial_squat():
+    hip = (LEFT_SHOULDER, LEFT_HIP, LEFT_KNEE)
+    step = Stepper("senior", "Chair Squats")
+    assert step(with_angle(150.5, *hip)).stage is None  # standing, but never went down
+    assert step(with_angle(119.5, *hip)).stage is None  # too deep is not a partial squat
+    assert step(with_angle(120.5, *hip)).stage == "down"
+    assert step(with_angle(149.5, *hip)).stage == "down"
+    result = step(with_angle(150.5, *hip))
+    assert (result.stage, result.reps) == ("up", 1) and result.say == "Excellent! You've completed 1 squats"
+
+
+def test_neck_rotations_count_half_reps_with_band():
+    def pose(offset):
+        landmarks = blank()
+        landmarks[LEFT_SHOULDER, X] = 0.4
+        landmarks[RIGHT_SHOULDER, X] = 0.6
+        landmarks[NOSE, X] = 0.5 + offset
+        return landmarks
+
+    step = Stepper("senior", "Neck Rotations")
+    assert step(pose(0.049)).stage is None
+    for turn in (0.06, -0.06):
+        assert step(pose(turn)).stage == "turned"
+        assert step(pose(0.045)).stage == "turned"  # 0.05 less the 0.01 band
+        assert step(pose(0.035)).stage == "center"
+    assert whole_reps(step.rules.reps) == 1
+
+
+def test_senior_alerts_are_shared_by_every_exercise():
+    landmarks = with_angle(160, *ARM)
+    landmarks[LEFT_ANKLE, X], landmarks[RIGHT_ANKLE, X] = 0.2, 0.5
+    result = Stepper("senior", "Arm Raises")(landmarks)
+    assert "Widen stance for better balance" in result.alerts
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from coach.landmarks import NUM_LANDMARKS, VISIBILITY, X
+from coach.smoothing import MAX_GAP, OneEuroFilter, _alpha
+
+FPS = 30.0
+
+
+def pose(x, visibility=1.0):
+    landmarks = np.full((NUM_LANDMARKS, 4), 0.5, dtype=np.float32)
+    landmarks[:, X] = x
+    landmarks[:, VISIBILITY] = visibility
+    return landmarks
+
+
+def run(smoother, xs):
+    return np.array([smoother(pose(x), i / FPS)[:, X].copy() for i, x in enumerate(xs)])
+
+
+def test_first_frame_passes_through():
+    np.testing.assert_array_equal(OneEuroFilter()(pose(0.3, 0.7), 0.0), pose(0.3, 0.7))
+
+
+def test_converges_on_a_still_pose():
+    out = run(OneEuroFilter(), [0.2] + [0.6] * 60)
+    assert abs(out[-1, 0] - 0.6) < 1e-3
+    assert (np.diff(out[:, 0]) >= -1e-7).all()  # approaches without overshooting
+
+
+def test_reduces_jitter_on_a_still_pose():
+    noise = np.random.default_rng(0).normal(0, 0.01, 300)
+    out = run(OneEuroFilter(), 0.5 + noise)[:, 0]
+    assert out[30:].std() < noise[30:].std() / 2
+    assert abs(out[30:].mean() - 0.5) < 0.005
+
+
+def test_fast_moves_lag_less_than_plain_smoothing():
+    ramp = np.linspace(0.1, 0.9, 30)  # 0.8 units in one second
+    plain = run(OneEuroFilter(beta=0.0), ramp)[:, 0]
+    adaptive = run(OneEuroFilter(), ramp)[:, 0]
+    assert abs(ramp[-1] - adaptive[-1]) < abs(ramp[-1] - plain[-1]) / 2
+
+
+def test_beta_zero_is_exponential_smoothing():
+    out = run(OneEuroFilter(min_cutoff=1.0, beta=0.0), [0.0, 1.0, 1.0])[:, 0]
+    a = _alpha(1.0, 1 / FPS)
+    assert out[1] == pytest.approx(a)
+    assert out[2] == pytest.approx(a + a * (1 - a))
+
+
+def test_starts_over_after_a_gap():
+    smoother = OneEuroFilter()
+    smoother(pose(0.2), 0.0)
+    smoother(pose(0.2), 1 / FPS)
+    assert smoother(pose(0.8), 1 / FPS + MAX_GAP + 0.01)[0, X] == pytest.approx(0.8)
+
+
+def test_visibility_is_not_smoothed():
+    smoother = OneEuroFilter()
+    smoother(pose(0.5, 1.0), 0.0)
+    assert smoother(pose(0.5, 0.1), 1 / FPS)[0, VISIBILITY] == pytest.approx(0.1)
@@ -0,0 +1,65 @@
+import pytest
+
+pytest.importorskip("pyttsx3")
+
+from coach.speech import ALERT, COACHING, SpeechQueue  # noqa: E402
+
+
+@pytest.fixture
+def speech():
+    queue = SpeechQueue(maxsize=3)
+    queue._thread = object()  # no worker: phrases stay queued where the test can see them
+    return queue
+
+
+def waiting(queue):
+    return sorted(entry[2] for entry in queue._heap)
+
+
+def test_a_waiting_phrase_is_not_queued_twice(speech):
+    assert speech.say("Stand tall")
+    assert not speech.say("Stand tall", cooldown=0)
+    assert speech.stats["coalesced"] == 1 and waiting(speech) == ["Stand tall"]
+
+
+def test_cooldown_is_per_key(speech):
+    assert speech.say("Rep 1", key="count")
+    assert not speech.say("Rep 2", key="count")
+    assert speech.stats["cooled_down"] == 1
+    assert speech.say("Rep 2", key="count", cooldown=0)
+    assert speech.say("Rep 3")  # a different key isn't held back
+    assert waiting(speech) == ["Rep 1", "Rep 2", "Rep 3"]
+
+
+def test_a_full_queue_drops_the_oldest_coaching_line(speech):
+    for text in ("one", "two", "three", "four"):
+        assert speech.say(text)
+    assert waiting(speech) == ["four", "three", "two"]
+    assert speech.stats["evicted"] == 1
+
+
+def test_alerts_are_never_crowded_out_by_coaching(speech):
+    for text in ("stop", "slow down", "breathe"):
+        assert speech.say(text, priority=ALERT)
+    assert not speech.say("Good job")
+    assert waiting(speech) == ["breathe", "slow down", "stop"]
+
+
+def test_an_alert_drops_waiting_coaching_and_goes_first(speech):
+    speech.say("Good job")
+    speech.say("Keep going")
+    assert speech.say("High heart rate, slow down", priority=ALERT)
+    assert waiting(speech) == ["High heart rate, slow down"]
+    assert speech.stats["evicted"] == 2
+    speech.say("Nice form")
+    assert speech._heap[0][2] == "High heart rate, slow down"
+
+
+def test_an_alert_interrupts_coaching_being_spoken(speech):
+    speech._speaking = COACHING
+    speech.say("Stop now", priority=ALERT)
+    assert speech._interrupt
+
+    speech._speaking, speech._interrupt = ALERT, False
+    speech.say("Another alert", priority=ALERT)
+    assert not speech._interrupt  # alerts never cut each other off
@@ -0,0 +1,147 @@
+import os
+import shutil
+import sqlite3
+from datetime import date, datetime, timedelta
+
+from coach.storage import DB_PATH, EPOCH, MIGRATIONS, Storage, WINDOW_DAYS, day_key
+
+# The table the pages created before the schema was versioned
+BASELINE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_progress (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT,
+    exercise TEXT,
+    reps INTEGER,
+    date TEXT
+)
+"""
+
+RECENT = datetime.now().replace(microsecond=0) - timedelta(days=2)
+BASELINE_ROWS = [
+    ("ann", "Squat", 10, "2020-01-05 08:00:00"),
+    ("ann", "Squat", 5, "2020-01-05 18:30:00"),
+    ("ann", "Push-up", 7, RECENT.strftime("%Y-%m-%d %H:%M:%S")),
+    ("bob", "Squat", 12, "2020-01-06 09:15:00"),
+    (None, "Bicep Curl", None, "2020-01-07 10:00:00"),
+]
+
+
+def baseline_db(path):
+    conn = sqlite3.connect(path)
+    conn.execute(BASELINE_SCHEMA)
+    conn.executemany("INSERT INTO user_progress (username, exercise, reps, date) VALUES (?, ?, ?, ?)",
+                     BASELINE_ROWS)
+    conn.commit()
+    conn.close()
+    return path
+
+
+def rows(storage, sql):
+    with storage.reader() as conn:
+        return conn.execute(sql).fetchall()
+
+
+def columns(storage, table):
+    return [row[1] for row in rows(storage, f"PRAGMA table_info({table})")]
+
+
+def days(text):
+    return (date.fromisoformat(text[:10]) - EPOCH).days
+
+
+def log_reps(storage, session, name, reps):
+    now = datetime.now().timestamp()
+    storage.write([
+        ("add_user", [(name,)]),
+        ("add_exercise", [("Squat",)]),
+        ("upsert_progress", [(session, name, "Squat", reps, int(now), day_key(now))]),
+    ])
+
+
+def test_baseline_database_migrates_to_the_latest_schema(tmp_path):
+    storage = Storage(baseline_db(str(tmp_path / "user_logs.db")), readers=1)
+
+    assert rows(storage, "PRAGMA user_version") == [(len(MIGRATIONS),)] == [(4,)]
+    assert columns(storage, "user_progress") == ["id", "session_id", "user_id", "exercise_id", "reps", "ts", "day"]
+    assert columns(storage, "window_counters") == ["day", "user_id", "reps"]
+    triggers = {name for name, in rows(storage, "SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+    assert {"user_progress_rollup_insert", "user_day_rollup_window_insert"} <= triggers
+
+    migrated = rows(storage, """
+        SELECT p.id, u.name, e.name, p.reps, p.day, p.session_id
+        FROM user_progress p JOIN users u ON u.id = p.user_id JOIN exercises e ON e.id = p.exercise_id
+        ORDER BY p.id
+    """)
+    assert migrated == [(i, name or "", exercise, reps or 0, days(stamp), None)
+                        for i, (name, exercise, reps, stamp) in enumerate(BASELINE_ROWS, start=1)]
+
+    totals = storage.query("rank_totals").set_index("name")["total_reps"].to_dict()
+    assert totals == {"ann": 22, "bob": 12, "": 0}
+    assert storage.query("user_totals", ("ann",)).iloc[0][["total_days", "total_sessions"]].tolist() == [2, 3]
+    # Only days a leaderboard window can still reach are copied into the counters
+    ann = rows(storage, "SELECT id FROM users WHERE name = 'ann'")[0][0]
+    assert rows(storage, "SELECT day, user_id, reps FROM window_counters") == [(days(str(RECENT)), ann, 7)]
+
+
+def test_migrated_database_keeps_rollups_and_counters_current(tmp_path):
+    path = baseline_db(str(tmp_path / "user_logs.db"))
+    storage = Storage(path, readers=1)
+    log_reps(storage, "session-1", "cat", 3)
+    log_reps(storage, "session-1", "cat", 9)
+
+    assert storage.query("user_totals", ("cat",))[["total_reps", "total_sessions"]].values.tolist() == [[9, 1]]
+    assert rows(storage, "SELECT reps FROM window_counters c JOIN users u ON u.id = c.user_id "
+                         "WHERE u.name = 'cat'") == [(9,)]
+    day_rows = rows(storage, "SELECT user_id, day, reps FROM user_day_rollup ORDER BY user_id, day")
+    assert day_rows == rows(storage, "SELECT user_id, day, SUM(reps) FROM user_progress "
+                                     "GROUP BY user_id, day ORDER BY user_id, day")
+    exercise_rows = rows(storage, "SELECT user_id, exercise_id, total_reps, sessions FROM user_exercise_rollup "
+                                  "ORDER BY user_id, exercise_id")
+    assert exercise_rows == rows(storage, "SELECT user_id, exercise_id, SUM(reps), COUNT(*) FROM user_progress "
+                                          "GROUP BY user_id, exercise_id ORDER BY user_id, exercise_id")
+
+    # Opening it again runs no migration twice
+    assert rows(Storage(path, readers=1), "SELECT COUNT(*) FROM user_progress") == [(len(BASELINE_ROWS) + 1,)]
+
+
+def test_a_write_invalidates_cached_results(tmp_path):
+    storage = Storage(baseline_db(str(tmp_path / "user_logs.db")), readers=1)
+    first = storage.query("user_totals", ("ann",))
+    assert storage.query("user_totals", ("ann",)).equals(first)
+    assert (storage.cache_stats["hits"], storage.cache_stats["misses"]) == (1, 1)
+
+    version = storage.version
+    log_reps(storage, "session-1", "ann", 4)
+    assert storage.version == version + 1
+    assert storage.query("user_totals", ("ann",))["total_reps"].tolist() == [first["total_reps"].iloc[0] + 4]
+    assert (storage.cache_stats["hits"], storage.cache_stats["misses"]) == (1, 2)
+
+
+def test_cached_results_are_copies(tmp_path):
+    storage = Storage(baseline_db(str(tmp_path / "user_logs.db")), readers=1)
+    result = storage.query("user_totals", ("ann",))
+    result["extra"] = 1  # the Progress page adds columns like this
+    assert "extra" not in storage.query("user_totals", ("ann",)).columns
+
+
+def test_least_recently_used_results_are_evicted(tmp_path):
+    storage = Storage(baseline_db(str(tmp_path / "user_logs.db")), readers=1, cache_size=2)
+    for name in ("ann", "bob", "ann", ""):  # "" pushes out bob, the least recently used
+        storage.query("user_totals", (name,))
+    storage.query("user_totals", ("ann",))
+    storage.query("user_totals", ("bob",))
+    assert storage.cache_stats == {"hits": 2, "misses": 4, "evicted": 2}
+
+
+def test_shipped_database_migrates(tmp_path):
+    path = str(tmp_path / "user_logs.db")
+    shutil.copy(os.path.join(os.path.dirname(__file__), os.pardir, DB_PATH), path)
+    with sqlite3.connect(path) as conn:
+        before = conn.execute("SELECT COUNT(*), COALESCE(SUM(reps), 0) FROM user_progress").fetchone()
+
+    storage = Storage(path, readers=1)
+    assert rows(storage, "PRAGMA user_version") == [(len(MIGRATIONS),)]
+    assert rows(storage, "SELECT COUNT(*), COALESCE(SUM(reps), 0) FROM user_progress") == [before]
+    assert storage.query("community_totals")["total_reps"].iloc[0] == before[1]
+    oldest = day_key(datetime.now().timestamp()) - WINDOW_DAYS
+    assert rows(storage, f"SELECT COUNT(*) FROM window_counters WHERE day <= {oldest}") == [(0,)]
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from coach.timeseries import bucket_for, lttb
+
+
+@pytest.mark.parametrize("n, threshold", [(0, 10), (1, 10), (5, 5), (5, 6), (50, 2), (50, 0)])
+def test_lttb_keeps_everything_when_it_cannot_thin(n, threshold):
+    x = np.arange(n)
+    assert lttb(x, x * 2.0, threshold).tolist() == list(range(n))
+
+
+@pytest.mark.parametrize("n, threshold", [(4, 3), (10, 9), (1000, 120), (121, 120)])
+def test_lttb_returns_threshold_increasing_indices_with_both_ends(n, threshold):
+    x = np.arange(n)
+    y = np.sin(x / 7.0)
+    keep = lttb(x, y, threshold)
+    assert len(keep) == threshold
+    assert keep[0] == 0 and keep[-1] == n - 1
+    assert (np.diff(keep) > 0).all()
+
+
+def test_lttb_keeps_spikes_and_dips():
+    y = np.zeros(1000)
+    y[400], y[700] = 50.0, -50.0
+    keep = lttb(np.arange(1000), y, 20)
+    assert 400 in keep and 700 in keep
+
+
+def test_lttb_flat_series():
+    keep = lttb(np.arange(300), np.full(300, 3.0), 30)
+    assert len(keep) == 30 and len(set(keep.tolist())) == 30
+
+
+def test_lttb_accepts_lists_and_uneven_x():
+    x = [0, 1, 2, 10, 11, 12, 30, 31]
+    y = [0, 5, 0, 0, 9, 0, 0, 1]
+    assert lttb(x, y, 4).tolist() == [0, 1, 4, 7]
+
+
+@pytest.mark.parametrize("span, bucket", [(1, "day"), (365, "day"), (366, "week"),
+                                          (5 * 365, "week"), (5 * 365 + 1, "month")])
+def test_bucket_for_boundaries(span, bucket):
+    assert bucket_for(span) == bucket
@@ -0,0 +1,84 @@
+import os
+
+import numpy as np
+
+from coach.voice_clips import ClipCache, read_wav, write_wav
+
+RATE = 16000
+
+
+class FakeEngine:
+    """Renders each phrase as a tone whose length follows the text"""
+
+    def __init__(self):
+        self.properties = {"rate": 200, "volume": 1.0, "voice": "default"}
+        self.saved = []
+        self._pending = None
+
+    def getProperty(self, name):
+        return self.properties[name]
+
+    def setProperty(self, name, value):
+        self.properties[name] = value
+
+    def save_to_file(self, text, path):
+        self._pending = (text, path)
+
+    def runAndWait(self):
+        text, path = self._pending
+        self.saved.append((text, self.properties["rate"], self.properties["volume"]))
+        silence = np.zeros(100, dtype=np.int16)
+        tone = np.full(10 * len(text), 1000, dtype=np.int16)
+        write_wav(path, type("Clip", (), {"samples": np.concatenate([silence, tone, silence]), "rate": RATE}))
+
+
+def test_clips_are_keyed_by_text_and_full_voice(tmp_path):
+    engine = FakeEngine()
+    cache = ClipCache(engine, clip_dir=str(tmp_path))
+    cache.get("Stand tall")
+    cache.get("Stand tall", {"rate": 200})  # the engine's default rate: the same clip
+    cache.get("Stand tall", {"rate": 150})
+    cache.get("Stand tall", {"rate": 150, "volume": 0.8})
+    assert engine.saved == [("Stand tall", 200, 1.0), ("Stand tall", 150, 1.0), ("Stand tall", 150, 0.8)]
+    engine.properties["voice"] = "other"
+    cache.get("Stand tall", {"rate": 150, "volume": 0.8})
+    assert len(engine.saved) == 4
+
+
+def test_fixed_phrases_stay_and_others_are_evicted_least_recent_first(tmp_path):
+    engine = FakeEngine()
+    cache = ClipCache(engine, clip_dir=None, lru_size=2)
+    cache.add("Push up")
+    for text in ("a", "b", "a", "c"):  # c evicts b, the least recently used
+        cache.get(text)
+    assert [text for text, *_ in engine.saved] == ["Push up", "a", "b", "c"]
+    cache.get("a")
+    cache.get("b")
+    for _ in range(3):
+        cache.get("Push up")
+    assert [text for text, *_ in engine.saved][4:] == ["b"]
+    assert cache.stats["fixed_hits"] == 3 and cache.stats["lru_hits"] == 2
+
+
+def test_rendered_clips_are_reloaded_from_disk(tmp_path):
+    first = ClipCache(FakeEngine(), clip_dir=str(tmp_path))
+    first.add("Good job", {"rate": 160})
+    assert len(os.listdir(tmp_path)) == 1
+
+    engine = FakeEngine()
+    second = ClipCache(engine, clip_dir=str(tmp_path))
+    clip = second.get("Good job", {"rate": 160})
+    assert engine.saved == [] and second.stats["disk_loads"] == 1
+    np.testing.assert_array_equal(clip.samples, read_wav(os.path.join(tmp_path, os.listdir(tmp_path)[0])).samples)
+
+
+def test_templated_lines_are_stitched_from_rendered_pieces():
+    engine = FakeEngine()
+    cache = ClipCache(engine, clip_dir=None)
+    cache.add("Perfect! {reps} pelvic tilts completed")
+    rendered = len(engine.saved)
+    clip = cache.get("Perfect! 12 pelvic tilts completed")
+    assert len(engine.saved) == rendered and cache.stats["composed"] == 1
+    gap = int(RATE * 0.05)
+    # Pieces are trimmed of their silence and joined with short gaps
+    assert len(clip.samples) == 10 * len("Perfect!") + 10 * len("12") + 10 * len("pelvic tilts completed") + 2 * gap